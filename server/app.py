@@ -1,198 +1,139 @@
+#!/usr/bin/env python3
+"""Application factory.
 
-from flask_login import LoginManager, login_required, current_user, logout_user
+Importing this module is cheap: models, extensions and resources are only
+imported by ``create_app``. ``app`` is still available as a module
+attribute, created on first access, so ``gunicorn app:app``,
+``flask --app app`` and ``from app import app`` keep working.
 
-from flask.views import MethodView
-#!/usr/bin/env python3
-from flask import Flask, request, make_response, jsonify, send_from_directory, redirect, url_for
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flask_restful import Api, Resource
-import os
-# from werkzeug.utils import secure_filename
-from models import db, User
+Flask-Migrate (and with it Alembic) is only loaded when running under the
+``flask`` command, where ``flask db`` needs it.
 
-BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-DATABASE = os.environ.get("DB_URI", f"sqlite:///{os.path.join(BASE_DIR, 'app.db')}")
+For preload-and-fork serving, see gunicorn.conf.py: the app is created
+once in the master and workers inherit it copy-on-write. Connection pools
+and background threads are recreated in each child after the fork.
+"""
+import os
+import weakref
+from collections.abc import Mapping
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = '2#fJ7$kd_9W!sL@0'
-app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.json.compact = False
+from flask import Flask
+from flask_login import LoginManager
 
-db.init_app(app)
-migrate = Migrate(app, db)
-api = Api(app)
+from config import database_config, engine_options
 
+SECRET_KEY = os.environ.get("SECRET_KEY", '2#fJ7$kd_9W!sL@0')
 
-login_manager = LoginManager(app)
+login_manager = LoginManager()
 login_manager.login_view = 'login'
 
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-
-
-
-# Role-Based Access Control (RBAC)
-def role_required(role):
-    def decorator(func):
-        @login_required
-        def wrapper(*args, **kwargs):
-            if current_user.role != role:
-                return jsonify({"error": "You do not have access to this resource"}), 403
-            return func(*args, **kwargs)
-        return wrapper
-    return decorator
-
-
-
-
-class Home(MethodView):
-    def get(self):
-        return "<h1>user application</h1>"
-    
-    def post(self):
-        return "<h1>Welcome to user applicaton!</h1>"
-# User Resources
-class Users(Resource):
-    @login_required
-    def get(self):
-        users = [user.to_dict() for user in User.query.all()]
-        return make_response(jsonify(users), 200)
-
-    def post(self):
-        data = request.form
-
-        new_user = User(
-            name=data['name'],
-            email=data['email'],
-            password=data['password'],
-            role=data.get('role', 'user'),
-            contacts=data.get("contacts", ''),
-        )
-        db.session.add(new_user)
-        db.session.commit()
-        return make_response(new_user.to_dict(), 201)
-
-class UserByID(Resource):
-    @role_required('admin')
-    def get(self, id):
-        user = User.query.get(id)
-        if user is None:
-            return {"error": "User not found"}, 404
-        return make_response(user.to_dict(), 200)
-
-    def delete(self, id):
-        user = User.query.get(id)
-        if user is None:
-            return {"error": "User not found"}, 404
-        db.session.delete(user)
-        db.session.commit()
-        return {}, 204
-
-class Login(Resource):
-    def post(self):
-        data = request.get_json()
-        user = User.query.filter_by(email=data['email']).first()
-        if user and user.check_password(data['password']):
-            return make_response(user.to_dict(), 200)
-        return {"error": "Invalid credentials"}, 401
-
-class UserRegister(Resource):
-    def post(self):
-        data = request.form
-        if User.query.filter_by(email=data['email']).first():
-            return {"error": "Email already exists"}, 400
-        new_user = User(
-            name=data['name'],
-            email=data['email'],
-            password=data['password'],
-            role=data.get('role', ''),
-            contacts=data.get("contacts", ''),
-        )
-        db.session.add(new_user)
-        db.session.commit()
-        return make_response(new_user.to_dict(), 201)
-    
-
-class UserPasswordReset(Resource):
-    @login_required
-    def post(self):
-        data = request.get_json()
-        user = User.query.filter_by(email=data['email']).first()
-        if user:
-            user.password = data['new_password']
-            db.session.commit()
-            return {"message": "Password reset successful"}, 200
-        return {"error": "User not found"}, 404
-
-class UserProfile(Resource):
-    @login_required
-    def get(self):
-        user = current_user
-        return make_response(user.to_dict(), 200)
-    
-    @role_required('admin')
-    def get(self, id):
-        user = User.query.get(id)
-        if user is None:
-            return {"error": "User not found"}, 404
-        return make_response(user.to_dict(), 200)
-
-class UserProfileUpdate(Resource):
-    @login_required
-    def put(self):
-        user = current_user
-        if user is None:
-            return {"error": "User not found"}, 404
-        data = request.form
-        
-        user.name = data.get('name', user.name)
-        user.email = data.get('email', user.email)
-        user.password = data.get('password', user.password)
-        user.role = data.get('role', user.role)
-        user.contacts = data.get('contacts', user.contacts)
-        db.session.commit()
-        return make_response(user.to_dict(), 200)
-    
-    @role_required('admin')
-    def patch(self, id):
-        user = User.query.get(id)
-        if user is None:
-            return {"error": "User not found"}, 404
-        data = request.form
-    
-        user.name = data.get('name', user.name)
-        user.email = data.get('email', user.email)
-        user.password = data.get('password', user.password)
-        user.role = data.get('role', user.role)
-        user.contacts = data.get('contacts',user.contacts)
-        db.session.commit()
-        return make_response(user.to_dict(), 200)
-
-
-
-
-
-
-
-# API Resource Routing
-api.add_resource(Users, "/users")
-api.add_resource(Login, "/login")
-api.add_resource(UserRegister, "/register")
-api.add_resource(UserPasswordReset, "/password/reset")
-api.add_resource(UserProfile, "/users/<int:id>")
-api.add_resource(UserProfileUpdate, "/users/<int:id>/update")
-# api.add_resource(Logout, "/logout")
-
-
-
-# api.add_resource(UserStatsResource, "/user_stats")
-# api.add_resource(Contacts, "/contacts")
-
-app.add_url_rule('/', view_func=Home.as_view('home'))
+    from cache import user_cache
+    return user_cache.get(int(user_id))
+
+
+@login_manager.request_loader
+def load_user_from_request(request):
+    from tokens import token_auth
+    return token_auth.load_user(request)
+
+
+def create_app(config=None):
+    """Build the app. ``config`` is a mapping or an object for ``config.from_object``."""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = SECRET_KEY
+    app.config.update(database_config())
+    # Derived below from the final URI, unless ``config`` sets them
+    del app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    if isinstance(config, Mapping):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.json.compact = True
+
+    from models import db
+    from config import init_engines
+    from instrumentation import instrumentation
+    from replicas import replicas
+    from stats import stats_buffer
+    from timeentries import time_entry_writer
+    from responsecache import response_cache
+    from ratelimit import rate_limiter
+    from directory import user_directory
+    from permissions import permissions
+    from tokens import token_auth
+    from resources import register_resources
+
+    db.init_app(app)
+    init_engines(app, db)
+    instrumentation.init_app(app)
+    replicas.init_app(app)
+    stats_buffer.init_app(app)
+    time_entry_writer.init_app(app)
+    response_cache.init_app(app)
+    rate_limiter.init_app(app)
+    user_directory.init_app(app)
+    permissions.init_app(app)
+    token_auth.init_app(app)
+    if os.environ.get("FLASK_RUN_FROM_CLI") == "true":
+        init_cli(app)
+    register_resources(app)
+    login_manager.init_app(app)
+    _apps.add(app)
+    return app
+
+
+# Every app created in this process, for the fork hook below
+_apps = weakref.WeakSet()
+
+
+def _dispose_engines():
+    # Pooled connections must not be shared with the parent process
+    from models import db
+    for app in list(_apps):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_engines)
+
+
+def init_cli(app):
+    from flask_migrate import Migrate
+    from models import db
+    from rollup import rollup_cli
+    from search import search_cli
+    from jobs import jobs_cli
+    from tokens import tokens_cli
+    from replicas import replicas_cli
+
+    app.cli.add_command(rollup_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(tokens_cli)
+    app.cli.add_command(replicas_cli)
+    Migrate(app, db)
+
+
+_app = None
+
+
+def __getattr__(name):
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
+    app = create_app()
+    # Pretty-print responses only for the local debug server
+    app.json.compact = False
     app.run(port=5555, debug=True)
@@ -0,0 +1,275 @@
+"""ASGI entry point serving the read-heavy user resources on an AsyncSession.
+
+The synchronous Flask app in app.py stays the default. This module serves
+the same Login, Users and UserProfile resources without holding a thread per
+in-flight request:
+
+    uvicorn asgi:app --port 8000
+
+It needs the async extras: aiosqlite for SQLite, or asyncpg / aiomysql for
+server databases. ASYNC_DB_URI overrides the driver derived from DB_URI.
+Authentication and the login rate limits are shared with the Flask app.
+POST /login returns the same bearer token pair (see tokens.py), and tokens
+from either app work on both. A Flask session cookie carrying a user id is
+accepted as well.
+"""
+import asyncio
+import json
+import os
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlencode
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import app as flask_app
+from resources import USERS_PAGE_LIMIT, USERS_PAGE_MAX_LIMIT
+from config import configure_sqlite, engine_options
+from models import Employee, User
+from passwords import HashingBusy, hasher, needs_rehash
+from permissions import Permission, grant_allows, permissions
+from ratelimit import TOO_MANY_REQUESTS, email_key, ip_key, rate_limiter
+from tokens import InvalidToken, token_auth
+from serializers import user_schema
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+
+def async_database_uri(uri):
+    override = os.environ.get("ASYNC_DB_URI")
+    if override:
+        return override
+    url = make_url(uri)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"No async driver known for {url.get_backend_name()}; set ASYNC_DB_URI")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = {key: values[-1] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+        self.headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        self.body = body
+
+    def json(self):
+        try:
+            return json.loads(self.body or b'null')
+        except ValueError:
+            raise HTTPError(400, "Request body must be JSON")
+
+    def cookie(self, name):
+        for part in self.headers.get('cookie', '').split(';'):
+            key, _, value = part.strip().partition('=')
+            if key == name:
+                return value
+        return None
+
+    def url(self, path, **params):
+        host = self.headers.get('host', 'localhost')
+        scheme = self.scope.get('scheme', 'http')
+        return f"{scheme}://{host}{path}?{urlencode(params)}"
+
+
+class AsyncUserApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.engine = None
+        self.sessions = None
+        self.routes = [
+            ('POST', ('login',), self.login),
+            ('GET', ('users',), self.users),
+            ('GET', ('users', int), self.user_profile),
+        ]
+
+    async def startup(self):
+        sync_uri = self.flask_app.config['SQLALCHEMY_DATABASE_URI']
+        uri = async_database_uri(sync_uri)
+        options = dict(engine_options(sync_uri))
+        # The sqlite3 timeout/thread arguments don't apply to aiosqlite
+        options.pop('connect_args', None)
+        self.engine = create_async_engine(uri, **options)
+        configure_sqlite(self.engine.sync_engine)
+        self.sessions = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def shutdown(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        request = Request(scope, body)
+        try:
+            handler, params = self._match(request)
+            async with self.sessions() as session:
+                status, payload, headers = await handler(request, session, *params)
+        except HTTPError as e:
+            status, payload, headers = e.status, {"error": e.message}, {}
+        await self._respond(send, status, payload, headers)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _match(self, request):
+        parts = [part for part in request.path.split('/') if part]
+        allowed = False
+        for method, pattern, handler in self.routes:
+            if len(pattern) != len(parts):
+                continue
+            params = []
+            for expected, part in zip(pattern, parts):
+                if expected is int:
+                    if not part.isdigit():
+                        break
+                    params.append(int(part))
+                elif expected != part:
+                    break
+            else:
+                if method == request.method:
+                    return handler, params
+                allowed = True
+        if allowed:
+            raise HTTPError(405, "Method not allowed")
+        raise HTTPError(404, "Not found")
+
+    async def _respond(self, send, status, payload, headers):
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        raw_headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        raw_headers += [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in headers.items()]
+        await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def current_user(self, request, session):
+        """Load the user of the bearer token or the Flask session cookie, as Flask-Login would."""
+        scheme, _, token = request.headers.get('authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and token_auth.for_app(self.flask_app).enabled:
+            try:
+                # The denylist reads through the Flask app's engine on a filter hit
+                with self.flask_app.app_context():
+                    user_id = token_auth.verify(token.strip())['sub']
+            except InvalidToken as e:
+                raise HTTPError(401, str(e))
+        else:
+            user_id = self._session_user_id(request)
+        row = (await session.execute(user_schema.select().where(User.id == user_id))).first()
+        if row is None:
+            raise HTTPError(401, HTTPStatus.UNAUTHORIZED.phrase)
+        return row
+
+    def _session_user_id(self, request):
+        cookie = request.cookie(self.flask_app.config.get('SESSION_COOKIE_NAME', 'session'))
+        if not cookie:
+            raise HTTPError(401, HTTPStatus.UNAUTHORIZED.phrase)
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        try:
+            data = serializer.loads(cookie, max_age=int(self.flask_app.permanent_session_lifetime.total_seconds()))
+            return int(data['_user_id'])
+        except Exception:
+            raise HTTPError(401, HTTPStatus.UNAUTHORIZED.phrase)
+
+    async def login(self, request, session):
+        data = request.json() or {}
+        # The same rules and keys as the Flask /login, counted in the same backend
+        client = request.scope.get('client')
+        retry_after = rate_limiter.check((
+            ('login_ip', ip_key(request.headers.get('x-forwarded-for'), client[0] if client else None)),
+            ('login_email', email_key(data.get('email') if isinstance(data, dict) else None)),
+        ))
+        if retry_after:
+            return 429, {"error": TOO_MANY_REQUESTS}, {"Retry-After": str(retry_after)}
+        if not data.get('email') or not data.get('password'):
+            raise HTTPError(400, "email and password are required")
+        user = (await session.execute(
+            select(User).where(User.email == data['email'].lower())
+        )).scalars().first()
+        if user is None:
+            return 401, {"error": "Invalid credentials"}, {}
+        # Verification blocks on the hashing pool; keep it off the event loop
+        loop = asyncio.get_running_loop()
+        try:
+            valid = await loop.run_in_executor(None, hasher.verify, data['password'], user.password)
+            if valid and needs_rehash(user.password):
+                new_hash = await loop.run_in_executor(None, hasher.hash, data['password'])
+                user.set_password_hash(new_hash)
+                await session.commit()
+        except HashingBusy:
+            return 503, {"error": "Too many login attempts in progress, try again shortly"}, {"Retry-After": "1"}
+        if not valid:
+            return 401, {"error": "Invalid credentials"}, {}
+        payload = user_schema.dump(user)
+        tokens = token_auth.for_app(self.flask_app)
+        if tokens.enabled:
+            payload.update(tokens.pair(user.id))
+        return 200, payload, {}
+
+    async def users(self, request, session):
+        await self.current_user(request, session)
+        try:
+            limit = min(int(request.args.get('limit', USERS_PAGE_LIMIT)), USERS_PAGE_MAX_LIMIT)
+            after = int(request.args.get('after', 0))
+        except ValueError:
+            raise HTTPError(400, "limit and after must be integers")
+        if limit < 1:
+            raise HTTPError(400, "limit must be positive")
+
+        rows = (await session.execute(
+            user_schema.select().filter(User.id > after).order_by(User.id).limit(limit + 1)
+        )).all()
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            cursor = rows[-1].id
+            headers['Link'] = f'<{request.url("/users", limit=limit, after=cursor)}>; rel="next"'
+            headers['X-Next-Cursor'] = str(cursor)
+        return 200, [user_schema.dump_row(row) for row in rows], headers
+
+    async def user_profile(self, request, session, id):
+        current = await self.current_user(request, session)
+        # The same check as the Flask view's permission_required
+        department = (await session.execute(
+            select(Employee.department).where(Employee.id == current.id)
+        )).scalar()
+        grant = (current.id, permissions.for_app(self.flask_app).mask_for_role(current.role), department)
+        with self.flask_app.app_context():
+            allowed = grant_allows(grant, id, Permission.USER_READ, self_permission=Permission.SELF_READ,
+                                   department_permission=Permission.DEPARTMENT_READ)
+        if not allowed:
+            raise HTTPError(403, "You do not have access to this resource")
+        row = (await session.execute(user_schema.select().where(User.id == id))).first()
+        if row is None:
+            return 404, {"error": "User not found"}, {}
+        return 200, user_schema.dump_row(row), {}
+
+
+app = AsyncUserApp(flask_app)
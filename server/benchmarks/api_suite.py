@@ -0,0 +1,278 @@
+"""Benchmark every user API endpoint in-process and under concurrent HTTP load.
+
+Run from the server directory:
+
+    python -m benchmarks.api_suite [--scale 10k|100k|1m] [--requests 200] \\
+        [--concurrency 1 50] [--seconds 10] [--output results.json]
+
+Seeds a throwaway SQLite database with seed.py (or uses DB_URI as is
+with --no-seed), then:
+
+1. Drives each endpoint ``--requests`` times through the Flask test client
+   with varying ids and cursors, so most requests miss the response cache.
+   It records latency percentiles, throughput, SQL statements per request
+   and peak RSS. Writes go through the real model event listeners.
+2. Starts the app as an HTTP server (gunicorn if installed, otherwise the
+   threaded Werkzeug server) with instrumentation on, and runs
+   benchmarks.http_load against each endpoint at each concurrency. Every
+   client repeats one URL, so GETs mostly measure the response cache hit
+   path. SQL statements per request come from the server's /metrics, and
+   peak RSS is the server process's.
+
+Results are printed and written as one JSON document, so two runs can be
+diffed. Rate limiting is turned off for the run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+_TMP_DIR = tempfile.mkdtemp(prefix='api_suite-')
+os.environ.setdefault("DB_URI", f"sqlite:///{os.path.join(_TMP_DIR, 'bench.db')}")
+
+from sqlalchemy import event  # noqa: E402
+
+from app import app  # noqa: E402
+from benchmarks.asgi_vs_wsgi import start_wsgi, wait_for_port  # noqa: E402
+from benchmarks.http_load import percentile, run_load  # noqa: E402
+from models import db  # noqa: E402
+from seed import SCALES, seed  # noqa: E402
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'password123'
+HTTP_PORT = 5603
+
+
+def reset_peak_rss(pid='self'):
+    # Writing 5 to clear_refs resets VmHWM (Linux 4.0+)
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_kb(pid='self'):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if pid == 'self':
+        # Peak for the whole process lifetime; KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == 'darwin' else peak
+    return None
+
+
+def endpoints(users, rng):
+    """(name, method, request factory) for every endpoint under test.
+
+    Each factory returns (path, keyword arguments for the test client).
+    """
+    def any_id():
+        return rng.randint(1, users)
+
+    counter = iter(range(1, 10 ** 9))
+    return [
+        ('GET /users', 'GET', lambda: (f'/users?limit=100&after={any_id()}', {})),
+        ('GET /users?expand=with_recent_activity', 'GET',
+         lambda: (f'/users?limit=50&after={any_id()}&expand=with_recent_activity', {})),
+        ('GET /users/<id>', 'GET', lambda: (f'/users/{any_id()}', {})),
+        ('GET /users/search', 'GET',
+         lambda: (f"/users/search?name={rng.choice(('al', 'bo', 'car', 'gr', 'ol'))}"
+                  f"&department={rng.choice(('sales', 'support'))}&limit=50", {})),
+        ('GET /users/<id>/time-entries', 'GET', lambda: (f'/users/{any_id()}/time-entries', {})),
+        ('GET /user_stats', 'GET', lambda: ('/user_stats', {})),
+        ('GET /reports/attendance/daily', 'GET', lambda: (
+            f"/reports/attendance/daily?from={time.strftime('%Y-%m-01')}&to={time.strftime('%Y-%m-%d')}", {})),
+        ('POST /login', 'POST', lambda: ('/login', {'json': {'email': f'user{any_id()}@example.com',
+                                                               'password': PASSWORD}})),
+        ('POST /register', 'POST', lambda: ('/register', {'data': {
+            'firstname': 'Bench', 'lastname': 'User', 'email': f'bench{next(counter)}-{rng.random()}@example.com',
+            'password': PASSWORD, 'role': 'employee'}})),
+        ('PATCH /users/<id>/update', 'PATCH', lambda: (f'/users/{any_id()}/update', {'data': {
+            'contacts': f'07{rng.randint(0, 10 ** 8):08d}'}})),
+        ('POST /time-entries', 'POST', lambda: ('/time-entries', {'json': {
+            'user_id': any_id(), 'arrivaltime': rng.randint(420, 600)}})),
+    ]
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'requests_per_sec': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+def session_cookie(user_id=1):
+    serializer = app.session_interface.get_signing_serializer(app)
+    return serializer.dumps({'_user_id': str(user_id), '_fresh': True})
+
+
+def run_test_client(users, requests, rng):
+    client = app.test_client()
+    client.set_cookie('session', session_cookie())
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    results = {}
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            for name, method, make_request in endpoints(users, rng):
+                latencies = []
+                statuses = {}
+                statements[0] = 0
+                reset_peak_rss()
+                began = time.perf_counter()
+                for _ in range(requests):
+                    path, kwargs = make_request()
+                    start = time.perf_counter()
+                    response = client.open(path, method=method, **kwargs)
+                    latencies.append(time.perf_counter() - start)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                elapsed = time.perf_counter() - began
+                results[name] = {
+                    **summarize(latencies, elapsed),
+                    'statuses': statuses,
+                    'sql_per_request': round(statements[0] / requests, 2),
+                    'peak_rss_kb': peak_rss_kb(),
+                }
+                print(f"[test client] {name:<40} {json.dumps(results[name])}")
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+    return results
+
+
+def _sql_totals(port):
+    """Per endpoint (statement sum, request count) from the server's /metrics."""
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+        output = response.read().decode()
+    totals = {}
+    pattern = re.compile(r'^http_request_sql_statements_(sum|count)\{endpoint="([^"]+)",method="([^"]+)"\} (\S+)$')
+    for line in output.splitlines():
+        match = pattern.match(line)
+        if match:
+            kind, endpoint, method, value = match.groups()
+            totals.setdefault((endpoint, method), [0.0, 0.0])[0 if kind == 'sum' else 1] = float(value)
+    return totals
+
+
+def run_http(users, concurrencies, seconds, threads):
+    env = dict(os.environ, INSTRUMENTATION_ENABLED='1', METRICS_PUBLIC='1', RATE_LIMIT_ENABLED='0')
+    headers = {'Cookie': f'session={session_cookie()}'}
+    user_id = max(1, users // 2)
+    targets = [
+        ('GET /users', 'users', 'GET', f'/users?limit=100&after={user_id}', b''),
+        ('GET /users/<id>', 'userprofile', 'GET', f'/users/{user_id}', b''),
+        ('GET /users/search', 'usersearch', 'GET', '/users/search?name=al&limit=50', b''),
+        ('GET /users/<id>/time-entries', 'usertimeentries', 'GET', f'/users/{user_id}/time-entries', b''),
+        ('GET /user_stats', 'userstatsresource', 'GET', '/user_stats', b''),
+        ('POST /login', 'login', 'POST', '/login',
+         json.dumps({'email': f'user{user_id}@example.com', 'password': PASSWORD}).encode()),
+    ]
+    results = {}
+    process = start_wsgi(env, HTTP_PORT, threads)
+    try:
+        wait_for_port(HTTP_PORT)
+        for name, endpoint, method, path, body in targets:
+            request_headers = dict(headers)
+            if body:
+                request_headers['Content-Type'] = 'application/json'
+            for concurrency in concurrencies:
+                before = _sql_totals(HTTP_PORT).get((endpoint, method), [0.0, 0.0])
+                reset_peak_rss(process.pid)
+                result = asyncio.run(run_load(f'http://127.0.0.1:{HTTP_PORT}{path}', concurrency, seconds,
+                                              request_headers, method, body))
+                after = _sql_totals(HTTP_PORT).get((endpoint, method), [0.0, 0.0])
+                handled = after[1] - before[1]
+                result['sql_per_request'] = round((after[0] - before[0]) / handled, 2) if handled else None
+                result['peak_rss_kb'] = peak_rss_kb(process.pid)
+                results[f'{name} @{concurrency}'] = result
+                print(f"[http] {name:<32} c={concurrency:<5} {json.dumps(result)}")
+    finally:
+        process.terminate()
+        process.wait()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='10k')
+    parser.add_argument('--users', type=int, default=None, help="Overrides --scale")
+    parser.add_argument('--entries-per-user', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=200, help="Test client requests per endpoint")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 50])
+    parser.add_argument('--seconds', type=float, default=10, help="HTTP load duration per endpoint")
+    parser.add_argument('--threads', type=int, default=32, help="Server worker threads")
+    parser.add_argument('--no-seed', action='store_true', help="Use the existing data in DB_URI")
+    parser.add_argument('--skip-http', action='store_true')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help="Also write the JSON results to this file")
+    args = parser.parse_args()
+    users = args.users or SCALES[args.scale]
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        if not args.no_seed:
+            db.drop_all()
+            db.create_all()
+            began = time.perf_counter()
+            seed(users, args.entries_per_user, password=PASSWORD, rng=random.Random(args.seed))
+            seed_seconds = round(time.perf_counter() - began, 2)
+        else:
+            seed_seconds = None
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'database': app.config['SQLALCHEMY_DATABASE_URI'],
+            'users': users,
+            'entries_per_user': args.entries_per_user,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'seconds': args.seconds,
+            'seed_seconds': seed_seconds,
+        },
+        'test_client': run_test_client(users, args.requests, rng),
+    }
+    if not args.skip_http:
+        results['http'] = run_http(users, args.concurrency, args.seconds, args.threads)
+
+    document = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(document + "\n")
+    print(document)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Compare the sync Flask app with the ASGI entry point under concurrent load.
+
+Run from the server directory:
+
+    python -m benchmarks.asgi_vs_wsgi [--concurrency 10 100 1000] [--seconds 10]
+
+Seeds a throwaway SQLite database, starts both servers as subprocesses and
+drives GET /users and GET /users/<id> as an admin. Each server is logged
+into over HTTP and the load carries the bearer token it returns.
+The WSGI side uses gunicorn with threads when it is installed, otherwise the
+threaded Werkzeug server; the ASGI side uses uvicorn.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.http_load import run_load
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_EMAIL = 'user0@example.com'
+ADMIN_PASSWORD = 'benchmark'
+
+
+def seed(env, users):
+    script = f"""
+from app import app
+from models import db, User
+from passwords import hasher
+with app.app_context():
+    db.create_all()
+    admin_password = hasher.hash({ADMIN_PASSWORD!r})
+    db.session.execute(User.__table__.insert(), [
+        {{'firstname': 'f', 'lastname': 'l', 'email': f'user{{i}}@example.com',
+          'password': admin_password if i == 0 else 'x', 'role': 'admin' if i == 0 else 'employee'}}
+        for i in range({users})
+    ])
+    db.session.commit()
+"""
+    subprocess.run([sys.executable, '-c', script], cwd=SERVER_DIR, env=env, check=True)
+
+
+def login(port):
+    """Log in as the admin; the Authorization header for its access token."""
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/login", method='POST', headers={'Content-Type': 'application/json'},
+        data=json.dumps({'email': ADMIN_EMAIL, 'password': ADMIN_PASSWORD}).encode(),
+    )
+    with urllib.request.urlopen(request) as response:
+        return {'Authorization': f"Bearer {json.load(response)['access_token']}"}
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def start_wsgi(env, port, threads):
+    if importlib.util.find_spec('gunicorn'):
+        command = [sys.executable, '-m', 'gunicorn', '-w', '1', '--threads', str(threads),
+                   '-b', f'127.0.0.1:{port}', 'app:app']
+    else:
+        command = [sys.executable, '-c',
+                   f"from app import app; app.run(port={port}, threaded=True, debug=False)"]
+    return subprocess.Popen(command, cwd=SERVER_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def start_asgi(env, port):
+    command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+    return subprocess.Popen(command, cwd=SERVER_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--threads', type=int, default=32, help="WSGI worker threads")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='asgi_vs_wsgi-'), 'bench.db')
+    env = dict(os.environ, DB_URI=f"sqlite:///{path}")
+    seed(env, args.users)
+
+    servers = {'wsgi': (start_wsgi, (env, 5601, args.threads), 5601),
+               'asgi': (start_asgi, (env, 5602), 5602)}
+    for name, (start, start_args, port) in servers.items():
+        process = start(*start_args)
+        try:
+            wait_for_port(port)
+            headers = login(port)
+            for concurrency in args.concurrency:
+                for path in ('/users?limit=50', '/users/42'):
+                    result = asyncio.run(run_load(f"http://127.0.0.1:{port}{path}", concurrency, args.seconds, headers))
+                    result['server'] = name
+                    print(json.dumps(result))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
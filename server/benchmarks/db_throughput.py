@@ -0,0 +1,117 @@
+"""Read/write throughput under N concurrent worker processes, before and after tuning.
+
+Run from the server directory:
+
+    python -m benchmarks.db_throughput [--workers 4] [--seconds 5] [--db-uri URI]
+
+Each worker mimics a gunicorn worker: its own engine, mixing primary key
+reads of user with time_entry inserts (one commit each). The "default" run
+uses a bare create_engine; the "tuned" run uses config.engine_options and
+the SQLite PRAGMAs. Without --db-uri a fresh SQLite file is used per run.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import OperationalError
+
+from config import configure_sqlite, engine_options
+from models import db, User, TimeEntry
+
+SEED_USERS = 1000
+
+
+def make_engine(uri, tuned):
+    if not tuned:
+        return create_engine(uri)
+    engine = create_engine(uri, **engine_options(uri))
+    configure_sqlite(engine)
+    return engine
+
+
+def seed(uri, tuned):
+    engine = make_engine(uri, tuned)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [
+            {'firstname': 'f', 'lastname': 'l', 'email': f'user{i}@example.com', 'password': 'x', 'role': 'employee'}
+            for i in range(SEED_USERS)
+        ])
+    engine.dispose()
+
+
+def worker(uri, tuned, seconds, write_ratio, results):
+    engine = make_engine(uri, tuned)
+    reads = writes = errors = 0
+    user_table = User.__table__
+    entry_table = TimeEntry.__table__
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            if random.random() < write_ratio:
+                with engine.begin() as connection:
+                    connection.execute(entry_table.insert().values(
+                        user_id=random.randint(1, SEED_USERS), arrivaltime=800, timestamp=datetime.utcnow()))
+                writes += 1
+            else:
+                with engine.connect() as connection:
+                    connection.execute(
+                        select(user_table).where(user_table.c.id == random.randint(1, SEED_USERS))
+                    ).first()
+                reads += 1
+        except OperationalError:
+            # Typically "database is locked"
+            errors += 1
+    engine.dispose()
+    results.put((reads, writes, errors))
+
+
+def run(uri, tuned, workers, seconds, write_ratio):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(uri, tuned, seconds, write_ratio, results))
+        for _ in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    totals = [sum(values) for values in zip(*(results.get() for _ in processes))]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    reads, writes, errors = totals
+    return {
+        'profile': 'tuned' if tuned else 'default',
+        'workers': workers,
+        'reads_per_sec': round(reads / elapsed, 1),
+        'writes_per_sec': round(writes / elapsed, 1),
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--db-uri', default=None, help="Existing database to load; skips seeding.")
+    args = parser.parse_args()
+
+    for tuned in (False, True):
+        if args.db_uri:
+            uri = args.db_uri
+        else:
+            path = os.path.join(tempfile.mkdtemp(prefix='db_throughput-'), 'bench.db')
+            uri = f"sqlite:///{path}"
+            seed(uri, tuned)
+        print(json.dumps(run(uri, tuned, args.workers, args.seconds, args.write_ratio)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Memory and latency of the in-memory user directory versus ORM instances.
+
+Run from the server directory:
+
+    python -m benchmarks.directory_memory [--users 100000] [--page 100]
+
+Seeds a throwaway SQLite database with seed.py, then measures with
+tracemalloc what it takes to hold every user's directory columns:
+- ``orm``: User instances with their Employee loaded, as an identity map
+  or a warmed cache would hold them
+- ``rows``: the joined query as a list of Row tuples
+- ``directory``: directory.DirectoryStore
+
+It also times a full reload, an incremental refresh after touching 1% of
+the users, and one listing page served from the store versus the same page
+queried and hydrated through the ORM.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+_TMP_DIR = tempfile.mkdtemp(prefix='directory-')
+os.environ.setdefault("DB_URI", f"sqlite:///{os.path.join(_TMP_DIR, 'bench.db')}")
+
+from sqlalchemy import bindparam, update  # noqa: E402
+from sqlalchemy.orm import joinedload  # noqa: E402
+
+from app import app  # noqa: E402
+from directory import UserDirectory, _query  # noqa: E402
+from models import db, User  # noqa: E402
+from seed import seed  # noqa: E402
+
+
+def measure(load):
+    """(bytes still allocated by the result of ``load()``, seconds)."""
+    gc.collect()
+    tracemalloc.start()
+    began = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - began
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    gc.collect()
+    return size, elapsed
+
+
+def load_orm():
+    users = User.query.options(joinedload(User.employee)).all()
+    db.session.expunge_all()
+    return users
+
+
+def load_rows():
+    with db.engine.connect() as connection:
+        return connection.execute(_query().order_by(User.id)).all()
+
+
+def load_directory():
+    directory = UserDirectory()
+    directory.reload()
+    return directory
+
+
+def timed(func, repeat):
+    began = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return round((time.perf_counter() - began) / repeat * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--page', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    results = {'users': args.users}
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(args.users, entries_per_user=0, log=lambda message: None)
+        # Spread the seeded rows over the past month, as in a long-running
+        # database, so only a handful fall inside the refresh overlap
+        table = User.__table__
+        now = datetime.utcnow()
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(table).where(table.c.id == bindparam('user_id')).values(updated_at=bindparam('at')),
+                [{'user_id': i, 'at': now - timedelta(days=1, seconds=i * 50)} for i in range(1, args.users + 1)],
+            )
+
+        for name, load in (('orm', load_orm), ('rows', load_rows), ('directory', load_directory)):
+            size, elapsed = measure(load)
+            results[name] = {
+                'bytes': size,
+                'bytes_per_user': round(size / args.users, 1),
+                'load_ms': round(elapsed * 1000, 1),
+            }
+            print(f"{name:<10} {json.dumps(results[name])}")
+
+        directory = load_directory()
+        rng = random.Random(42)
+        touched = rng.sample(range(1, args.users + 1), max(1, args.users // 100))
+        with db.engine.begin() as connection:
+            connection.execute(update(User).where(User.id.in_(touched)).values(contacts='0700000000'))
+        began = time.perf_counter()
+        directory.refresh()
+        results['refresh_ms'] = round((time.perf_counter() - began) * 1000, 1)
+        results['refreshed_rows'] = directory.refreshed_rows
+
+        def orm_page():
+            after = rng.randint(0, args.users - args.page)
+            users = (User.query.options(joinedload(User.employee))
+                     .filter(User.id > after).order_by(User.id).limit(args.page).all())
+            db.session.expunge_all()
+            return users
+
+        def directory_page():
+            return directory.store.page(rng.randint(0, args.users - args.page), args.page)
+
+        results['page_ms'] = {
+            'orm': timed(orm_page, args.repeat),
+            'directory': timed(directory_page, args.repeat),
+        }
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
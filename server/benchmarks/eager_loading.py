@@ -0,0 +1,119 @@
+"""Time the ?expand= loading profiles against lazy relationship loading.
+
+Run from the server directory:
+
+    python -m benchmarks.eager_loading [--users 500] [--page-sizes 10,100,500]
+
+Uses a throwaway in-memory SQLite database. For every profile, GET /users
+is requested at each page size and its SQL statements are counted and
+timed. The same pages are then serialized by walking the lazy
+relationships, to show the N+1 baseline. That the count does not grow
+with the page size is checked by tests/test_loading.py.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+
+os.environ.setdefault("DB_URI", "sqlite://")
+
+from sqlalchemy import event  # noqa: E402
+
+from app import app  # noqa: E402
+from loading import PROFILES  # noqa: E402
+from models import db, User, Employee, Leave, Post, TimeEntry  # noqa: E402
+from serializers import user_schema  # noqa: E402
+
+
+def seed(users, per_user):
+    db.create_all()
+    db.session.execute(User.__table__.insert(), [
+        {
+            'id': i, 'firstname': f'First{i}', 'lastname': f'Last{i}', 'email': f'user{i}@example.com',
+            'password': 'x' * 60, 'role': 'employee',
+        }
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(Employee.__table__.insert(), [
+        {'id': i, 'employee_id': i, 'department': 'ops', 'position': 'staff'} for i in range(1, users + 1)
+    ])
+    db.session.execute(Leave.__table__.insert(), [
+        {'employee_id': i, 'start_date': date(2026, 1, 1), 'end_date': date(2026, 1, 2)}
+        for i in range(1, users + 1)
+    ])
+    start = datetime(2026, 1, 1, 9)
+    db.session.execute(Post.__table__.insert(), [
+        {'user_id': i, 'title': f'Post {n}', 'content': 'text', 'date_posted': start + timedelta(days=n)}
+        for i in range(1, users + 1) for n in range(per_user)
+    ])
+    db.session.execute(TimeEntry.__table__.insert(), [
+        {'user_id': i, 'arrivaltime': 900, 'timestamp': start + timedelta(days=n)}
+        for i in range(1, users + 1) for n in range(per_user)
+    ])
+    db.session.commit()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def lazy_page(limit):
+    # What an endpoint did before profiles: one query per user per relationship
+    payload = []
+    for user in User.query.order_by(User.id).limit(limit):
+        item = user_schema.dump(user)
+        item['employee'] = [employee.to_dict(rules=('-user', '-posts', '-leaves.employee'))
+                            for employee in user.employee]
+        item['recent_posts'] = [post.title for post in user.posts]
+        item['recent_time_entries'] = [entry.timestamp.isoformat() for entry in user.time_entries]
+        payload.append(item)
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--per-user', type=int, default=20, help="posts and time entries per user")
+    parser.add_argument('--page-sizes', default='10,100,500')
+    args = parser.parse_args()
+    page_sizes = [int(size) for size in args.page_sizes.split(',')]
+
+    app.config['LOGIN_DISABLED'] = True
+    client = app.test_client()
+    counter = QueryCounter()
+    results = {}
+
+    with app.app_context():
+        seed(args.users, args.per_user)
+        event.listen(db.engine, 'before_cursor_execute', counter)
+
+        for name in PROFILES:
+            for size in page_sizes:
+                db.session.expunge_all()
+                counter.count = 0
+                start = time.perf_counter()
+                response = client.get(f'/users?limit={size}&expand={name}')
+                elapsed = time.perf_counter() - start
+                assert response.status_code == 200, response.get_data(as_text=True)
+                results[f'{name}@{size}'] = {'queries': counter.count, 'ms': round(elapsed * 1000, 2)}
+                print(f"{name:<22} limit={size:<6} {counter.count:>5} queries {elapsed * 1000:>10.2f} ms")
+
+        for size in page_sizes:
+            db.session.expunge_all()
+            counter.count = 0
+            start = time.perf_counter()
+            lazy_page(size)
+            elapsed = time.perf_counter() - start
+            results[f'lazy@{size}'] = {'queries': counter.count, 'ms': round(elapsed * 1000, 2)}
+            print(f"{'lazy relationships':<22} limit={size:<6} {counter.count:>5} queries {elapsed * 1000:>10.2f} ms")
+
+    print(json.dumps({'users': args.users, 'results': results}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Minimal asyncio HTTP/1.1 load generator with keep-alive connections.
+
+    python -m benchmarks.http_load http://127.0.0.1:5555/users?limit=50 \\
+        --concurrency 100 --seconds 10 [--cookie session=...]
+
+Each of ``concurrency`` clients holds one connection and issues requests
+back to back. Reports throughput, error count and latency percentiles.
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+async def _read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed")
+    status = int(status_line.split()[1])
+    length = 0
+    chunked = False
+    close = False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        value = value.strip()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+        elif name == 'connection' and value.lower() == 'close':
+            close = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status, close
+
+
+async def _client(url, headers, deadline, latencies, errors, method='GET', body=b''):
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else '')
+    request_head = f"{method} {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+    for name, value in headers.items():
+        request_head += f"{name}: {value}\r\n"
+    if body:
+        request_head += f"Content-Length: {len(body)}\r\n"
+    request = (request_head + "\r\n").encode('latin-1') + body
+
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            start = time.perf_counter()
+            writer.write(request)
+            status, close = await _read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors[status] = errors.get(status, 0) + 1
+            if close:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            errors['connection'] = errors.get('connection', 0) + 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.01)
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(url, concurrency, seconds, headers=None, method='GET', body=b''):
+    latencies = []
+    errors = {}
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(url, headers or {}, deadline, latencies, errors, method, body) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('url')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--cookie', default=None)
+    args = parser.parse_args()
+    headers = {'Cookie': args.cookie} if args.cookie else {}
+    print(json.dumps(asyncio.run(run_load(args.url, args.concurrency, args.seconds, headers))))
+
+
+if __name__ == '__main__':
+    main()
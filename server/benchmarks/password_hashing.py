@@ -0,0 +1,77 @@
+"""Logins/sec for each password hashing cost setting.
+
+Run from the server directory:
+
+    python -m benchmarks.password_hashing [--seconds 2] [--workers N]
+
+For every cost it reports single-core verifications per second, the same
+figure through the process pool with N workers, and the per-core rate.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from passwords import PBKDF2, SCRYPT, make_hash, check_hash
+
+COSTS = [
+    (PBKDF2, 100000),
+    (PBKDF2, 260000),
+    (PBKDF2, 600000),
+    (SCRYPT, 2 ** 14, 8, 1),
+    (SCRYPT, 2 ** 15, 8, 1),
+]
+
+PASSWORD = "correct horse battery staple"
+
+
+def _verify_batch(stored, count):
+    for _ in range(count):
+        check_hash(PASSWORD, stored)
+    return count
+
+
+def measure_serial(stored, seconds):
+    done = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        check_hash(PASSWORD, stored)
+        done += 1
+    return done / (time.perf_counter() - start)
+
+
+def measure_pool(pool, workers, stored, per_core_rate, seconds):
+    # Size each worker's batch so the run lasts roughly `seconds`
+    batch = max(int(per_core_rate * seconds), 1)
+    start = time.perf_counter()
+    done = sum(pool.map(_verify_batch, [stored] * workers, [batch] * workers))
+    return done / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for params in COSTS:
+            stored = make_hash(PASSWORD, params)
+            serial = measure_serial(stored, args.seconds)
+            pooled = measure_pool(pool, args.workers, stored, serial, args.seconds)
+            results.append({
+                'scheme': params[0],
+                'cost': list(params[1:]),
+                'ms_per_verify': round(1000 / serial, 2),
+                'logins_per_sec_single_core': round(serial, 1),
+                'logins_per_sec_pool': round(pooled, 1),
+                'logins_per_sec_per_core': round(pooled / args.workers, 1),
+                'workers': args.workers,
+            })
+            print(json.dumps(results[-1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Compare the compiled serializers against to_dict/SerializerMixin.
+
+Run from the server directory:
+
+    python -m benchmarks.serialization [--rows 20000] [--repeat 5]
+
+Uses a throwaway in-memory SQLite database. Each case is timed end to end,
+query included, and reported as the best of ``--repeat`` runs.
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault("DB_URI", "sqlite://")
+
+from app import app  # noqa: E402
+from models import db, User, Employee, UserStats  # noqa: E402
+from serializers import user_schema, employee_schema, user_stats_schema  # noqa: E402
+
+
+def seed(rows):
+    db.create_all()
+    db.session.execute(User.__table__.insert(), [
+        {
+            'id': i, 'firstname': f'First{i}', 'lastname': f'Last{i}', 'gender': 'f',
+            'email': f'user{i}@example.com', 'password': 'x' * 60, 'role': 'employee',
+            'contacts': '0700000000', 'arrivaltime': 900,
+        }
+        for i in range(1, rows + 1)
+    ])
+    db.session.execute(Employee.__table__.insert(), [
+        {'id': i, 'employee_id': i, 'salary': 1000.0, 'department': 'ops', 'position': 'staff'}
+        for i in range(1, rows + 1)
+    ])
+    db.session.execute(UserStats.__table__.insert(), [
+        {'role': f'role{i}', 'active_users': i, 'total_users': i} for i in range(100)
+    ])
+    db.session.commit()
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    cases = {
+        'user.to_dict (ORM)': lambda: [u.to_dict() for u in User.query.all()],
+        'user_schema.dump (ORM)': lambda: user_schema.dump_many(User.query.all()),
+        'user_schema.dump_row (Row)': lambda: [
+            user_schema.dump_row(row) for row in db.session.execute(user_schema.select())
+        ],
+        'Employee SerializerMixin.to_dict': lambda: [
+            e.to_dict(rules=('-user', '-leaves', '-posts')) for e in Employee.query.all()
+        ],
+        'employee_schema.dump_row (Row)': lambda: [
+            employee_schema.dump_row(row) for row in db.session.execute(employee_schema.select())
+        ],
+        'UserStats.to_dict': lambda: [s.to_dict() for s in UserStats.query.all()],
+        'user_stats_schema.dump_row (Row)': lambda: [
+            user_stats_schema.dump_row(row) for row in db.session.execute(user_stats_schema.select())
+        ],
+    }
+
+    with app.app_context():
+        seed(args.rows)
+        results = {}
+        for name, fn in cases.items():
+            results[name] = round(best_of(args.repeat, fn) * 1000, 2)
+            print(f"{name:<36} {results[name]:>10.2f} ms")
+
+        payload = [user_schema.dump_row(row) for row in db.session.execute(user_schema.select())]
+        # compact only applies when building responses, so time that path
+        for compact in (False, True):
+            app.json.compact = compact
+            start = time.perf_counter()
+            body = app.json.response(payload).get_data()
+            name = f"json encode ({'compact' if compact else 'pretty'})"
+            results[name] = round((time.perf_counter() - start) * 1000, 2)
+            print(f"{name:<36} {results[name]:>10.2f} ms  {len(body) / 1024:.0f} KiB")
+
+    print(json.dumps({'rows': args.rows, 'ms': results}))
+
+
+if __name__ == '__main__':
+    main()
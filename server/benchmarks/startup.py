@@ -0,0 +1,135 @@
+"""Startup time and per-worker memory, with and without preload-and-fork.
+
+Run from the server directory:
+
+    python -m benchmarks.startup [--repeat 5] [--workers 4]
+
+Startup is measured in fresh interpreters (median of ``--repeat``):
+- ``import_app``: ``from app import app``, what a gunicorn worker does
+- ``first_request``: the same, plus a first request through the test client
+- ``cli``: ``flask --app app routes``
+
+Worker memory starts ``--workers`` processes that each serve one request,
+then reads /proc/<pid>/smaps_rollup while they are all alive:
+- ``spawn``: every worker imports the app itself
+- ``preload``: the app is created once and workers are forked from it
+
+USS is the memory a worker does not share with anyone and is what each
+extra worker costs. PSS splits the shared pages between the processes
+that map them.
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory():
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[-1] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss_kb': fields.get('Rss'),
+        'pss_kb': fields.get('Pss'),
+        'uss_kb': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+def _timed(code, env, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=SERVER_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 1)
+
+
+def _timed_command(command, env, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=SERVER_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 1)
+
+
+def _worker(barrier, results):
+    from app import app
+    app.test_client().get('/')
+    barrier.wait()
+    results.put(memory())
+    barrier.wait()
+
+
+def worker_memory(mode, workers):
+    if mode == 'preload':
+        from app import app
+        app.test_client().get('/')
+        # Keep the collector from touching (and so copying) the preloaded objects
+        gc.freeze()
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    samples = [results.get() for _ in processes]
+    barrier.wait()
+    for process in processes:
+        process.join()
+    return {
+        key: round(statistics.mean(sample[key] for sample in samples))
+        for key in ('rss_kb', 'pss_kb', 'uss_kb')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--mode', choices=('spawn', 'preload'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        # Runs in its own interpreter so the parent's imports don't count
+        print(json.dumps(worker_memory(args.mode, args.workers)))
+        return
+
+    path = os.path.join(tempfile.mkdtemp(prefix='startup-'), 'bench.db')
+    env = dict(os.environ, DB_URI=f"sqlite:///{path}")
+    subprocess.run([sys.executable, '-c', "from app import app; from models import db\n"
+                    "with app.app_context(): db.create_all()"], cwd=SERVER_DIR, env=env, check=True)
+
+    results = {
+        'import_app_ms': _timed("from app import app", env, args.repeat),
+        'first_request_ms': _timed("from app import app; app.test_client().get('/')", env, args.repeat),
+        'cli_ms': _timed_command([sys.executable, '-m', 'flask', '--app', 'app', 'routes'], env, args.repeat),
+        'workers': args.workers,
+    }
+    for mode in ('spawn', 'preload'):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.startup', '--mode', mode, '--workers', str(args.workers)],
+            cwd=SERVER_DIR, env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        results[f'{mode}_worker'] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+import os
+from collections import Counter
+from itertools import islice
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, UserRole, EMAIL_RE
+from stats import stats_buffer
+from passwords import hasher
+
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", 500))
+
+REQUIRED_FIELDS = ('firstname', 'lastname', 'email', 'password')
+OPTIONAL_FIELDS = ('gender', 'role', 'contacts', 'arrivaltime')
+
+
+def read_rows(request):
+    """Yield user dicts from a JSON array, NDJSON or CSV request body.
+
+    Uploads sent as multipart form data are read from the ``file`` field and
+    their format is taken from the file extension.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        name = (upload.filename or '').lower()
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8')
+        if name.endswith('.csv'):
+            return csv.DictReader(stream)
+        if name.endswith(('.ndjson', '.jsonl')):
+            return _ndjson(stream)
+        return _json_array(stream.read())
+
+    mimetype = request.mimetype
+    if mimetype == 'text/csv':
+        return csv.DictReader(io.TextIOWrapper(request.stream, encoding='utf-8'))
+    if mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return _ndjson(io.TextIOWrapper(request.stream, encoding='utf-8'))
+    return _json_array(request.get_data(as_text=True))
+
+
+def _ndjson(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # Surfaced as a per-row error rather than failing the whole upload
+            yield None
+
+
+def _json_array(text):
+    rows = json.loads(text or '[]')
+    if not isinstance(rows, list):
+        raise ValueError("Expected a JSON array of users")
+    return rows
+
+
+def clean_row(row):
+    if not isinstance(row, dict):
+        raise ValueError("Row is not an object")
+    missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+    if missing:
+        raise ValueError(f"Missing required field(s): {', '.join(missing)}")
+
+    email = str(row['email']).strip().lower()
+    if not EMAIL_RE.match(email):
+        raise ValueError("Invalid email format")
+    password = str(row['password'])
+    if len(password) < 6:
+        raise ValueError("Password must be at least 6 characters long")
+
+    values = {
+        'firstname': str(row['firstname']).strip(),
+        'lastname': str(row['lastname']).strip(),
+        'email': email,
+        'password': password,
+    }
+    # Every row has the same keys: a multi-row INSERT renders one column
+    # list for all of its rows
+    for field in OPTIONAL_FIELDS:
+        values[field] = row[field] if row.get(field) not in (None, '') else None
+    if values['role'] is None:
+        values['role'] = UserRole.EMPLOYEE
+    if values['arrivaltime'] is not None:
+        values['arrivaltime'] = int(values['arrivaltime'])
+    return values
+
+
+def import_users(rows, chunk_size=BULK_CHUNK_SIZE):
+    """Insert users in chunks, returning the created count and per-row errors.
+
+    Each chunk costs one ``IN (...)`` lookup for already registered emails and
+    one multi-row INSERT. The ORM validators and mapper events are bypassed, so
+    UserStats is updated here once per chunk.
+    """
+    created = 0
+    errors = []
+    rows = enumerate(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        valid = {}
+        for index, row in chunk:
+            try:
+                values = clean_row(row)
+            except (ValueError, TypeError) as e:
+                errors.append({'index': index, 'error': str(e)})
+                continue
+            if values['email'] in valid:
+                errors.append({'index': index, 'error': "Duplicate email in upload"})
+                continue
+            valid[values['email']] = (index, values)
+
+        if valid:
+            taken = set(
+                db.session.execute(
+                    db.select(User.email).where(User.email.in_(valid.keys()))
+                ).scalars()
+            )
+            for email in taken:
+                index, _ = valid.pop(email)
+                errors.append({'index': index, 'error': "Email address is already registered"})
+
+        if valid:
+            entries = list(valid.values())
+            hashes = hasher.hash_many([values['password'] for _, values in entries])
+            for (_, values), hashed in zip(entries, hashes):
+                values['password'] = hashed
+            inserted = _insert_chunk(entries, errors)
+            created += len(inserted)
+            stats_buffer.record(Counter(values['role'] for values in inserted))
+
+    errors.sort(key=lambda error: error['index'])
+    return created, errors
+
+
+def _insert_chunk(entries, errors):
+    table = User.__table__
+    try:
+        db.session.execute(table.insert().values([values for _, values in entries]))
+        db.session.commit()
+        return [values for _, values in entries]
+    except IntegrityError:
+        # Another writer registered one of these emails after our lookup;
+        # retry row by row so only the conflicting rows are rejected.
+        db.session.rollback()
+
+    inserted = []
+    for index, values in entries:
+        try:
+            db.session.execute(table.insert().values(values))
+            db.session.commit()
+            inserted.append(values)
+        except IntegrityError:
+            db.session.rollback()
+            errors.append({'index': index, 'error': "Email address is already registered"})
+    return inserted
@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db, User
+from replicas import replicas
+
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 60))
+
+_MISSING = object()
+_INVALIDATED_KEY = 'user_cache_invalidated'
+_CLEAR_KEY = 'user_cache_clear'
+
+
+class LRUCache:
+    """Thread-safe LRU mapping whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store ``value``; ``ttl`` overrides the cache's TTL for this entry."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, _MISSING)
+            if entry is _MISSING:
+                return None
+            self.invalidations += 1
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+class UserCache:
+    """Caches User column values by id, with a secondary email -> id index.
+
+    Cached entries are detached snapshots. A hit is merged into the current
+    session with ``load=False``, so callers get a normal session-bound User
+    without a SELECT, and can modify and commit it as usual.
+
+    The cache is per process: a write in another worker reaches it only when
+    the entry expires, up to ``ttl`` seconds later. Credentials are therefore
+    checked against ``load_by_email``, which always reads the database.
+    Permissions do not come from here either (see permissions.py).
+    """
+
+    def __init__(self, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.by_id = LRUCache(maxsize, ttl)
+        self.by_email = LRUCache(maxsize, ttl)
+
+    def get(self, user_id):
+        snapshot = self.by_id.get(user_id)
+        if snapshot is not None and (not db.inspect(snapshot).info.get('replica') or replicas.reading()):
+            return db.session.merge(snapshot, load=False)
+        user = db.session.get(User, user_id)
+        if user is not None:
+            self.add(user)
+        return user
+
+    def get_by_email(self, email):
+        email = email.lower()
+        user_id = self.by_email.get(email)
+        if user_id is not None:
+            user = self.get(user_id)
+            if user is not None and user.email == email:
+                return user
+            self.by_email.pop(email)
+        user = User.query.filter_by(email=email).first()
+        if user is not None:
+            self.add(user)
+        return user
+
+    def load_by_email(self, email):
+        """The user with ``email`` as currently stored, bypassing the cache."""
+        user = db.session.execute(
+            db.select(User).where(User.email == email.lower()).execution_options(populate_existing=True)
+        ).scalar_one_or_none()
+        if user is not None:
+            self.add(user)
+        return user
+
+    def add(self, user):
+        state = db.inspect(user)
+        if state.modified or state.expired_attributes & _column_keys():
+            # Only cache values as they are in the database
+            return
+        snapshot = _snapshot(user)
+        ttl = replicas.cache_ttl()
+        if ttl is not None:
+            # Read from a replica, which may trail the primary. It expires
+            # soon and requests reading from the primary do not use it.
+            db.inspect(snapshot).info['replica'] = True
+        self.by_id.set(user.id, snapshot, ttl)
+        self.by_email.set(user.email, user.id, ttl)
+
+    def invalidate(self, user_id, email=None):
+        snapshot = self.by_id.pop(user_id)
+        if snapshot is not None:
+            self.by_email.pop(snapshot.email)
+        if email is not None:
+            self.by_email.pop(email)
+
+    def clear(self):
+        self.by_id.clear()
+        self.by_email.clear()
+
+    def stats(self):
+        return {'by_id': self.by_id.stats(), 'by_email': self.by_email.stats()}
+
+
+@lru_cache(maxsize=None)
+def _column_keys():
+    return frozenset(attr.key for attr in db.inspect(User).column_attrs)
+
+
+def _snapshot(user):
+    copy = User.__mapper__.class_manager.new_instance()
+    for key in _column_keys():
+        set_committed_value(copy, key, getattr(user, key))
+    make_transient_to_detached(copy)
+    return copy
+
+
+user_cache = UserCache()
+
+
+def _invalidate_target(mapper, connection, target):
+    user_cache.invalidate(target.id)
+    # Drop it again after commit in case a concurrent request cached the
+    # old row between our flush and commit.
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_INVALIDATED_KEY, set()).add(target.id)
+
+
+event.listen(User, 'after_update', _invalidate_target)
+event.listen(User, 'after_delete', _invalidate_target)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _after_commit(session):
+    if session.info.pop(_CLEAR_KEY, False):
+        user_cache.clear()
+    for user_id in session.info.pop(_INVALIDATED_KEY, ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _on_orm_execute(orm_execute_state):
+    # UPDATE/DELETE statements skip the mapper events, so drop everything
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if any(mapper.class_ is User for mapper in orm_execute_state.all_mappers):
+        user_cache.clear()
+        orm_execute_state.session.info[_CLEAR_KEY] = True
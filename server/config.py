@@ -0,0 +1,83 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+DATABASE = os.environ.get("DB_URI", f"sqlite:///{os.path.join(BASE_DIR, 'app.db')}")
+
+
+def _env_int(env, name, default):
+    return int(env.get(name, default))
+
+
+def _env_bool(env, name, default):
+    return env.get(name, '1' if default else '0').lower() in ('1', 'true', 'yes', 'on')
+
+
+def sqlite_pragmas(env=os.environ):
+    """PRAGMAs applied to every new SQLite connection.
+
+    WAL lets readers run alongside a writer, synchronous=NORMAL is safe in WAL
+    mode and skips an fsync per commit, and busy_timeout makes writers wait
+    for the lock instead of failing with "database is locked".
+    """
+    return {
+        'journal_mode': env.get("SQLITE_JOURNAL_MODE", 'WAL'),
+        'synchronous': env.get("SQLITE_SYNCHRONOUS", 'NORMAL'),
+        'busy_timeout': _env_int(env, "SQLITE_BUSY_TIMEOUT_MS", 5000),
+        # Negative values are KiB, so this is a 64 MiB page cache per connection
+        'cache_size': _env_int(env, "SQLITE_CACHE_SIZE", -65536),
+        'temp_store': env.get("SQLITE_TEMP_STORE", 'MEMORY'),
+    }
+
+
+def engine_options(uri, env=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for ``uri``, tuned from DB_* environment variables."""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            # In-memory databases live on one shared connection (StaticPool)
+            return {'connect_args': {'check_same_thread': False}}
+        busy_timeout = sqlite_pragmas(env)['busy_timeout']
+        return {
+            'connect_args': {'timeout': busy_timeout / 1000, 'check_same_thread': False},
+            'pool_size': _env_int(env, "DB_POOL_SIZE", 5),
+            'max_overflow': _env_int(env, "DB_MAX_OVERFLOW", 10),
+        }
+    return {
+        'pool_size': _env_int(env, "DB_POOL_SIZE", 10),
+        'max_overflow': _env_int(env, "DB_MAX_OVERFLOW", 20),
+        'pool_timeout': _env_int(env, "DB_POOL_TIMEOUT", 30),
+        'pool_recycle': _env_int(env, "DB_POOL_RECYCLE", 1800),
+        'pool_pre_ping': _env_bool(env, "DB_POOL_PRE_PING", True),
+    }
+
+
+def database_config(env=os.environ):
+    uri = env.get("DB_URI", DATABASE)
+    return {
+        'SQLALCHEMY_DATABASE_URI': uri,
+        'SQLALCHEMY_ENGINE_OPTIONS': engine_options(uri, env),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    }
+
+
+def configure_sqlite(engine, pragmas=None):
+    """Apply ``sqlite_pragmas`` on connect. No-op for other databases."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = pragmas or sqlite_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def init_engines(app, db):
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_sqlite(engine)
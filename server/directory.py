@@ -0,0 +1,271 @@
+"""In-memory user directory for the /directory listing.
+
+Each worker holds the directory columns of every user (user plus employee)
+in a column-oriented store. That is a sorted ``array('q')`` of ids and one
+list per field. Role, department and position strings are interned, so a
+user costs roughly one pointer per field plus its own name and email
+strings. The ORM equivalent is a User and an Employee instance with their
+state and ``__dict__``s, which takes several times as much. Listing pages are
+slices of these lists and need no query and no ORM hydration.
+
+The store is loaded on first use. After that it refreshes incrementally:
+at most every ``DIRECTORY_REFRESH_INTERVAL`` seconds, one indexed query
+reads the users whose ``updated_at`` is past the high-water mark. The
+query looks back ``DIRECTORY_REFRESH_OVERLAP`` seconds, which catches rows
+from transactions that committed after a later one was already read.
+Deletes are applied straight away in the process that made them. Other
+processes only see them on the full reload every
+``DIRECTORY_RELOAD_INTERVAL`` seconds. Employee writes touch the user's
+``updated_at`` so department and position changes are picked up too.
+"""
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import object_session
+
+from extensions import AppExtension
+from models import db, User, Employee
+
+DIRECTORY_REFRESH_INTERVAL = float(os.environ.get("DIRECTORY_REFRESH_INTERVAL", 2))
+DIRECTORY_RELOAD_INTERVAL = float(os.environ.get("DIRECTORY_RELOAD_INTERVAL", 300))
+DIRECTORY_REFRESH_OVERLAP = float(os.environ.get("DIRECTORY_REFRESH_OVERLAP", 5))
+DIRECTORY_CHUNK = int(os.environ.get("DIRECTORY_CHUNK", 10000))
+
+FIELDS = ('id', 'firstname', 'lastname', 'email', 'role', 'department', 'position')
+
+_CHANGED_KEY = 'directory_changed'
+_REMOVED_KEY = 'directory_removed'
+
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
+
+
+def _compact(row):
+    firstname, lastname, email, role, department, position = row[1:len(FIELDS)]
+    # Low-cardinality columns share one string object between entries
+    return firstname, lastname, email, _intern(role), _intern(department), _intern(position)
+
+
+class DirectoryStore:
+    """Sorted ids plus one list per field; entry ``i`` is column ``[i]`` of each."""
+
+    __slots__ = ('ids', 'columns')
+
+    def __init__(self):
+        self.ids = array('q')
+        self.columns = tuple([] for _ in FIELDS[1:])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, row):
+        """Add a row with an id above every stored id (full loads are ordered by id)."""
+        self.ids.append(row[0])
+        for column, value in zip(self.columns, _compact(row)):
+            column.append(value)
+
+    def upsert(self, row):
+        user_id = row[0]
+        values = _compact(row)
+        i = bisect_left(self.ids, user_id)
+        if i < len(self.ids) and self.ids[i] == user_id:
+            for column, value in zip(self.columns, values):
+                column[i] = value
+            return
+        self.ids.insert(i, user_id)
+        for column, value in zip(self.columns, values):
+            column.insert(i, value)
+
+    def remove(self, user_id):
+        i = bisect_left(self.ids, user_id)
+        if i < len(self.ids) and self.ids[i] == user_id:
+            del self.ids[i]
+            for column in self.columns:
+                del column[i]
+
+    def entry(self, i):
+        return dict(zip(FIELDS, (self.ids[i], *(column[i] for column in self.columns))))
+
+    def get(self, user_id):
+        i = bisect_left(self.ids, user_id)
+        if i < len(self.ids) and self.ids[i] == user_id:
+            return self.entry(i)
+        return None
+
+    def page(self, after, limit, **filters):
+        """Up to ``limit`` entries with id > ``after`` matching every ``field=value`` filter."""
+        checks = [(self.columns[FIELDS.index(name) - 1], value) for name, value in filters.items()]
+        entries = []
+        for i in range(bisect_right(self.ids, after), len(self.ids)):
+            if all(column[i] == value for column, value in checks):
+                entries.append(self.entry(i))
+                if len(entries) == limit:
+                    break
+        return entries
+
+
+def _query():
+    return (
+        select(User.id, User.firstname, User.lastname, User.email, User.role,
+               Employee.department, Employee.position, User.updated_at)
+        .outerjoin(Employee, Employee.id == User.id)
+    )
+
+
+class UserDirectory:
+    """The directory of one app's users, in ``app.extensions['user_directory']``.
+
+    A preloaded store is inherited copy-on-write by forked workers; only the
+    locks are recreated, in case the fork happened while one was held.
+    """
+
+    def __init__(self, app):
+        self.refresh_interval = app.config.get("DIRECTORY_REFRESH_INTERVAL", DIRECTORY_REFRESH_INTERVAL)
+        self.reload_interval = app.config.get("DIRECTORY_RELOAD_INTERVAL", DIRECTORY_RELOAD_INTERVAL)
+        self.overlap = timedelta(seconds=app.config.get("DIRECTORY_REFRESH_OVERLAP", DIRECTORY_REFRESH_OVERLAP))
+        self.store = None
+        self.high_water = None
+        self.checked = 0.0
+        self.loaded = 0.0
+        self.reloads = 0
+        self.refreshes = 0
+        self.refreshed_rows = 0
+        self._init_locks()
+
+    def _init_locks(self):
+        # _lock guards the store for readers; _refresh_lock keeps to one refresher
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def reload(self):
+        store = DirectoryStore()
+        high_water = None
+        query = _query().order_by(User.id).execution_options(yield_per=DIRECTORY_CHUNK)
+        with db.engine.connect() as connection:
+            for row in connection.execute(query):
+                store.append(row)
+                if row.updated_at is not None and (high_water is None or row.updated_at > high_water):
+                    high_water = row.updated_at
+        with self._lock:
+            self.store = store
+            self.high_water = high_water
+        self.loaded = time.monotonic()
+        self.reloads += 1
+
+    def refresh(self):
+        if self.high_water is None:
+            query = _query().where(User.updated_at.is_not(None))
+        else:
+            query = _query().where(User.updated_at > self.high_water - self.overlap)
+        with db.engine.connect() as connection:
+            rows = connection.execute(query).all()
+        with self._lock:
+            for row in rows:
+                self.store.upsert(row)
+                if self.high_water is None or row.updated_at > self.high_water:
+                    self.high_water = row.updated_at
+        self.refreshes += 1
+        self.refreshed_rows += len(rows)
+
+    def ensure_fresh(self):
+        """Reload or refresh if the interval has passed. Callers serve whatever is stored."""
+        now = time.monotonic()
+        if self.store is not None and now - self.checked < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=self.store is None):
+            # Another thread is already refreshing; the current store will do
+            return
+        try:
+            if self.store is not None and time.monotonic() - self.checked < self.refresh_interval:
+                return
+            if self.store is None or now - self.loaded >= self.reload_interval:
+                self.reload()
+            else:
+                self.refresh()
+            self.checked = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def expire(self):
+        """Refresh on the next read, e.g. after this process wrote to a user."""
+        self.checked = 0.0
+
+    def remove(self, user_ids):
+        with self._lock:
+            if self.store is not None:
+                for user_id in user_ids:
+                    self.store.remove(user_id)
+
+    def page(self, after=0, limit=100, **filters):
+        self.ensure_fresh()
+        with self._lock:
+            return self.store.page(after, limit, **filters)
+
+    def get(self, user_id):
+        self.ensure_fresh()
+        with self._lock:
+            return self.store.get(user_id)
+
+    def stats(self):
+        return {
+            'size': len(self.store) if self.store is not None else None,
+            'high_water': self.high_water.isoformat() if self.high_water else None,
+            'refresh_interval': self.refresh_interval,
+            'reload_interval': self.reload_interval,
+            'reloads': self.reloads,
+            'refreshes': self.refreshes,
+            'refreshed_rows': self.refreshed_rows,
+        }
+
+
+user_directory = AppExtension('user_directory', UserDirectory, after_fork='_init_locks')
+
+
+def _changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info[_CHANGED_KEY] = True
+
+
+def _removed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_REMOVED_KEY, set()).add(target.id)
+
+
+def _touch_user(mapper, connection, target):
+    # The directory only watches user.updated_at, so employee writes bump it
+    connection.execute(
+        update(User.__table__).where(User.__table__.c.id == target.id).values(updated_at=datetime.utcnow())
+    )
+    _changed(mapper, connection, target)
+
+
+event.listen(User, 'after_insert', _changed)
+event.listen(User, 'after_update', _changed)
+event.listen(User, 'after_delete', _removed)
+event.listen(Employee, 'after_insert', _touch_user)
+event.listen(Employee, 'after_update', _touch_user)
+event.listen(Employee, 'after_delete', _touch_user)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _after_commit(session):
+    removed = session.info.pop(_REMOVED_KEY, ())
+    if removed:
+        user_directory.remove(removed)
+    if session.info.pop(_CHANGED_KEY, False) or removed:
+        user_directory.expire()
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _after_rollback(session, previous_transaction):
+    session.info.pop(_CHANGED_KEY, None)
+    session.info.pop(_REMOVED_KEY, None)
@@ -0,0 +1,125 @@
+"""Streaming CSV exports of users and attendance.
+
+Rows are written out as they are read, ``EXPORT_CHUNK`` at a time, so
+memory stays flat whatever the size of the export. Gzip, when the client
+accepts it, is applied to the stream incrementally.
+
+On SQLite every chunk is its own short read (keyset on the id), and no
+transaction stays open between chunks. A long-lived reader would
+otherwise pin the WAL so checkpoints cannot finish, and in rollback
+journal mode its shared lock would block every commit until the download
+ends. The price is that an export is not a single snapshot: rows written
+during the export may or may not be in it. Other databases read through
+one server-side cursor (``yield_per``), which is a consistent snapshot
+and does not block writers.
+"""
+import csv
+import io
+import os
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import User, Employee, TimeEntry
+from replicas import replicas
+
+EXPORT_CHUNK = int(os.environ.get("EXPORT_CHUNK", 5000))
+EXPORT_GZIP_LEVEL = int(os.environ.get("EXPORT_GZIP_LEVEL", 6))
+
+USER_COLUMNS = (
+    User.id, User.firstname, User.lastname, User.gender, User.email, User.role, User.contacts,
+    User.arrivaltime, User.last_login, Employee.employee_id, Employee.department, Employee.position,
+    Employee.salary,
+)
+ATTENDANCE_COLUMNS = (
+    TimeEntry.id, TimeEntry.user_id, User.firstname, User.lastname, Employee.department,
+    TimeEntry.timestamp, TimeEntry.arrivaltime,
+)
+
+# Spreadsheet apps run cells starting with these as formulas
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def users_query(department=None, role=None):
+    query = select(*USER_COLUMNS).outerjoin(Employee, Employee.id == User.id)
+    if department is not None:
+        query = query.where(Employee.department == department)
+    if role is not None:
+        query = query.where(User.role == role)
+    return query
+
+
+def attendance_query(start=None, end=None, department=None, user_id=None):
+    """Time entries with ``start <= timestamp < end + 1 day``; both dates are optional."""
+    query = (
+        select(*ATTENDANCE_COLUMNS)
+        .join(User, User.id == TimeEntry.user_id)
+        .outerjoin(Employee, Employee.id == TimeEntry.user_id)
+    )
+    if start is not None:
+        query = query.where(TimeEntry.timestamp >= datetime.combine(start, datetime.min.time()))
+    if end is not None:
+        query = query.where(TimeEntry.timestamp < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    if department is not None:
+        query = query.where(Employee.department == department)
+    if user_id is not None:
+        query = query.where(TimeEntry.user_id == user_id)
+    return query
+
+
+def iter_chunks(query, key, chunk=EXPORT_CHUNK):
+    """Yield lists of at most ``chunk`` rows of ``query`` in ``key`` order."""
+    # A read replica when the request has one
+    engine = replicas.read_engine()
+    if engine.dialect.name != 'sqlite':
+        with engine.connect() as connection:
+            result = connection.execute(query.order_by(key).execution_options(yield_per=chunk))
+            for rows in result.partitions():
+                yield rows
+        return
+    last = None
+    while True:
+        page = query.order_by(key).limit(chunk)
+        if last is not None:
+            page = page.where(key > last)
+        with engine.connect() as connection:
+            rows = connection.execute(page).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk:
+            return
+        last = rows[-1][0]
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='seconds')
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(query, columns, key, chunk=EXPORT_CHUNK):
+    """CSV bytes for ``query``: a header line, then one piece per chunk of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+    writer.writerow([column.key for column in columns])
+    yield buffer.getvalue().encode()
+    for rows in iter_chunks(query, key, chunk):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_cell(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode()
+
+
+def gzipped(pieces, level=EXPORT_GZIP_LEVEL):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        data = compressor.compress(piece)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,51 @@
+"""Per-app extension state.
+
+Extensions that hold anything tied to one app, such as its config, data
+read from its database or its background threads, keep it in an object
+stored in ``app.extensions``. The module-level names other code imports,
+such as ``stats_buffer``, are ``AppExtension`` handles that resolve to the
+current app's object, so two apps created in one process share nothing.
+
+    stats_buffer = AppExtension('stats_buffer', StatsBuffer, at_exit='flush')
+    stats_buffer.init_app(app)    # app.extensions['stats_buffer'] = StatsBuffer(app)
+    stats_buffer.record(deltas)   # current_app.extensions['stats_buffer'].record(deltas)
+
+Process-wide hooks are registered once per handle, not once per app: at a
+fork and at exit, the ``after_fork`` and ``at_exit`` methods run on the
+object of every app that is still alive.
+"""
+import atexit
+import os
+import weakref
+
+from flask import current_app
+
+
+class AppExtension:
+    def __init__(self, name, factory, after_fork=None, at_exit=None):
+        self._name = name
+        self._factory = factory
+        self._instances = weakref.WeakSet()
+        if after_fork is not None:
+            os.register_at_fork(after_in_child=lambda: self._each(after_fork))
+        if at_exit is not None:
+            atexit.register(self._each, at_exit)
+
+    def init_app(self, app):
+        instance = self._factory(app)
+        app.extensions[self._name] = instance
+        self._instances.add(instance)
+        return instance
+
+    def for_app(self, app=None):
+        """The object of ``app``, or of the current app."""
+        return (app or current_app).extensions[self._name]
+
+    def _each(self, method):
+        for instance in list(self._instances):
+            getattr(instance, method)()
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.for_app(), name)
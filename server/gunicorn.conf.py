@@ -0,0 +1,37 @@
+"""gunicorn settings for serving app:app with preload-and-fork.
+
+    gunicorn app:app
+
+The master imports and creates the app once, then forks workers that
+share its code and data pages copy-on-write. gc.freeze() before each fork
+moves the preloaded objects out of the collector's reach. Without it a
+collection in a worker writes to their headers and un-shares the pages.
+
+More than one worker needs RESPONSE_CACHE_BACKEND=redis. The memory backend
+keeps cache and permission versions per process, so a worker would keep
+serving responses and ETags that another worker's writes made stale. The
+default is therefore one worker on the memory backend, and two per CPU
+plus one on redis.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:5555")
+cache_backend = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")
+default_workers = 1 if cache_backend == "memory" else multiprocessing.cpu_count() * 2 + 1
+workers = int(os.environ.get("GUNICORN_WORKERS", default_workers))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+
+def on_starting(server):
+    if server.cfg.workers > 1 and cache_backend == "memory":
+        raise RuntimeError(
+            f"{server.cfg.workers} workers need RESPONSE_CACHE_BACKEND=redis; "
+            "the memory backend only sees writes made by its own process"
+        )
+
+
+def pre_fork(server, worker):
+    gc.freeze()
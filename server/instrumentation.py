@@ -0,0 +1,165 @@
+import cProfile
+import logging
+import os
+import random
+import time
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+from metrics import Counter, Histogram
+from models import db
+from permissions import Permission, permission_required
+
+INSTRUMENTATION_ENABLED = os.environ.get("INSTRUMENTATION_ENABLED", "0") == "1"
+# Serve /metrics without authentication, for a scraper that cannot log in.
+# Only set it when /metrics is not reachable from outside.
+METRICS_PUBLIC = os.environ.get("METRICS_PUBLIC", "0") == "1"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_MIN_MS = float(os.environ.get("PROFILE_MIN_MS", 200))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+slow_query_log = logging.getLogger('slow_query')
+
+
+class Instrumentation:
+    """Opt-in request and SQL metrics, served at /metrics in Prometheus format.
+
+    Metrics are per process; with several gunicorn workers each one exposes
+    its own series, so scrape them individually or sum on the Prometheus side.
+    /metrics needs the OPS_READ permission unless METRICS_PUBLIC is set.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = INSTRUMENTATION_ENABLED
+        self.metrics_public = METRICS_PUBLIC
+        self.slow_query_ms = SLOW_QUERY_MS
+        self.profile_sample_rate = PROFILE_SAMPLE_RATE
+        self.profile_min_ms = PROFILE_MIN_MS
+        self.profile_dir = PROFILE_DIR
+
+        self.request_latency = Histogram(
+            'http_request_duration_seconds', "Request latency by endpoint.",
+            labels=('endpoint', 'method', 'status'))
+        self.request_queries = Histogram(
+            'http_request_sql_statements', "SQL statements executed per request.",
+            labels=('endpoint', 'method'), buckets=QUERY_COUNT_BUCKETS)
+        self.request_sql_time = Histogram(
+            'http_request_sql_duration_seconds', "Time spent in SQL per request.",
+            labels=('endpoint', 'method'))
+        self.sql_statements = Counter('sql_statements_total', "SQL statements executed.")
+        self.slow_queries = Counter('sql_slow_statements_total', "SQL statements slower than the slow query threshold.")
+        self.profiles_written = Counter('profiles_written_total', "cProfile dumps written to disk.")
+        self.metrics = [
+            self.request_latency, self.request_queries, self.request_sql_time,
+            self.sql_statements, self.slow_queries, self.profiles_written,
+        ]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("INSTRUMENTATION_ENABLED", self.enabled)
+        if not self.enabled:
+            return
+        self.slow_query_ms = app.config.get("SLOW_QUERY_MS", self.slow_query_ms)
+        self.profile_sample_rate = app.config.get("PROFILE_SAMPLE_RATE", self.profile_sample_rate)
+        self.metrics_public = app.config.get("METRICS_PUBLIC", self.metrics_public)
+        app.extensions['instrumentation'] = self
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        view = self.metrics_view if self.metrics_public else permission_required(Permission.OPS_READ)(self.metrics_view)
+        app.add_url_rule('/metrics', 'metrics', view)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                self.instrument(engine)
+
+    def instrument(self, engine):
+        """Time and count the queries of ``engine``."""
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def metrics_view(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.expose())
+        return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
+
+    def _before_request(self):
+        g.sql_count = 0
+        g.sql_time = 0.0
+        g.profiler = None
+        if self.profile_sample_rate and random.random() < self.profile_sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g.profiler = profiler
+            except ValueError:
+                # Another profiler is already active in this process
+                pass
+        g.request_start = time.perf_counter()
+
+    def _after_request(self, response):
+        start = g.pop('request_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        self.request_latency.observe(elapsed, endpoint, request.method, str(response.status_code))
+        self.request_queries.observe(g.sql_count, endpoint, request.method)
+        self.request_sql_time.observe(g.sql_time, endpoint, request.method)
+        response.headers['X-SQL-Count'] = str(g.sql_count)
+        response.headers['X-SQL-Time-ms'] = f"{g.sql_time * 1000:.2f}"
+        self._finish_profile(endpoint, elapsed)
+        return response
+
+    def _teardown_request(self, exc):
+        # after_request is skipped on unhandled errors; never leave a profiler running
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+
+    def _finish_profile(self, endpoint, elapsed):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        profiler.disable()
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms < self.profile_min_ms:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        filename = f"{endpoint}-{request.method}-{int(time.time() * 1000)}-{elapsed_ms:.0f}ms.prof"
+        profiler.dump_stats(os.path.join(self.profile_dir, filename))
+        self.profiles_written.inc()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        self.sql_statements.inc()
+        if has_request_context():
+            g.sql_count = g.get('sql_count', 0) + 1
+            g.sql_time = g.get('sql_time', 0.0) + elapsed
+        if elapsed * 1000 >= self.slow_query_ms:
+            self.slow_queries.inc()
+            slow_query_log.warning(
+                "Slow query (%.1f ms) on %s: %s | parameters=%r",
+                elapsed * 1000, request.endpoint if has_request_context() else '-', statement, parameters,
+            )
+
+    def _handle_error(self, context):
+        # after_cursor_execute does not run for a statement that failed
+        if context.connection is not None and context.execution_context is not None:
+            stack = context.connection.info.get('query_start')
+            if stack:
+                stack.pop()
+
+
+instrumentation = Instrumentation()
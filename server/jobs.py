@@ -0,0 +1,276 @@
+"""Persistent job queue for side effects that should not slow down requests.
+
+Jobs are rows in the ``job`` table. ``enqueue`` inserts one on the caller's
+connection or session, so a job only exists if the write that produced it
+commits. ``flask jobs work`` runs a pool of worker processes that claim
+jobs, run the registered handler and record the outcome:
+
+- A claimed job is hidden from other workers until ``locked_until``. A
+  worker that dies mid-job leaves it to be reclaimed after that visibility
+  timeout.
+- The handler runs in the same transaction that marks the job done, and
+  that UPDATE only matches while the worker still holds the claim. Database
+  side effects therefore happen exactly once. Anything outside the
+  database, such as email, happens at least once.
+- Failures are retried with capped exponential backoff and jitter until
+  ``max_attempts``, after which the job is left as ``failed``.
+
+Handlers are registered with ``@handler(kind)`` and receive
+``(connection, payload)``.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func
+
+from models import db, Job, AuditLog
+
+JOB_VISIBILITY_TIMEOUT = float(os.environ.get("JOB_VISIBILITY_TIMEOUT", 60))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+JOB_BACKOFF_BASE = float(os.environ.get("JOB_BACKOFF_BASE", 2))
+JOB_BACKOFF_MAX = float(os.environ.get("JOB_BACKOFF_MAX", 300))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+
+log = logging.getLogger('jobs')
+
+_handlers = {}
+
+
+class ClaimLost(Exception):
+    """The visibility timeout expired and the job may already be claimed again."""
+
+
+def handler(kind):
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(connection, kind, payload=None, delay=0, max_attempts=JOB_MAX_ATTEMPTS):
+    """Queue a job inside the caller's transaction. ``connection`` may be a Session."""
+    connection.execute(Job.__table__.insert().values(
+        kind=kind,
+        payload=json.dumps(payload or {}, separators=(',', ':')),
+        status='queued',
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        created_at=datetime.utcnow(),
+    ))
+
+
+def backoff(attempts, base=JOB_BACKOFF_BASE, cap=JOB_BACKOFF_MAX):
+    """Seconds to wait before retry number ``attempts``, with jitter."""
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return delay * (0.5 + random.random() / 2)
+
+
+def _claimable(now):
+    table = Job.__table__
+    return db.or_(
+        db.and_(table.c.status == 'queued', table.c.run_at <= now),
+        db.and_(table.c.status == 'running', table.c.locked_until < now,
+                table.c.attempts < table.c.max_attempts),
+    )
+
+
+def claim(engine, visibility_timeout=JOB_VISIBILITY_TIMEOUT):
+    """Claim the next due job, or return None when there is nothing to do."""
+    table = Job.__table__
+    while True:
+        now = datetime.utcnow()
+        with engine.begin() as connection:
+            row = connection.execute(
+                db.select(table)
+                .where(_claimable(now))
+                .order_by(table.c.run_at, table.c.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            ).first()
+            if row is None:
+                return None
+            locked_until = now + timedelta(seconds=visibility_timeout)
+            # Conditional on the job still being claimable, so two workers
+            # racing for the same row cannot both win it
+            result = connection.execute(
+                table.update()
+                .where(table.c.id == row.id, _claimable(now))
+                .values(status='running', locked_until=locked_until, attempts=table.c.attempts + 1)
+            )
+        if result.rowcount == 1:
+            return {**row._asdict(), 'attempts': row.attempts + 1, 'locked_until': locked_until}
+
+
+def run(engine, job):
+    """Run a claimed job and record success, retry or failure."""
+    table = Job.__table__
+    owned = db.and_(table.c.id == job['id'], table.c.status == 'running',
+                    table.c.locked_until == job['locked_until'])
+    try:
+        func = _handlers.get(job['kind'])
+        if func is None:
+            raise LookupError(f"No handler for job kind {job['kind']!r}")
+        with engine.begin() as connection:
+            func(connection, json.loads(job['payload']))
+            done = connection.execute(table.update().where(owned).values(status='done', last_error=None))
+            if done.rowcount != 1:
+                raise ClaimLost(f"Job {job['id']} outlived its visibility timeout")
+        return 'done'
+    except ClaimLost:
+        # Rolled back; whoever holds the job now records the outcome
+        log.warning("Job %s (%s) outlived its visibility timeout", job['id'], job['kind'])
+        return 'lost'
+    except Exception:
+        error = traceback.format_exc(limit=5)
+        retry = job['attempts'] < job['max_attempts']
+        values = {'status': 'queued' if retry else 'failed', 'locked_until': None, 'last_error': error}
+        if retry:
+            values['run_at'] = datetime.utcnow() + timedelta(seconds=backoff(job['attempts']))
+        with engine.begin() as connection:
+            connection.execute(table.update().where(owned).values(**values))
+        log.warning("Job %s (%s) attempt %s failed:\n%s", job['id'], job['kind'], job['attempts'], error)
+        return 'retry' if retry else 'failed'
+
+
+def expire(engine):
+    """Fail running jobs whose claim expired after their last attempt."""
+    table = Job.__table__
+    with engine.begin() as connection:
+        return connection.execute(
+            table.update()
+            .where(table.c.status == 'running', table.c.locked_until < datetime.utcnow(),
+                   table.c.attempts >= table.c.max_attempts)
+            .values(status='failed', locked_until=None, last_error='Visibility timeout expired')
+        ).rowcount
+
+
+class Worker:
+    def __init__(self, app, poll_interval=JOB_POLL_INTERVAL, visibility_timeout=JOB_VISIBILITY_TIMEOUT):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.stopping = False
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def work(self, burst=False):
+        """Process jobs until stopped, or until the queue is empty if ``burst``."""
+        processed = 0
+        with self.app.app_context():
+            engine = db.engine
+            while not self.stopping:
+                job = claim(engine, self.visibility_timeout)
+                if job is None:
+                    expire(engine)
+                    if burst:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                run(engine, job)
+                processed += 1
+        return processed
+
+
+def _worker_main(app, poll_interval, visibility_timeout):
+    worker = Worker(app, poll_interval, visibility_timeout)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    with app.app_context():
+        # Connections inherited from the parent must not be shared
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    worker.work()
+
+
+# Built-in handlers
+
+@handler('audit.record')
+def record_audit(connection, payload):
+    connection.execute(AuditLog.__table__.insert().values(
+        action=payload['action'],
+        user_id=payload.get('user_id'),
+        actor_id=payload.get('actor_id'),
+        details=json.dumps(payload.get('details') or {}, separators=(',', ':')),
+        created_at=datetime.fromisoformat(payload['at']) if payload.get('at') else datetime.utcnow(),
+    ))
+
+
+def enqueue_audit(connection, action, user_id=None, actor_id=None, **details):
+    enqueue(connection, 'audit.record', {
+        'action': action, 'user_id': user_id, 'actor_id': actor_id,
+        'details': details, 'at': datetime.utcnow().isoformat(),
+    })
+
+
+jobs_cli = AppGroup('jobs', help="Run and inspect the background job queue.")
+
+
+@jobs_cli.command('work')
+@click.option('--processes', default=JOB_WORKERS, show_default=True, help="Worker processes to run.")
+@click.option('--poll-interval', default=JOB_POLL_INTERVAL, show_default=True, help="Seconds to sleep when idle.")
+@click.option('--visibility-timeout', default=JOB_VISIBILITY_TIMEOUT, show_default=True,
+              help="Seconds a claimed job stays hidden from other workers.")
+@click.option('--burst', is_flag=True, help="Run in this process until the queue is empty, then exit.")
+def work_command(processes, poll_interval, visibility_timeout, burst):
+    """Process queued jobs."""
+    from flask import current_app
+    app = current_app._get_current_object()
+    if burst:
+        processed = Worker(app, poll_interval, visibility_timeout).work(burst=True)
+        click.echo(f"Processed {processed} job(s)")
+        return
+
+    context = multiprocessing.get_context('fork')
+    workers = [
+        context.Process(target=_worker_main, args=(app, poll_interval, visibility_timeout), daemon=True)
+        for _ in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    click.echo(f"Started {processes} worker(s)")
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join()
+
+
+@jobs_cli.command('stats')
+def stats_command():
+    """Show job counts by kind and status."""
+    table = Job.__table__
+    rows = db.session.execute(
+        db.select(table.c.kind, table.c.status, func.count())
+        .group_by(table.c.kind, table.c.status)
+        .order_by(table.c.kind, table.c.status)
+    ).all()
+    for kind, status, count in rows:
+        click.echo(f"{kind:<20} {status:<10} {count}")
+
+
+@jobs_cli.command('purge')
+@click.option('--older-than', default=7, show_default=True, help="Days to keep finished jobs.")
+def purge_command(older_than):
+    """Delete done jobs older than --older-than days."""
+    table = Job.__table__
+    with db.engine.begin() as connection:
+        deleted = connection.execute(
+            table.delete().where(table.c.status == 'done',
+                                 table.c.run_at < datetime.utcnow() - timedelta(days=older_than))
+        ).rowcount
+    click.echo(f"Deleted {deleted} job(s)")
@@ -0,0 +1,119 @@
+"""Named loading profiles for user endpoints, selected with ``?expand=``.
+
+Every profile loads a page of users in a fixed number of queries, however
+many users are on the page:
+
+    summary               1 query, plain rows, no relationships
+    with_employee         + employee and admin records with their leaves
+    with_recent_activity  + the latest posts and time entries per user
+
+Role records and leaves use selectinload, one IN query per relationship.
+Posts and time entries can grow without bound, so they are not loaded
+through the relationship at all. Instead one windowed query per
+relationship fetches the newest ``limit`` rows for every user on the page.
+"""
+import os
+
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+
+from models import db, User, Admin, Employee, Post, TimeEntry
+from serializers import user_schema, user_with_roles_schema, post_schema, time_entry_schema
+
+EXPAND_RECENT_POSTS = int(os.environ.get("EXPAND_RECENT_POSTS", 5))
+EXPAND_RECENT_TIME_ENTRIES = int(os.environ.get("EXPAND_RECENT_TIME_ENTRIES", 10))
+
+
+class Recent:
+    """The newest ``limit`` rows of a child table per user, in one query."""
+
+    def __init__(self, schema, foreign_key, order_by, limit):
+        self.schema = schema
+        self.foreign_key = foreign_key
+        self.order_by = order_by
+        self.limit = limit
+
+    def load(self, ids):
+        grouped = {id: [] for id in ids}
+        if not ids or self.limit < 1:
+            return grouped
+        table = self.foreign_key.table
+        rank = func.row_number().over(
+            partition_by=self.foreign_key,
+            order_by=(self.order_by.desc(), table.c.id.desc()),
+        ).label('rank')
+        ranked = db.select(*self.schema.columns, rank).where(self.foreign_key.in_(ids)).subquery()
+        query = (
+            db.select(*[ranked.c[name] for name in self.schema.fields])
+            .where(ranked.c.rank <= self.limit)
+            .order_by(ranked.c[self.foreign_key.key], ranked.c.rank)
+        )
+        key = self.foreign_key.key
+        dump_row = self.schema.dump_row
+        for row in db.session.execute(query):
+            grouped[getattr(row, key)].append(dump_row(row))
+        return grouped
+
+
+class LoadProfile:
+    def __init__(self, name, schema, options=None, recent=None, tables=('user',)):
+        self.name = name
+        self.schema = schema
+        # None means rows are selected and dumped without ORM instances
+        self.options = options
+        self.recent = dict(recent or {})
+        # Tables the payload is read from, for response cache versioning
+        self.tables = tables
+
+    def select(self):
+        if self.options is None:
+            return self.schema.select()
+        return db.select(User).options(*self.options)
+
+    def fetch(self, query):
+        """Run ``query`` (built from ``select()``) and return the serialized users."""
+        if self.options is None:
+            dump_row = self.schema.dump_row
+            return [dump_row(row) for row in db.session.execute(query)]
+
+        dump = self.schema.dump
+        payload = [dump(user) for user in db.session.execute(query).scalars()]
+        ids = [item['id'] for item in payload]
+        for name, recent in self.recent.items():
+            grouped = recent.load(ids)
+            for item in payload:
+                item[name] = grouped[item['id']]
+        return payload
+
+
+_role_options = (
+    selectinload(User.employee).selectinload(Employee.leaves),
+    selectinload(User.admin).selectinload(Admin.leaves),
+)
+
+PROFILES = {
+    profile.name: profile for profile in (
+        LoadProfile('summary', user_schema),
+        LoadProfile(
+            'with_employee', user_with_roles_schema, options=_role_options,
+            tables=('user', 'employee', 'admin', 'leave'),
+        ),
+        LoadProfile(
+            'with_recent_activity', user_with_roles_schema, options=_role_options,
+            recent={
+                'recent_posts': Recent(post_schema, Post.__table__.c.user_id, Post.date_posted,
+                                       EXPAND_RECENT_POSTS),
+                'recent_time_entries': Recent(time_entry_schema, TimeEntry.__table__.c.user_id,
+                                              TimeEntry.timestamp, EXPAND_RECENT_TIME_ENTRIES),
+            },
+            tables=('user', 'employee', 'admin', 'leave', 'post', 'time_entry'),
+        ),
+    )
+}
+
+
+def get_profile(expand):
+    profile = PROFILES.get(expand or 'summary')
+    if profile is None:
+        raise ValueError(f"Unknown expand {expand!r}, expected one of {', '.join(PROFILES)}")
+    return profile
@@ -0,0 +1,79 @@
+"""Notification emails, sent from the job queue.
+
+Mail goes to SMTP_HOST:SMTP_PORT, by default a local stub started with
+
+    flask jobs smtp-stub --port 1025
+
+which accepts every message and prints it instead of delivering it.
+"""
+import os
+import smtplib
+import socketserver
+from email.message import EmailMessage
+
+import click
+
+from jobs import handler, enqueue, jobs_cli
+
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 1025))
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", 10))
+MAIL_FROM = os.environ.get("MAIL_FROM", "no-reply@localhost")
+
+
+def enqueue_email(connection, to, subject, body):
+    enqueue(connection, 'email.send', {'to': to, 'subject': subject, 'body': body})
+
+
+@handler('email.send')
+def send_email(connection, payload):
+    message = EmailMessage()
+    message['From'] = MAIL_FROM
+    message['To'] = payload['to']
+    message['Subject'] = payload['subject']
+    message.set_content(payload['body'])
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as smtp:
+        smtp.send_message(message)
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: accepts and prints every message."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost SMTP stub")
+        data = None
+        for raw in self.rfile:
+            line = raw.decode('utf-8', 'replace').rstrip("\r\n")
+            if data is not None:
+                if line == '.':
+                    click.echo("\n".join(data) + "\n" + "-" * 40)
+                    data = None
+                    self.reply("250 OK")
+                else:
+                    data.append(line[1:] if line.startswith('..') else line)
+                continue
+            command = line[:4].upper()
+            if command == 'EHLO':
+                self.reply("250 localhost")
+            elif command == 'DATA':
+                data = []
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+@jobs_cli.command('smtp-stub')
+@click.option('--host', default='localhost', show_default=True)
+@click.option('--port', default=SMTP_PORT, show_default=True)
+def smtp_stub_command(host, port):
+    """Run a local SMTP server that prints messages instead of sending them."""
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer((host, port), SMTPStubHandler) as server:
+        click.echo(f"SMTP stub listening on {host}:{port}")
+        server.serve_forever()
@@ -0,0 +1,74 @@
+"""Prometheus counters and histograms, exposed in the text format.
+
+Used by instrumentation.py, which serves them at /metrics, and by other
+extensions that add their own series to it, such as the rate limiter.
+"""
+import threading
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
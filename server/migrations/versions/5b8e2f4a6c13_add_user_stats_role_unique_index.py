@@ -0,0 +1,48 @@
+"""Add unique user_stats role index
+
+Revision ID: 5b8e2f4a6c13
+Revises: d9f1b3c5e7a2
+Create Date: 2026-10-19 10:12:37.440918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e2f4a6c13'
+down_revision = 'd9f1b3c5e7a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Racing UPDATE-then-INSERT flushes could create several rows for a role;
+    # fold them into the lowest id before the index forbids it
+    user_stats = sa.table(
+        'user_stats',
+        sa.column('id', sa.Integer), sa.column('role', sa.String),
+        sa.column('active_users', sa.Integer), sa.column('total_users', sa.Integer),
+    )
+    connection = op.get_bind()
+    duplicates = connection.execute(
+        sa.select(
+            user_stats.c.role,
+            sa.func.min(user_stats.c.id),
+            sa.func.sum(sa.func.coalesce(user_stats.c.active_users, 0)),
+            sa.func.sum(sa.func.coalesce(user_stats.c.total_users, 0)),
+        ).group_by(user_stats.c.role).having(sa.func.count() > 1)
+    ).all()
+    for role, keep, active, total in duplicates:
+        connection.execute(
+            user_stats.update().where(user_stats.c.id == keep).values(active_users=active, total_users=total)
+        )
+        connection.execute(user_stats.delete().where(user_stats.c.role == role, user_stats.c.id != keep))
+
+    with op.batch_alter_table('user_stats', schema=None) as batch_op:
+        batch_op.create_index('ix_user_stats_role', ['role'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('user_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_stats_role')
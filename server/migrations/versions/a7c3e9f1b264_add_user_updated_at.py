@@ -0,0 +1,29 @@
+"""Add user.updated_at
+
+Revision ID: a7c3e9f1b264
+Revises: f2b6d4a8c913
+Create Date: 2026-10-18 09:42:17.530961
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9f1b264'
+down_revision = 'f2b6d4a8c913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ADD COLUMN rather than batch mode: recreating "user" on SQLite
+    # would drop the user_fts triggers
+    op.add_column('user', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE "user" SET updated_at = CURRENT_TIMESTAMP')
+    op.create_index('ix_user_updated_at', 'user', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_updated_at', table_name='user')
+    op.drop_column('user', 'updated_at')
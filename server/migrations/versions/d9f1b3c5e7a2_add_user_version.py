@@ -0,0 +1,25 @@
+"""Add user.version
+
+Revision ID: d9f1b3c5e7a2
+Revises: c4e8a2d6f051
+Create Date: 2026-10-18 14:26:51.873104
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f1b3c5e7a2'
+down_revision = 'c4e8a2d6f051'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ADD COLUMN, as for updated_at: batch mode would drop the user_fts triggers
+    op.add_column('user', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('user', 'version')
@@ -0,0 +1,62 @@
+"""Add user search indexes and FTS5 name index
+
+Revision ID: e5a7f3c19d82
+Revises: c4d81f0e2b57
+Create Date: 2026-10-17 16:21:53.117460
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7f3c19d82'
+down_revision = 'c4d81f0e2b57'
+branch_labels = None
+depends_on = None
+
+
+FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5(
+        firstname, lastname, content='user', content_rowid='id', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_ai AFTER INSERT ON "user" BEGIN
+        INSERT INTO user_fts(rowid, firstname, lastname) VALUES (new.id, new.firstname, new.lastname);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_ad AFTER DELETE ON "user" BEGIN
+        INSERT INTO user_fts(user_fts, rowid, firstname, lastname) VALUES ('delete', old.id, old.firstname, old.lastname);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_au AFTER UPDATE OF firstname, lastname ON "user" BEGIN
+        INSERT INTO user_fts(user_fts, rowid, firstname, lastname) VALUES ('delete', old.id, old.firstname, old.lastname);
+        INSERT INTO user_fts(rowid, firstname, lastname) VALUES (new.id, new.firstname, new.lastname);
+    END""",
+    "INSERT INTO user_fts(user_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade():
+    op.create_index('ix_user_role', 'user', ['role'], unique=False)
+    op.create_index('ix_user_last_login', 'user', ['last_login'], unique=False)
+    op.create_index('ix_user_lower_email', 'user', [sa.text('lower(email)')], unique=False)
+    op.create_index('ix_user_lower_firstname', 'user', [sa.text('lower(firstname)')], unique=False)
+    op.create_index('ix_user_lower_lastname', 'user', [sa.text('lower(lastname)')], unique=False)
+    op.create_index('ix_employee_department_position', 'employee', ['department', 'position'], unique=False)
+
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in FTS_DDL:
+            op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS user_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS user_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS user_fts_ai")
+        op.execute("DROP TABLE IF EXISTS user_fts")
+
+    op.drop_index('ix_employee_department_position', table_name='employee')
+    op.drop_index('ix_user_lower_lastname', table_name='user')
+    op.drop_index('ix_user_lower_firstname', table_name='user')
+    op.drop_index('ix_user_lower_email', table_name='user')
+    op.drop_index('ix_user_last_login', table_name='user')
+    op.drop_index('ix_user_role', table_name='user')
@@ -1,9 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from sqlalchemy import MetaData, event
+from sqlalchemy import MetaData, func
 from sqlalchemy.orm import validates
+from sqlalchemy.orm.attributes import flag_modified, set_committed_value
 import re
 from sqlalchemy_serializer import SerializerMixin
+from flask_login import UserMixin
+from passwords import hasher, needs_rehash
+from routing import RoutingSession
 
 metadata = MetaData(
     naming_convention={
@@ -11,13 +15,15 @@ metadata = MetaData(
     }
 )
 
-db = SQLAlchemy(metadata=metadata)
+db = SQLAlchemy(metadata=metadata, session_options={'class_': RoutingSession})
+
+EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
 
 class UserRole:
     EMPLOYEE = 'employee'
     ADMIN = 'admin'
 
-class User(db.Model, SerializerMixin):
+class User(db.Model, SerializerMixin, UserMixin):
     __tablename__ = 'user'
 
     id = db.Column(db.Integer, primary_key=True)
@@ -26,12 +32,28 @@ class User(db.Model, SerializerMixin):
     gender = db.Column(db.String(20))
     email = db.Column(db.String(150), unique=True, nullable=False)
     password = db.Column(db.String(150), nullable=False)
-    role = db.Column(db.String(20), default='EMPLOYEE')
+    # active_history keeps the previous role around so stats can move the count
+    role = db.column_property(db.Column(db.String(20), default='EMPLOYEE'), active_history=True)
     contacts = db.Column(db.String(150))
     arrivaltime = db.Column(db.Integer)
     time_entries = db.relationship('TimeEntry', backref='user', lazy=True)
     posts = db.relationship('Post', backref='author', lazy=True)
     last_login = db.Column(db.DateTime)
+    # High-water mark for incremental readers such as directory.py
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Optimistic concurrency: ORM flushes update WHERE version matches and bump it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+
+    __table_args__ = (
+        db.Index('ix_user_role', 'role'),
+        db.Index('ix_user_updated_at', 'updated_at'),
+        db.Index('ix_user_last_login', 'last_login'),
+        db.Index('ix_user_lower_email', func.lower(email)),
+        db.Index('ix_user_lower_firstname', func.lower(firstname)),
+        db.Index('ix_user_lower_lastname', func.lower(lastname)),
+    )
 
     def __repr__(self):
         return f"<User id={self.id}, firstname={self.firstname}, lastname={self.lastname}, email={self.email}, role={self.role}>"
@@ -42,7 +64,7 @@ class User(db.Model, SerializerMixin):
             raise ValueError("Email is required")
         
         # Regular expression for email validation
-        if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
+        if not EMAIL_RE.match(email):
             raise ValueError("Invalid email format")
 
         # Check if email is already taken
@@ -58,19 +80,24 @@ class User(db.Model, SerializerMixin):
             raise ValueError("Password is required")
         if len(password) < 6:
             raise ValueError("Password must be at least 6 characters long")
-        return password
+        return hasher.hash(password)
 
-    def update_stats(self):
-        stats = UserStats.query.filter_by(role=self.role).first()
-        if not stats:
-            stats = UserStats(role=self.role, active_users=0, total_users=0)
-            db.session.add(stats)
+    def check_password(self, password):
+        if not self.password or not hasher.verify(password, self.password):
+            return False
+        if needs_rehash(self.password):
+            # Upgrade to the current scheme and cost
+            self.set_password_hash(hasher.hash(password))
+        return True
 
-        if self.subscription_active:
-            stats.active_users += 1
-        stats.total_users += 1
+    def set_password_hash(self, hashed):
+        """Store an already hashed password, skipping validate_password.
 
-        db.session.commit()
+        The flush is still a versioned UPDATE of this user, so its version
+        is bumped and only its cache entry is invalidated.
+        """
+        set_committed_value(self, 'password', hashed)
+        flag_modified(self, 'password')
 
     def to_dict(self):
         return {
@@ -83,6 +110,8 @@ class User(db.Model, SerializerMixin):
             'contacts': self.contacts,
             'arrivaltime': self.arrivaltime,
             'last_login': self.last_login.isoformat() if self.last_login else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'version': self.version,
         }
 
 class Admin(db.Model, SerializerMixin):
@@ -90,7 +119,7 @@ class Admin(db.Model, SerializerMixin):
     user = db.relationship("User", backref="admin")
     arrivaltime = db.Column(db.Integer)
     leaves = db.relationship('Leave', backref='admin', lazy=True)
-    posts = db.relationship('Post', backref='author', lazy=True)
+    posts = db.relationship('Post', primaryjoin='Admin.id == foreign(Post.user_id)', viewonly=True, lazy=True)
 
 class Employee(db.Model, SerializerMixin):
     id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
@@ -101,7 +130,25 @@ class Employee(db.Model, SerializerMixin):
     position = db.Column(db.String(100))
     arrivaltime = db.Column(db.Integer)
     leaves = db.relationship('Leave', backref='employee', lazy=True)
-    posts = db.relationship('Post', backref='employee', lazy=True)
+    posts = db.relationship('Post', primaryjoin='Employee.id == foreign(Post.user_id)', viewonly=True, lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_employee_department_position', 'department', 'position'),
+    )
+
+class Leave(db.Model, SerializerMixin):
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'))
+    admin_id = db.Column(db.Integer, db.ForeignKey('admin.id'))
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    reason = db.Column(db.String(255))
+    status = db.Column(db.String(20), default='pending')
+
+    serialize_rules = ('-employee', '-admin')
+
+    def __repr__(self):
+        return f"<Leave id={self.id}, employee_id={self.employee_id}, start_date={self.start_date}, end_date={self.end_date}, status={self.status}>"
 
 class UserStats(db.Model, SerializerMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -109,6 +156,11 @@ class UserStats(db.Model, SerializerMixin):
     active_users = db.Column(db.Integer, default=0)
     total_users = db.Column(db.Integer, default=0)
 
+    __table_args__ = (
+        # One counter row per role; stats.apply_deltas upserts on it
+        db.Index('ix_user_stats_role', 'role', unique=True),
+    )
+
     def __repr__(self):
         return f"<UserStats id={self.id}, role={self.role}, active_users={self.active_users}, total_users={self.total_users}>"
 
@@ -136,34 +188,80 @@ class TimeEntry(db.Model):
     arrivaltime = db.Column(db.Integer, nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_time_entry_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+
     def __repr__(self):
         return f"<TimeEntry user_id={self.user_id}, arrivaltime={self.arrivaltime}, timestamp={self.timestamp}>"
 
-def update_user_stats(mapper, connection, target):
-    stats = UserStats.query.filter_by(role=target.role).first()
-    if not stats:
-        stats = UserStats(role=target.role, active_users=0, total_users=0)
-        db.session.add(stats)
-
-    if target.subscription_active:
-        stats.active_users += 1
-    stats.total_users += 1
-    db.session.commit()
-
-def deactivate_user_stats(mapper, connection, target):
-    stats = UserStats.query.filter_by(role=target.role).first()
-    if target.subscription_active:
-        stats.active_users -= 1
-    stats.total_users -= 1
-    db.session.commit()
-
-def log_arrivaltime(mapper, connection, target):
-    if target.arrivaltime:
-        time_entry = TimeEntry(user_id=target.id, arrivaltime=target.arrivaltime)
-        db.session.add(time_entry)
-        db.session.commit()
-
-event.listen(User, 'after_insert', update_user_stats)
-event.listen(User, 'before_update', update_user_stats)
-event.listen(User, 'before_delete', deactivate_user_stats)
-event.listen(User, 'before_update', log_arrivaltime)
+class AttendanceDaily(db.Model):
+    """Per user, per day rollup of TimeEntry, maintained by rollup.py."""
+    __tablename__ = 'attendance_daily'
+
+    date = db.Column(db.Date, primary_key=True)
+    department = db.Column(db.String(100), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    first_arrivaltime = db.Column(db.Integer, nullable=False)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+    arrivaltime_sum = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<AttendanceDaily date={self.date}, department={self.department}, user_id={self.user_id}, first_arrivaltime={self.first_arrivaltime}>"
+
+class Job(db.Model):
+    """A queued side effect, run by the worker pool in jobs.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    def __repr__(self):
+        return f"<Job id={self.id}, kind={self.kind}, status={self.status}, attempts={self.attempts}>"
+
+class AuditLog(db.Model):
+    __tablename__ = 'audit_log'
+
+    id = db.Column(db.Integer, primary_key=True)
+    action = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer)
+    actor_id = db.Column(db.Integer)
+    details = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_audit_log_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f"<AuditLog id={self.id}, action={self.action}, user_id={self.user_id}, actor_id={self.actor_id}>"
+
+# UserStats counters are maintained by the delta buffer in stats.py, and
+# arrival times are logged to TimeEntry by timeentries.py
+
+class RevokedToken(db.Model):
+    """Denylisted token ids, loaded into the Bloom filter in tokens.py."""
+    __tablename__ = 'revoked_token'
+
+    jti = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_revoked_token_revoked_at', 'revoked_at'),
+        db.Index('ix_revoked_token_expires_at', 'expires_at'),
+    )
+
+    def __repr__(self):
+        return f"<RevokedToken jti={self.jti}, user_id={self.user_id}, expires_at={self.expires_at}>"
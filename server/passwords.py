@@ -0,0 +1,223 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# Hash format: "<scheme>$<cost params...>$<salt>$<digest>", salt and digest in
+# unpadded urlsafe base64. The scheme and cost are stored with each hash so the
+# work factor can be raised later and old hashes upgraded on the next login.
+PBKDF2 = 'pbkdf2_sha256'
+SCRYPT = 'scrypt'
+
+PASSWORD_HASH_SCHEME = os.environ.get("PASSWORD_HASH_SCHEME", PBKDF2)
+PASSWORD_HASH_ITERATIONS = int(os.environ.get("PASSWORD_HASH_ITERATIONS", 260000))
+PASSWORD_SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", 2 ** 14))
+PASSWORD_SCRYPT_R = int(os.environ.get("PASSWORD_SCRYPT_R", 8))
+PASSWORD_SCRYPT_P = int(os.environ.get("PASSWORD_SCRYPT_P", 1))
+
+# 0 workers hashes inline in the calling thread
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 4 * max(PASSWORD_HASH_WORKERS, 1)))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.environ.get("PASSWORD_HASH_QUEUE_TIMEOUT", 2))
+
+PASSWORD_VERIFY_CACHE_SIZE = int(os.environ.get("PASSWORD_VERIFY_CACHE_SIZE", 1024))
+PASSWORD_VERIFY_CACHE_TTL = float(os.environ.get("PASSWORD_VERIFY_CACHE_TTL", 300))
+
+SALT_BYTES = 16
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool has too much queued work to accept more."""
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def current_params():
+    if PASSWORD_HASH_SCHEME == SCRYPT:
+        return (SCRYPT, PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+    return (PBKDF2, PASSWORD_HASH_ITERATIONS)
+
+
+def _derive(password, salt, params):
+    scheme = params[0]
+    if scheme == PBKDF2:
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, params[1])
+    if scheme == SCRYPT:
+        n, r, p = params[1:]
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                              maxmem=128 * r * (n + p + 2))
+    raise ValueError(f"Unknown password hash scheme: {scheme}")
+
+
+def make_hash(password, params=None):
+    params = params or current_params()
+    salt = os.urandom(SALT_BYTES)
+    digest = _derive(password, salt, params)
+    return '$'.join([str(part) for part in params] + [_b64encode(salt), _b64encode(digest)])
+
+
+def parse_hash(stored):
+    """Return (params, salt, digest), or None for a legacy plaintext value."""
+    parts = stored.split('$')
+    if parts[0] == PBKDF2 and len(parts) == 4:
+        return (PBKDF2, int(parts[1])), _b64decode(parts[2]), _b64decode(parts[3])
+    if parts[0] == SCRYPT and len(parts) == 6:
+        params = (SCRYPT, int(parts[1]), int(parts[2]), int(parts[3]))
+        return params, _b64decode(parts[4]), _b64decode(parts[5])
+    return None
+
+
+def check_hash(password, stored):
+    parsed = parse_hash(stored)
+    if parsed is None:
+        # Rows written before hashing was introduced hold the raw password
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    params, salt, digest = parsed
+    return hmac.compare_digest(_derive(password, salt, params), digest)
+
+
+def needs_rehash(stored):
+    parsed = parse_hash(stored)
+    return parsed is None or parsed[0] != current_params()
+
+
+class VerifyCache:
+    """Small LRU of recently verified (hash, password) pairs.
+
+    Entries are keyed by an HMAC under a per-process random key, so neither
+    passwords nor anything that can be checked offline is kept in memory.
+    """
+
+    def __init__(self, maxsize=PASSWORD_VERIFY_CACHE_SIZE, ttl=PASSWORD_VERIFY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _token(self, password, stored):
+        return hmac.new(self._key, f"{stored}\0{password}".encode('utf-8'), hashlib.sha256).digest()
+
+    def __contains__(self, item):
+        token = self._token(*item)
+        with self._lock:
+            expires = self._entries.get(token)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._entries[token]
+                return False
+            self._entries.move_to_end(token)
+            return True
+
+    def add(self, password, stored):
+        if self.maxsize <= 0:
+            return
+        token = self._token(password, stored)
+        with self._lock:
+            self._entries[token] = time.monotonic() + self.ttl
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class Hasher:
+    """Runs hashing on a bounded process pool so request threads only wait on it.
+
+    At most ``max_pending`` jobs may be queued or running; past that callers
+    wait up to ``queue_timeout`` seconds and then get ``HashingBusy``.
+    """
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING,
+                 queue_timeout=PASSWORD_HASH_QUEUE_TIMEOUT):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.cache = VerifyCache()
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy("Password hashing queue is full")
+        try:
+            return self._get_pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(make_hash, password)
+
+    def hash_many(self, passwords):
+        if self.workers <= 0 or len(passwords) < 2:
+            return [self.hash(password) for password in passwords]
+        # One pending slot per password, as for single hashes, so an import
+        # cannot queue more work than PASSWORD_HASH_MAX_PENDING ahead of logins
+        pool = self._get_pool()
+        futures = []
+        try:
+            for password in passwords:
+                if not self._slots.acquire(timeout=self.queue_timeout):
+                    raise HashingBusy("Password hashing queue is full")
+                try:
+                    future = pool.submit(make_hash, password)
+                except BaseException:
+                    self._slots.release()
+                    raise
+                future.add_done_callback(self._release_slot)
+                futures.append(future)
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def _release_slot(self, future):
+        self._slots.release()
+
+    def verify(self, password, stored):
+        if (password, stored) in self.cache:
+            return True
+        ok = self._run(check_hash, password, stored)
+        if ok:
+            self.cache.add(password, stored)
+        return ok
+
+    def _after_fork(self):
+        # The pool's worker processes and threads belong to the parent
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def shutdown(self):
+        if self._pool is not None:
+            # No cancel_futures, which needs Python 3.9: queued hashes still
+            # run, but nothing waits for them
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+hasher = Hasher()
+os.register_at_fork(after_in_child=hasher._after_fork)
@@ -0,0 +1,167 @@
+"""Partial updates of a User from merge patches, JSON patches or form data.
+
+    PATCH /users/<id>/update
+    Content-Type: application/merge-patch+json
+    If-Match: "3"
+
+    {"contacts": "0700000000", "gender": null}
+
+Accepted bodies:
+- application/merge-patch+json or application/json (RFC 7396): an object
+  of the fields to set, with null clearing a field
+- application/json-patch+json (RFC 6902): "add", "replace", "remove" and
+  "test" operations on top-level fields. Testing "/version" checks the version.
+- form data, as the endpoint has always taken
+
+JSON bodies must say which version of the user they were made against,
+with If-Match or a "version" member/test. Form requests may leave it out.
+If-Match takes the version, or the ETag of GET /users/<id> unchanged.
+
+Only fields whose value differs from the stored one are set on the user.
+Validators and update listeners therefore only see real changes, and
+the flush is a single UPDATE of those columns with WHERE id AND version.
+"""
+
+PATCHABLE_FIELDS = ('firstname', 'lastname', 'gender', 'email', 'password', 'role', 'contacts', 'arrivaltime')
+REQUIRED_FIELDS = frozenset(('firstname', 'lastname', 'email', 'password'))
+INTEGER_FIELDS = frozenset(('arrivaltime',))
+
+MERGE_PATCH_TYPES = ('application/merge-patch+json', 'application/json')
+JSON_PATCH_TYPE = 'application/json-patch+json'
+
+
+class PatchError(ValueError):
+    """A patch that cannot be applied; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _value(field, value, from_form=False):
+    if field not in PATCHABLE_FIELDS:
+        raise PatchError(f"Field {field!r} cannot be changed")
+    if value is None:
+        if field in REQUIRED_FIELDS:
+            raise PatchError(f"Field {field!r} cannot be null")
+        return None
+    if field in INTEGER_FIELDS:
+        if from_form:
+            try:
+                return int(value)
+            except ValueError:
+                raise PatchError(f"Field {field!r} must be an integer") from None
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise PatchError(f"Field {field!r} must be an integer")
+        return value
+    if not isinstance(value, str):
+        raise PatchError(f"Field {field!r} must be a string")
+    return value
+
+
+def _version(value):
+    text = str(value).strip()
+    # Not str.removeprefix: that needs Python 3.9, and the Pipfile pins 3.8
+    if text.startswith('W/'):
+        text = text[2:]
+    # GET /users/<id> tags are "<version>.<response cache key>"
+    text = text.strip('"').split('.', 1)[0]
+    try:
+        return int(text)
+    except ValueError:
+        raise PatchError("version must be an integer") from None
+
+
+def parse_merge_patch(document):
+    """(changes, version) from a merge patch object."""
+    if not isinstance(document, dict):
+        raise PatchError("A merge patch must be a JSON object")
+    document = dict(document)
+    version = _version(document.pop('version')) if 'version' in document else None
+    # Read-only members sent back unchanged (a GET body) are ignored
+    for field in ('id', 'last_login', 'updated_at'):
+        document.pop(field, None)
+    return {field: _value(field, value) for field, value in document.items()}, version
+
+
+def parse_json_patch(operations):
+    """(changes, tests, version) from a JSON patch operation list."""
+    if not isinstance(operations, list):
+        raise PatchError("A JSON patch must be an array of operations")
+    changes, tests, version = {}, {}, None
+    for operation in operations:
+        if not isinstance(operation, dict) or not isinstance(operation.get('path'), str):
+            raise PatchError("Each operation needs an op and a path")
+        op = operation.get('op')
+        path = operation['path']
+        if path.count('/') != 1 or not path.startswith('/'):
+            raise PatchError(f"Only top-level paths are supported, not {path!r}")
+        field = path[1:]
+        if op == 'test':
+            if field == 'version':
+                version = _version(operation.get('value'))
+            elif field == 'password':
+                raise PatchError("password cannot be tested")
+            else:
+                tests[field] = _value(field, operation.get('value'))
+        elif op in ('add', 'replace'):
+            if 'value' not in operation:
+                raise PatchError(f"{op} needs a value")
+            changes[field] = _value(field, operation['value'])
+        elif op == 'remove':
+            changes[field] = _value(field, None)
+        else:
+            raise PatchError(f"Unsupported operation {op!r}")
+    return changes, tests, version
+
+
+def read_patch(request):
+    """(changes, tests, version) from the request body and its If-Match header."""
+    if_match = request.headers.get('If-Match')
+    header_version = _version(if_match) if if_match and if_match != '*' else None
+    mimetype = request.mimetype
+    if mimetype == JSON_PATCH_TYPE:
+        changes, tests, version = parse_json_patch(request.get_json(force=True, silent=True))
+    elif mimetype in MERGE_PATCH_TYPES:
+        changes, version = parse_merge_patch(request.get_json(force=True, silent=True))
+        tests = {}
+    else:
+        form = {key: value for key, value in request.form.items() if key != 'version'}
+        changes = {field: _value(field, value, from_form=True) for field, value in form.items()}
+        if changes.get('password') == '':
+            # An empty password field means "leave it", as before
+            del changes['password']
+        tests = {}
+        version = _version(request.form['version']) if request.form.get('version') else None
+        if version is None and header_version is None:
+            return changes, tests, None
+    if version is not None and header_version is not None and version != header_version:
+        raise PatchError("If-Match and the body disagree on the version")
+    version = version if version is not None else header_version
+    if version is None and if_match != '*':
+        raise PatchError("Send the version the patch is based on, in If-Match or the body", 428)
+    return changes, tests, version
+
+
+def apply_changes(user, changes, tests=None):
+    """Set the fields of ``changes`` that differ on ``user``; return their names.
+
+    ``tests`` are JSON patch test operations, checked against the current values.
+    """
+    for field, value in (tests or {}).items():
+        if getattr(user, field) != value:
+            raise PatchError(f"Test failed: {field} is not {value!r}", 409)
+    changed = []
+    for field, value in changes.items():
+        current = getattr(user, field)
+        if field == 'email' and value is not None:
+            if current == value.lower():
+                continue
+        elif field == 'password':
+            # Stored hashed, so a password in the patch is always a change
+            pass
+        elif current == value:
+            continue
+        setattr(user, field, value)
+        changed.append(field)
+    return changed
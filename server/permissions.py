@@ -0,0 +1,264 @@
+"""Role-based permissions compiled into bitmasks.
+
+Roles grant sets of ``Permission`` flags (ROLE_GRANTS, which the
+RBAC_GRANTS config can extend or override). ``init_app`` compiles them
+once into a read-only role -> bitmask table. Roles not in the table get
+DEFAULT_GRANTS.
+
+A user's effective mask, and their department for department-scoped
+grants, is cached in their session together with the current value of
+the "rbac" version counter. The counter is bumped when a role or a
+department changes or a user is deleted. A check is then a bit test, and
+the database is only read again after the counter has moved, or once the
+entry is RBAC_MAX_AGE seconds old.
+
+The counter is kept in the response cache's version backend. With the
+redis backend every worker sees a bump straight away. With the in-memory
+one, other workers see the change once RBAC_MAX_AGE has passed.
+"""
+import enum
+import os
+import time
+import zlib
+from functools import wraps
+from types import MappingProxyType
+
+from flask import current_app, request, session
+from flask_login import current_user
+from flask_login.config import EXEMPT_METHODS
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from directory import user_directory
+from extensions import AppExtension
+from models import db, User, Employee
+from responsecache import response_cache
+
+RBAC_MAX_AGE = int(os.environ.get("RBAC_MAX_AGE", 300))
+
+VERSION_NAME = 'rbac'
+_SESSION_KEY = '_perms'
+_CHANGED_KEY = 'rbac_changed'
+
+
+class Permission(enum.IntFlag):
+    SELF_READ = 1 << 0
+    SELF_WRITE = 1 << 1
+    USER_READ = 1 << 2
+    USER_WRITE = 1 << 3
+    USER_SEARCH = 1 << 4
+    USER_IMPORT = 1 << 5
+    DEPARTMENT_READ = 1 << 6
+    REPORT_READ = 1 << 7
+    EXPORT = 1 << 8
+    OPS_READ = 1 << 9
+
+
+ALL_PERMISSIONS = Permission(sum(Permission))
+
+# "*" grants every permission
+ROLE_GRANTS = {
+    'admin': ('*',),
+    'manager': ('SELF_READ', 'SELF_WRITE', 'DEPARTMENT_READ', 'REPORT_READ'),
+    'employee': ('SELF_READ', 'SELF_WRITE'),
+}
+DEFAULT_GRANTS = ('SELF_READ', 'SELF_WRITE')
+
+
+def compile_grants(grants):
+    """Role -> bitmask for a role -> permission names mapping. Roles are case-insensitive."""
+    table = {}
+    for role, names in grants.items():
+        mask = Permission(0)
+        for name in names:
+            if name == '*':
+                mask |= ALL_PERMISSIONS
+                continue
+            try:
+                mask |= Permission[name]
+            except KeyError:
+                raise ValueError(f"Unknown permission {name!r} granted to role {role!r}") from None
+        table[role.lower()] = int(mask)
+    return MappingProxyType(table)
+
+
+class Permissions:
+    """The grant table of one app, in ``app.extensions['permissions']``."""
+
+    def __init__(self, app):
+        self.max_age = app.config.get("RBAC_MAX_AGE", RBAC_MAX_AGE)
+        self.table = compile_grants({**ROLE_GRANTS, **app.config.get("RBAC_GRANTS", {})})
+        self.default = int(compile_grants({'': app.config.get("RBAC_DEFAULT_GRANTS", DEFAULT_GRANTS)})[''])
+        # Sessions cached under a different grant table are recomputed
+        self.policy = self._fingerprint()
+
+    def _fingerprint(self):
+        return zlib.crc32(repr((sorted(self.table.items()), self.default)).encode())
+
+    def mask_for_role(self, role):
+        return self.table.get((role or '').lower(), self.default)
+
+    def role_allows(self, role, permission):
+        return self.mask_for_role(role) & permission == permission
+
+    def version(self):
+        return response_cache.backend.get_versions([VERSION_NAME])[0]
+
+    def load(self, user_id):
+        """(mask, department) for ``user_id`` from the database."""
+        row = db.session.execute(
+            db.select(User.role, Employee.department)
+            .outerjoin(Employee, Employee.id == User.id)
+            .where(User.id == user_id)
+            # Replica lag must not hand back a role that was just revoked
+            .execution_options(use_primary=True)
+        ).first()
+        if row is None:
+            return 0, None
+        return self.mask_for_role(row.role), row.department
+
+    def effective(self, user_id):
+        """(mask, department) for ``user_id``, cached in the session."""
+        version = self.version()
+        entry = session.get(_SESSION_KEY)
+        now = int(time.time())
+        if (entry and entry[0] == self.policy and entry[1] == version and entry[2] == user_id
+                and now - entry[5] < self.max_age):
+            return entry[3], entry[4]
+        mask, department = self.load(user_id)
+        session[_SESSION_KEY] = [self.policy, version, user_id, mask, department, now]
+        return mask, department
+
+    def clear(self):
+        session.pop(_SESSION_KEY, None)
+
+    def invalidate(self):
+        response_cache.backend.bump([VERSION_NAME])
+
+
+permissions = AppExtension('permissions', Permissions)
+
+
+def _forbidden():
+    # A plain dict, which both Flask and Flask-RESTful views turn into JSON
+    return {"error": "You do not have access to this resource"}, 403
+
+
+def current_grant():
+    """(user id, permission mask, department) of the caller, or None if anonymous."""
+    user_id = session.get('_user_id')
+    if user_id is None:
+        # Token and remember-me logins are only seen through Flask-Login's loaders
+        if not current_user.is_authenticated:
+            return None
+        grant = getattr(current_user, 'grant', None)
+        if grant is not None:
+            return grant
+        user_id = current_user.id
+    user_id = int(user_id)
+    return (user_id, *permissions.effective(user_id))
+
+
+def grant_allows(grant, target, permission, self_permission=None, department_permission=None):
+    """Whether ``grant`` (user id, mask, department) may act on user ``target``.
+
+    ``target`` may be None for views that do not act on one user. See
+    ``permission_required`` for the meaning of the permissions.
+    """
+    user_id, mask, department = grant
+    if mask & permission == permission:
+        return True
+    if target is None:
+        return False
+    if self_permission is not None and mask & self_permission == self_permission and target == user_id:
+        return True
+    if (department_permission is not None and department is not None
+            and mask & department_permission == department_permission):
+        entry = user_directory.get(target)
+        return entry is not None and entry['department'] == department
+    return False
+
+
+def permission_required(permission, self_permission=None, department_permission=None):
+    """Allow a view to users holding ``permission``.
+
+    With ``self_permission``, a user holding it may also act on their own
+    record, i.e. when the ``id`` view argument is their id. With
+    ``department_permission``, they may act on users in their department.
+    The department of the target is read from the in-memory directory.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if request.method in EXEMPT_METHODS or current_app.config.get("LOGIN_DISABLED"):
+                return func(*args, **kwargs)
+            grant = current_grant()
+            if grant is None:
+                return current_app.login_manager.unauthorized()
+            if grant_allows(grant, kwargs.get('id'), permission, self_permission, department_permission):
+                return func(*args, **kwargs)
+            return _forbidden()
+        return wrapper
+    return decorator
+
+
+def role_required(role):
+    """Allow a view to users holding every permission granted to ``role``."""
+    def decorator(func):
+        checked = None
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            nonlocal checked
+            if checked is None:
+                # The grant table is compiled in init_app, after views are defined
+                checked = permission_required(Permission(permissions.mask_for_role(role)))(func)
+            return checked(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _changed(db_session):
+    if db_session is not None:
+        db_session.info[_CHANGED_KEY] = True
+
+
+def _role_updated(mapper, connection, target):
+    if db.inspect(target).attrs.role.history.has_changes():
+        _changed(object_session(target))
+
+
+def _department_updated(mapper, connection, target):
+    if db.inspect(target).attrs.department.history.has_changes():
+        _changed(object_session(target))
+
+
+def _row_changed(mapper, connection, target):
+    _changed(object_session(target))
+
+
+event.listen(User, 'after_update', _role_updated)
+event.listen(User, 'after_delete', _row_changed)
+event.listen(Employee, 'after_insert', _row_changed)
+event.listen(Employee, 'after_update', _department_updated)
+event.listen(Employee, 'after_delete', _row_changed)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _after_commit(db_session):
+    if db_session.info.pop(_CHANGED_KEY, False) and response_cache.backend is not None:
+        permissions.invalidate()
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _after_rollback(db_session, previous_transaction):
+    db_session.info.pop(_CHANGED_KEY, None)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _on_orm_execute(orm_execute_state):
+    # UPDATE/DELETE statements skip the mapper events
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if any(mapper.class_ in (User, Employee) for mapper in orm_execute_state.all_mappers):
+        _changed(orm_execute_state.session)
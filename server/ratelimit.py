@@ -0,0 +1,191 @@
+"""Sliding-window rate limits for the unauthenticated endpoints.
+
+Each rule allows ``limit`` hits per ``window`` seconds per key (client IP,
+or the email being logged into). The window slides: the count is the
+current fixed window plus the previous one weighted by how much of it is
+still inside the last ``window`` seconds. That needs two counters per key
+instead of a log of timestamps.
+
+Checks run in a decorator before the view, so a rejected request costs one
+counter update and never reaches the database or the password hasher.
+
+The memory backend counts per process, so with N gunicorn workers a client
+can get up to N times the limit. Use the redis backend to share counters.
+"""
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify, request
+
+from metrics import Counter
+from redisclient import make_client
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")  # memory, redis or fakeredis
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", 100000))
+# Take the client address from X-Forwarded-For; only behind a trusted proxy
+RATE_LIMIT_TRUST_PROXY = os.environ.get("RATE_LIMIT_TRUST_PROXY", "0") == "1"
+
+TOO_MANY_REQUESTS = "Too many requests, try again later"
+
+# "<hits>/<seconds>" per rule and key
+RATE_LIMITS = {
+    'login_ip': os.environ.get("RATE_LIMIT_LOGIN_IP", "30/60"),
+    'login_email': os.environ.get("RATE_LIMIT_LOGIN_EMAIL", "5/60"),
+    'register_ip': os.environ.get("RATE_LIMIT_REGISTER_IP", "10/3600"),
+}
+
+
+def parse_limit(value):
+    hits, _, seconds = value.partition('/')
+    return int(hits), float(seconds)
+
+
+class MemoryBackend:
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, bucket, window):
+        """Count a hit in ``bucket``; return (current, previous) bucket counts."""
+        with self._lock:
+            stored_bucket, current, previous = self._windows.get(key, (bucket, 0, 0))
+            if stored_bucket != bucket:
+                previous = current if stored_bucket == bucket - 1 else 0
+                current = 0
+            current += 1
+            self._windows[key] = (bucket, current, previous)
+            if len(self._windows) > self.max_keys:
+                self._sweep(bucket)
+            return current, previous
+
+    def _sweep(self, bucket):
+        # Keys two or more windows old count as zero anyway
+        stale = [key for key, (stored, _, _) in self._windows.items() if stored < bucket - 1]
+        for key in stale:
+            del self._windows[key]
+        if len(self._windows) > self.max_keys:
+            # Still full of live keys: drop the oldest inserted
+            for key in list(self._windows)[:len(self._windows) - self.max_keys]:
+                del self._windows[key]
+
+
+class RedisBackend:
+    """Counters shared by every process, over a redis-py compatible client."""
+
+    def __init__(self, client, prefix='rate_limit:'):
+        self.client = client
+        self.prefix = prefix
+
+    def hit(self, key, bucket, window):
+        current_key = f"{self.prefix}{key}:{bucket}"
+        current = self.client.incr(current_key)
+        if current == 1:
+            self.client.expire(current_key, int(window * 2) + 1)
+        previous = self.client.get(f"{self.prefix}{key}:{bucket - 1}")
+        return current, int(previous or 0)
+
+
+def make_backend(name=RATE_LIMIT_BACKEND):
+    if name == 'memory':
+        return MemoryBackend()
+    if name in ('redis', 'fakeredis'):
+        return RedisBackend(make_client(name, RATE_LIMIT_REDIS_URL))
+    raise ValueError(f"Unknown rate limit backend: {name}")
+
+
+class RateLimiter:
+    def __init__(self, app=None, backend=None):
+        self.enabled = RATE_LIMIT_ENABLED
+        self.backend = backend
+        self.rules = {name: parse_limit(value) for name, value in RATE_LIMITS.items()}
+        self.checked = Counter('rate_limit_checked_total', "Requests checked against a rate limit.", labels=('rule',))
+        self.shed = Counter('rate_limit_rejected_total', "Requests rejected with 429.", labels=('rule',))
+        self.metrics = [self.checked, self.shed]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("RATE_LIMIT_ENABLED", self.enabled)
+        if self.backend is None:
+            self.backend = make_backend(app.config.get("RATE_LIMIT_BACKEND", RATE_LIMIT_BACKEND))
+        app.extensions['rate_limiter'] = self
+        instrumentation = app.extensions.get('instrumentation')
+        if instrumentation is not None:
+            instrumentation.metrics.extend(metric for metric in self.metrics if metric not in instrumentation.metrics)
+
+    def hit(self, rule, key):
+        """Count a hit; return seconds to wait if ``key`` is over ``rule``'s limit, else 0."""
+        limit, window = self.rules[rule]
+        now = time.time()
+        bucket = int(now // window)
+        current, previous = self.backend.hit(f"{rule}:{key}", bucket, window)
+        self.checked.inc(rule)
+        elapsed = (now % window) / window
+        if previous * (1 - elapsed) + current <= limit:
+            return 0
+        self.shed.inc(rule)
+        return max(1, int(window - now % window))
+
+    def check(self, keys):
+        """Count a hit for each (rule, key) pair, skipping None keys.
+
+        Returns seconds to wait if a key is over its rule's limit, else 0.
+        """
+        if not self.enabled:
+            return 0
+        for rule, key in keys:
+            if key is None:
+                continue
+            retry_after = self.hit(rule, key)
+            if retry_after:
+                return retry_after
+        return 0
+
+    def limit(self, *rules):
+        """Apply ``rules`` (pairs of rule name and key function) to a view."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                retry_after = self.check((rule, key_func()) for rule, key_func in rules)
+                if retry_after:
+                    response = jsonify({"error": TOO_MANY_REQUESTS})
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {
+            'checked': {labels[0]: value for labels, value in self.checked.snapshot().items()},
+            'rejected': {labels[0]: value for labels, value in self.shed.snapshot().items()},
+        }
+
+
+def ip_key(forwarded_for, remote_addr):
+    """The client address limits are keyed by, from X-Forwarded-For and the peer address."""
+    if RATE_LIMIT_TRUST_PROXY and forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return remote_addr or 'unknown'
+
+
+def email_key(email):
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def client_ip():
+    return ip_key(request.headers.get('X-Forwarded-For'), request.remote_addr)
+
+
+def request_email():
+    data = request.get_json(silent=True) if request.is_json else request.form
+    return email_key(data.get('email') if hasattr(data, 'get') else None)
+
+
+rate_limiter = RateLimiter()
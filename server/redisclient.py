@@ -0,0 +1,63 @@
+"""Redis clients shared by the response cache and the rate limiter.
+
+``make_client("redis", url)`` returns a redis-py client, imported only when
+used. ``make_client("fakeredis")`` returns a FakeRedis, an in-process stand-in
+covering the commands those backends use.
+"""
+import threading
+import time
+
+
+class FakeRedis:
+    """In-process stand-in for a redis client, covering what the redis backends use."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key):
+        with self._lock:
+            return self._live(key)
+
+    def mget(self, keys):
+        with self._lock:
+            return [self._live(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value = int(self._live(key) or 0) + amount
+            # Like redis, INCR keeps the key's expiry
+            expires = self._data[key][1] if key in self._data else None
+            self._data[key] = (str(value).encode(), expires)
+            return value
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if self._live(key) is None:
+                return False
+            self._data[key] = (self._data[key][0], time.monotonic() + seconds)
+            return True
+
+
+def make_client(name, url=None):
+    if name == 'fakeredis':
+        return FakeRedis()
+    if name == 'redis':
+        import redis
+        return redis.Redis.from_url(url)
+    raise ValueError(f"Unknown redis client: {name}")
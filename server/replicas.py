@@ -0,0 +1,248 @@
+"""Read replicas: routing read-only requests away from the primary.
+
+    DB_REPLICA_URIS=sqlite:////srv/replica1.db,sqlite:////srv/replica2.db
+
+GET, HEAD and OPTIONS requests get one replica, picked round-robin or,
+with DB_REPLICA_POLICY=least_loaded, the one with the fewest checked-out
+connections. Their ``db.session`` SELECTs then run on that replica (see
+routing.py). Writes, and every request of a client for DB_STICKY_SECONDS
+after it made a write request, stay on the primary so clients read their
+own writes. The deadline is kept in the Flask session, so it follows the
+client across workers. Clients that do not keep the session cookie only
+get the per-request guarantee.
+
+Replicas are health-checked lazily, at most every DB_REPLICA_CHECK_INTERVAL
+seconds, when one is picked. A disconnect takes a replica out of rotation
+until its next check. With no healthy replica, requests use the primary.
+
+Some reads always use the primary, whatever the routing: permission loads
+(a role change must not be undone by replica lag), and everything that
+reads through ``db.engine`` directly, such as the token denylist and the
+directory refresh. Values read from a replica are cached for at most
+DB_REPLICA_CACHE_TTL seconds, and requests on the primary skip them.
+
+For local testing, ``flask replicas sync`` copies a SQLite primary onto
+SQLite replicas with the online backup API. Add --interval to keep
+syncing, which gives the replicas a lag of up to that interval.
+"""
+import itertools
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import click
+from flask import has_app_context, request, session
+from flask.cli import AppGroup
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+
+from config import configure_sqlite, engine_options, sqlite_pragmas
+from extensions import AppExtension
+from models import db
+from routing import READ_BIND_KEY, WROTE_KEY
+
+DB_REPLICA_URIS = os.environ.get("DB_REPLICA_URIS", "")
+DB_REPLICA_POLICY = os.environ.get("DB_REPLICA_POLICY", "round_robin")  # round_robin or least_loaded
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", 5))
+DB_STICKY_SECONDS = float(os.environ.get("DB_STICKY_SECONDS", 5))
+DB_REPLICA_CACHE_TTL = float(os.environ.get("DB_REPLICA_CACHE_TTL", DB_STICKY_SECONDS))
+
+POLICIES = ('round_robin', 'least_loaded')
+READ_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+_STICKY_KEY = '_primary_until'
+
+
+def _uris(value):
+    if isinstance(value, str):
+        return [uri.strip() for uri in value.split(',') if uri.strip()]
+    return list(value)
+
+
+def _sqlite_path(url):
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        return url.database
+    return None
+
+
+class Replica:
+    __slots__ = ('name', 'engine', 'path', 'healthy', 'checked_at', 'failures', 'served')
+
+    def __init__(self, uri):
+        url = make_url(uri)
+        self.name = url.render_as_string(hide_password=True)
+        self.path = _sqlite_path(url)
+        self.engine = create_engine(url, **engine_options(uri))
+        # A write routed here by mistake fails instead of forking the data
+        configure_sqlite(self.engine, {**sqlite_pragmas(), 'query_only': 'ON'})
+        self.healthy = False
+        self.checked_at = None
+        self.failures = 0
+        self.served = 0
+        event.listen(self.engine, 'handle_error', self._on_error)
+
+    def check(self):
+        self.checked_at = time.monotonic()
+        # Connecting to a missing SQLite file would create an empty database
+        if self.path is not None and not (os.path.exists(self.path) and os.path.getsize(self.path)):
+            self.healthy = False
+        else:
+            try:
+                with self.engine.connect() as connection:
+                    connection.execute(text('SELECT 1'))
+                self.healthy = True
+            except DBAPIError:
+                self.healthy = False
+        if not self.healthy:
+            self.failures += 1
+        return self.healthy
+
+    def available(self, interval):
+        if self.checked_at is None or time.monotonic() - self.checked_at >= interval:
+            self.check()
+        return self.healthy
+
+    def load(self):
+        pool = self.engine.pool
+        return pool.checkedout() if hasattr(pool, 'checkedout') else 0
+
+    def _on_error(self, context):
+        if context.is_disconnect:
+            self.healthy = False
+            self.failures += 1
+            self.checked_at = time.monotonic()
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'healthy': self.healthy,
+            'checked_out': self.load(),
+            'served': self.served,
+            'failures': self.failures,
+        }
+
+
+class ReplicaSet:
+    """The replicas of one app, in ``app.extensions['replicas']``."""
+
+    def __init__(self, app):
+        self.app = app
+        self.policy = app.config.get("DB_REPLICA_POLICY", DB_REPLICA_POLICY)
+        if self.policy not in POLICIES:
+            raise ValueError(f"DB_REPLICA_POLICY must be one of {', '.join(POLICIES)}, not {self.policy!r}")
+        self.check_interval = app.config.get("DB_REPLICA_CHECK_INTERVAL", DB_REPLICA_CHECK_INTERVAL)
+        self.sticky_seconds = app.config.get("DB_STICKY_SECONDS", DB_STICKY_SECONDS)
+        self.cache_ttl_seconds = app.config.get("DB_REPLICA_CACHE_TTL", DB_REPLICA_CACHE_TTL)
+        self.replicas = [Replica(uri) for uri in _uris(app.config.get("DB_REPLICA_URIS", DB_REPLICA_URIS))]
+        self._counter = itertools.count()
+        if not self.replicas:
+            return
+
+        instrumentation = app.extensions.get('instrumentation')
+        if instrumentation is not None:
+            for replica in self.replicas:
+                instrumentation.instrument(replica.engine)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def choose(self):
+        """A healthy replica, or None if there is none."""
+        candidates = [replica for replica in self.replicas if replica.available(self.check_interval)]
+        if not candidates:
+            return None
+        start = next(self._counter) % len(candidates)
+        candidates = candidates[start:] + candidates[:start]
+        if self.policy == 'least_loaded':
+            # min() keeps the first of equals, so ties still rotate
+            return min(candidates, key=Replica.load)
+        return candidates[0]
+
+    def reading(self):
+        """Whether this request's reads currently go to a replica."""
+        return has_app_context() and db.session.info.get(READ_BIND_KEY) is not None
+
+    def read_engine(self):
+        """The engine this request reads from, for code that connects directly."""
+        if has_app_context():
+            return db.session.info.get(READ_BIND_KEY) or db.engine
+        return db.engine
+
+    def cache_ttl(self):
+        """TTL for caching a value read in this request: None on the primary.
+
+        A replica may trail the cache versions, so what it returns must
+        not stay cached until the next write.
+        """
+        return self.cache_ttl_seconds if self.reading() else None
+
+    def _before_request(self):
+        info = db.session.info
+        info.pop(READ_BIND_KEY, None)
+        info.pop(WROTE_KEY, None)
+        if request.method not in READ_METHODS or session.get(_STICKY_KEY, 0) > time.time():
+            return
+        replica = self.choose()
+        if replica is not None:
+            replica.served += 1
+            info[READ_BIND_KEY] = replica.engine
+
+    def _after_request(self, response):
+        wrote = db.session.info.pop(WROTE_KEY, False)
+        if response.status_code < 400 and (wrote or request.method not in READ_METHODS):
+            session[_STICKY_KEY] = round(time.time() + self.sticky_seconds, 3)
+        return response
+
+    def _teardown_request(self, exc):
+        db.session.info.pop(READ_BIND_KEY, None)
+
+    def _dispose(self):
+        # Pooled connections must not be shared with the parent process
+        for replica in self.replicas:
+            replica.engine.dispose(close=False)
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'sticky_seconds': self.sticky_seconds,
+            'replicas': [replica.stats() for replica in self.replicas],
+        }
+
+
+replicas = AppExtension('replicas', ReplicaSet, after_fork='_dispose')
+
+
+def copy_sqlite(source, target):
+    """Copy the SQLite database at path ``source`` onto ``target``, online."""
+    with closing(sqlite3.connect(source)) as src, closing(sqlite3.connect(target)) as dst:
+        src.backup(dst)
+
+
+replicas_cli = AppGroup('replicas', help="Inspect and sync read replicas.")
+
+
+@replicas_cli.command('sync')
+@click.option('--interval', type=float, default=None, help="Keep syncing every INTERVAL seconds.")
+def sync_command(interval):
+    """Replication stub: copy a SQLite primary onto the SQLite replicas."""
+    source = _sqlite_path(db.engine.url)
+    targets = [replica.path for replica in replicas.replicas if replica.path is not None]
+    if source is None or not targets:
+        raise click.ClickException("sync needs a SQLite primary and SQLite replicas in DB_REPLICA_URIS")
+    while True:
+        started = time.perf_counter()
+        for target in targets:
+            copy_sqlite(source, target)
+        click.echo(f"Synced {len(targets)} replicas in {(time.perf_counter() - started) * 1000:.1f} ms")
+        if interval is None:
+            return
+        time.sleep(interval)
+
+
+@replicas_cli.command('status')
+def status_command():
+    """Check every replica and show its health."""
+    for replica in replicas.replicas:
+        replica.check()
+        click.echo(f"{replica.name}: {'healthy' if replica.healthy else 'DOWN'}")
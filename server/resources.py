@@ -0,0 +1,582 @@
+import json
+import os
+from datetime import datetime
+from functools import wraps
+
+from flask import request, make_response, jsonify, url_for, Response, stream_with_context
+from flask.views import MethodView
+from flask_login import login_required, current_user
+from flask_restful import Api, Resource
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+
+from models import db, User, TimeEntry, UserStats
+from bulk import read_rows, import_users
+from passwords import HashingBusy
+from cache import user_cache
+from serializers import user_schema, time_entry_schema, user_stats_schema
+from rollup import daily_report
+from search import build_search, SEARCH_MAX_OFFSET
+from timeentries import time_entry_writer, clean_entries, parse_timestamp, QueueFull, TIME_ENTRY_WAIT_TIMEOUT
+from responsecache import response_cache
+from loading import get_profile, PROFILES
+from jobs import enqueue_audit
+from mail import enqueue_email
+from ratelimit import rate_limiter, client_ip, request_email
+from directory import user_directory
+from permissions import Permission, permission_required, role_required, current_grant
+from patches import PatchError, read_patch, apply_changes
+from tokens import token_auth, InvalidToken
+from replicas import replicas
+from exports import USER_COLUMNS, ATTENDANCE_COLUMNS, users_query, attendance_query, iter_csv, gzipped
+
+# Keyset pagination for list endpoints
+USERS_PAGE_LIMIT = int(os.environ.get("USERS_PAGE_LIMIT", 100))
+USERS_PAGE_MAX_LIMIT = int(os.environ.get("USERS_PAGE_MAX_LIMIT", 1000))
+USERS_STREAM_CHUNK = int(os.environ.get("USERS_STREAM_CHUNK", 1000))
+
+
+def expand_tables():
+    profile = PROFILES.get(request.args.get('expand') or 'summary', PROFILES['summary'])
+    return profile.tables
+
+
+def actor_id():
+    return getattr(current_user, 'id', None)
+
+
+def hashing_busy_unavailable(view):
+    """Answer 503 when every password hashing slot is taken.
+
+    Any resource that sets a password can raise HashingBusy. Flask-RESTful
+    turns unhandled errors into 500s, so this wraps every resource view.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            return view(*args, **kwargs)
+        except HashingBusy:
+            db.session.rollback()
+            return {"error": "Password hashing is busy, try again shortly"}, 503, {"Retry-After": "1"}
+    return wrapper
+
+
+def set_next_link(response, endpoint, cursor, **params):
+    next_url = url_for(endpoint, after=cursor, _external=True, **params)
+    response.headers['Link'] = f'<{next_url}>; rel="next"'
+    response.headers['X-Next-Cursor'] = str(cursor)
+
+
+def csv_response(pieces, filename):
+    """Stream CSV ``pieces`` as a download, gzipped if the client accepts it."""
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"', 'Vary': 'Accept-Encoding'}
+    if request.accept_encodings['gzip']:
+        pieces = gzipped(pieces)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(pieces), mimetype='text/csv', headers=headers)
+
+
+class Home(MethodView):
+    def get(self):
+        return "<h1>user application</h1>"
+    
+    def post(self):
+        return "<h1>Welcome to user applicaton!</h1>"
+# User Resources
+class Users(Resource):
+    @login_required
+    @response_cache.cached(expand_tables)
+    def get(self):
+        try:
+            limit = min(int(request.args.get('limit', USERS_PAGE_LIMIT)), USERS_PAGE_MAX_LIMIT)
+            after = int(request.args.get('after', 0))
+            profile = get_profile(request.args.get('expand'))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        if limit < 1:
+            return {"error": "limit must be positive"}, 400
+
+        if request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson':
+            if profile.name != 'summary':
+                return {"error": "expand is not supported when streaming"}, 400
+            return self.stream(after)
+
+        # Fetch one extra row to know whether another page exists
+        users = profile.fetch(
+            profile.select()
+            .filter(User.id > after)
+            .order_by(User.id)
+            .limit(limit + 1)
+        )
+        has_next = len(users) > limit
+        users = users[:limit]
+
+        response = make_response(jsonify(users), 200)
+        if has_next:
+            params = {'expand': profile.name} if profile.name != 'summary' else {}
+            set_next_link(response, 'users', users[-1]['id'], limit=limit, **params)
+        return response
+
+    def stream(self, after):
+        # Rows are fetched from the cursor in chunks and written out one
+        # line at a time, so memory does not grow with the table size.
+        query = (
+            user_schema.select()
+            .filter(User.id > after)
+            .order_by(User.id)
+            .execution_options(yield_per=USERS_STREAM_CHUNK)
+        )
+
+        def generate():
+            dump_row = user_schema.dump_row
+            for row in db.session.execute(query):
+                yield json.dumps(dump_row(row), separators=(',', ':')) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    def post(self):
+        data = request.form
+        grant = current_grant()
+        if 'role' in data and (grant is None or not grant[1] & Permission.USER_WRITE):
+            return {"error": "You cannot set a user's role"}, 403
+
+        new_user = User(
+            firstname=data['firstname'],
+            lastname=data['lastname'],
+            email=data['email'],
+            password=data['password'],
+            role=data.get('role', 'user'),
+            contacts=data.get("contacts", ''),
+        )
+        db.session.add(new_user)
+        db.session.flush()
+        enqueue_audit(db.session, 'user.created', new_user.id, actor_id())
+        db.session.commit()
+        return make_response(user_schema.dump(new_user), 201)
+
+class UserSearch(Resource):
+    @permission_required(Permission.USER_SEARCH)
+    def get(self):
+        args = {key: request.args.get(key) for key in ('role', 'department', 'position', 'name', 'email', 'sort')}
+        try:
+            limit = min(int(request.args.get('limit', USERS_PAGE_LIMIT)), USERS_PAGE_MAX_LIMIT)
+            offset = int(request.args.get('offset', 0))
+            for key in ('last_login_from', 'last_login_to'):
+                if request.args.get(key):
+                    args[key] = parse_timestamp(request.args[key])
+            query = build_search(args)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        if limit < 1 or not 0 <= offset <= SEARCH_MAX_OFFSET:
+            return {"error": f"limit must be positive and offset between 0 and {SEARCH_MAX_OFFSET}"}, 400
+
+        rows = db.session.execute(query.limit(limit + 1).offset(offset)).all()
+        response = make_response(jsonify([user_schema.dump_row(row) for row in rows[:limit]]), 200)
+        if len(rows) > limit:
+            params = {key: value for key, value in request.args.items() if key not in ('offset', 'limit')}
+            next_url = url_for('usersearch', limit=limit, offset=offset + limit, _external=True, **params)
+            response.headers['Link'] = f'<{next_url}>; rel="next"'
+        return response
+
+class UsersBulk(Resource):
+    @permission_required(Permission.USER_IMPORT)
+    def post(self):
+        try:
+            rows = read_rows(request)
+            created, errors = import_users(rows)
+        except (ValueError, UnicodeDecodeError) as e:
+            db.session.rollback()
+            return {"error": f"Could not read upload: {e}"}, 400
+        except HashingBusy:
+            db.session.rollback()
+            # Chunks before the busy one are committed; a retry reports them as registered
+            return {"error": "Password hashing is busy, try the import again shortly"}, 503, {"Retry-After": "1"}
+        status = 201 if created or not errors else 400
+        return make_response(jsonify({"created": created, "errors": errors}), status)
+
+class UserByID(Resource):
+    @role_required('admin')
+    def get(self, id):
+        user = user_cache.get(id)
+        if user is None:
+            return {"error": "User not found"}, 404
+        return make_response(user_schema.dump(user), 200)
+
+    def delete(self, id):
+        user = user_cache.get(id)
+        if user is None:
+            return {"error": "User not found"}, 404
+        db.session.delete(user)
+        db.session.commit()
+        return {}, 204
+
+class Login(Resource):
+    @rate_limiter.limit(('login_ip', client_ip), ('login_email', request_email))
+    def post(self):
+        data = request.get_json()
+        # Not get_by_email: a password changed in another worker would take
+        # up to USER_CACHE_TTL to reach this process's cache
+        user = user_cache.load_by_email(data['email'])
+        try:
+            valid = user is not None and user.check_password(data['password'])
+        except HashingBusy:
+            return {"error": "Too many login attempts in progress, try again shortly"}, 503, {"Retry-After": "1"}
+        if valid:
+            db.session.commit()
+            payload = user_schema.dump(user)
+            if token_auth.enabled:
+                payload.update(token_auth.issue(user.id))
+            return make_response(payload, 200)
+        return {"error": "Invalid credentials"}, 401
+
+class TokenRefresh(Resource):
+    def post(self):
+        data = request.get_json(silent=True) or {}
+        if not token_auth.enabled:
+            return {"error": "Token authentication is disabled"}, 404
+        try:
+            return make_response(token_auth.refresh(data.get('refresh_token') or ''), 200)
+        except InvalidToken as e:
+            return {"error": str(e)}, 401
+
+class TokenRevoke(Resource):
+    """Log out: revoke the bearer access token and, if given, the refresh token."""
+
+    @login_required
+    def post(self):
+        data = request.get_json(silent=True) or {}
+        claims = getattr(current_user, 'claims', None)
+        if claims is None:
+            return {"error": "Only token logins can be revoked"}, 400
+        refresh_claims = None
+        if data.get('refresh_token'):
+            try:
+                refresh_claims = token_auth.verify(data['refresh_token'], 'refresh')
+            except InvalidToken as e:
+                return {"error": str(e)}, 400
+            if refresh_claims['sub'] != claims['sub']:
+                return {"error": "Refresh token belongs to another user"}, 400
+        token_auth.revoke(claims)
+        if refresh_claims is not None:
+            token_auth.revoke(refresh_claims)
+        return {}, 204
+
+class UserRegister(Resource):
+    @rate_limiter.limit(('register_ip', client_ip))
+    def post(self):
+        data = request.form
+        if user_cache.get_by_email(data['email']):
+            return {"error": "Email already exists"}, 400
+        new_user = User(
+            firstname=data['firstname'],
+            lastname=data['lastname'],
+            email=data['email'],
+            password=data['password'],
+            # Never from the form: anyone could register as an admin
+            role='',
+            contacts=data.get("contacts", ''),
+        )
+        db.session.add(new_user)
+        db.session.flush()
+        # Side effects run in the job workers, queued in the same transaction
+        enqueue_audit(db.session, 'user.registered', new_user.id, new_user.id)
+        enqueue_email(db.session, new_user.email, "Welcome",
+                      f"Hi {new_user.firstname}, your account has been created.")
+        db.session.commit()
+        return make_response(user_schema.dump(new_user), 201)
+    
+
+class UserPasswordReset(Resource):
+    @login_required
+    def post(self):
+        data = request.get_json()
+        user = user_cache.get_by_email(data['email'])
+        if user:
+            user.password = data['new_password']
+            enqueue_audit(db.session, 'user.password_reset', user.id, actor_id())
+            enqueue_email(db.session, user.email, "Your password was changed",
+                          "The password for your account was just reset.")
+            try:
+                db.session.commit()
+            except StaleDataError:
+                db.session.rollback()
+                user_cache.invalidate(user.id)
+                return {"error": "The user was changed concurrently, try again"}, 409
+            return {"message": "Password reset successful"}, 200
+        return {"error": "User not found"}, 404
+
+class UserProfile(Resource):
+    @login_required
+    def get(self):
+        user = current_user
+        return make_response(user_schema.dump(user), 200)
+    
+    @permission_required(Permission.USER_READ, self_permission=Permission.SELF_READ,
+                         department_permission=Permission.DEPARTMENT_READ)
+    @response_cache.cached(expand_tables)
+    def get(self, id):
+        try:
+            profile = get_profile(request.args.get('expand'))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        if profile.name == 'summary':
+            user = user_cache.get(id)
+            payload = user_schema.dump(user) if user is not None else None
+        else:
+            payload = next(iter(profile.fetch(profile.select().where(User.id == id))), None)
+        if payload is None:
+            return {"error": "User not found"}, 404
+        response = make_response(jsonify(payload), 200)
+        # Sent back in If-Match to update this version (see UserProfileUpdate)
+        response.set_etag(str(payload['version']))
+        return response
+
+class UserProfileUpdate(Resource):
+    """Partial updates with optimistic concurrency, see patches.py."""
+
+    @permission_required(Permission.USER_WRITE, self_permission=Permission.SELF_WRITE)
+    def put(self, id):
+        return self.update(id)
+
+    @permission_required(Permission.USER_WRITE, self_permission=Permission.SELF_WRITE)
+    def patch(self, id):
+        return self.update(id)
+
+    def update(self, id):
+        try:
+            changes, tests, version = read_patch(request)
+        except PatchError as e:
+            return {"error": str(e)}, e.status
+        grant = current_grant()
+        if 'role' in changes and grant is not None and not grant[1] & Permission.USER_WRITE:
+            return {"error": "You cannot change your own role"}, 403
+
+        user = user_cache.get(id)
+        if user is None:
+            return {"error": "User not found"}, 404
+        if version is None or user.version < version:
+            # The cached copy may be behind the database; the flush would
+            # then fail its version check even without a concurrent write
+            db.session.refresh(user)
+        if version is not None and user.version != version:
+            return self.conflict(user)
+
+        try:
+            fields = apply_changes(user, changes, tests)
+        except PatchError as e:
+            db.session.rollback()
+            return {"error": str(e)}, e.status
+        except ValueError as e:
+            db.session.rollback()
+            return {"error": str(e)}, 400
+        if fields:
+            try:
+                # UPDATE of the changed columns WHERE id AND version
+                db.session.flush()
+            except StaleDataError:
+                db.session.rollback()
+                user_cache.invalidate(id)
+                return self.conflict(db.session.get(User, id))
+            except IntegrityError:
+                db.session.rollback()
+                return {"error": "Email address is already registered"}, 400
+            enqueue_audit(db.session, 'user.updated', user.id, actor_id(), fields=fields)
+        # Dumped before commit expires the instance, which would cost a reload
+        payload = user_schema.dump(user)
+        db.session.commit()
+        response = make_response(payload, 200)
+        response.headers['ETag'] = f'"{payload["version"]}"'
+        return response
+
+    def conflict(self, user):
+        if user is None:
+            return {"error": "User not found"}, 404
+        response = make_response({
+            "error": "The user was changed by someone else; reapply your changes to the current version",
+            "current": user_schema.dump(user),
+        }, 409)
+        response.headers['ETag'] = f'"{user.version}"'
+        return response
+
+
+class TimeEntries(Resource):
+    @permission_required(Permission.SELF_WRITE)
+    def post(self):
+        data = request.get_json(silent=True)
+        entries = data if isinstance(data, list) else [data]
+        rows, errors = clean_entries(entries)
+        grant = current_grant()
+        if grant is not None and not grant[1] & Permission.USER_WRITE:
+            if any(row['user_id'] != grant[0] for row in rows):
+                return {"error": "You can only record time entries for yourself"}, 403
+        if not rows:
+            return make_response(jsonify({"accepted": 0, "errors": errors}), 400)
+
+        try:
+            ticket = time_entry_writer.submit(rows)
+        except QueueFull:
+            return {"error": "Too many pending time entries, try again shortly"}, 503, {"Retry-After": "1"}
+        if request.args.get('wait', 'true').lower() in ('0', 'false', 'no'):
+            return make_response(jsonify({"accepted": len(rows), "errors": errors}), 202)
+
+        # Wait for the group commit that includes these rows
+        try:
+            ticket.wait(TIME_ENTRY_WAIT_TIMEOUT)
+        except TimeoutError:
+            return make_response(jsonify({"accepted": len(rows), "errors": errors}), 202)
+        except Exception:
+            return {"error": "Failed to record time entries"}, 500
+        return make_response(jsonify({"created": len(rows), "errors": errors}), 201)
+
+class UserTimeEntries(Resource):
+    @permission_required(Permission.USER_READ, self_permission=Permission.SELF_READ,
+                         department_permission=Permission.DEPARTMENT_READ)
+    def get(self, id):
+        try:
+            limit = min(int(request.args.get('limit', USERS_PAGE_LIMIT)), USERS_PAGE_MAX_LIMIT)
+            start = parse_timestamp(request.args['from']) if request.args.get('from') else None
+            end = parse_timestamp(request.args['to']) if request.args.get('to') else None
+            after = request.args.get('after')
+            if after:
+                after_timestamp, after_id = after.rsplit(',', 1)
+                after = (datetime.fromisoformat(after_timestamp), int(after_id))
+        except ValueError:
+            return {"error": "Invalid limit, from, to or after parameter"}, 400
+        if limit < 1:
+            return {"error": "limit must be positive"}, 400
+
+        # Filters on (user_id, timestamp) so the composite index drives the scan
+        query = time_entry_schema.select().where(TimeEntry.user_id == id)
+        if start is not None:
+            query = query.where(TimeEntry.timestamp >= start)
+        if end is not None:
+            query = query.where(TimeEntry.timestamp < end)
+        if after:
+            query = query.where(
+                db.or_(
+                    TimeEntry.timestamp > after[0],
+                    db.and_(TimeEntry.timestamp == after[0], TimeEntry.id > after[1]),
+                )
+            )
+        rows = db.session.execute(
+            query.order_by(TimeEntry.timestamp, TimeEntry.id).limit(limit + 1)
+        ).all()
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+
+        response = make_response(jsonify([time_entry_schema.dump_row(row) for row in rows]), 200)
+        if has_next:
+            cursor = f"{rows[-1].timestamp.isoformat()},{rows[-1].id}"
+            params = {key: request.args[key] for key in ('from', 'to') if request.args.get(key)}
+            set_next_link(response, 'usertimeentries', cursor, id=id, limit=limit, **params)
+        return response
+
+class AttendanceReport(Resource):
+    @permission_required(Permission.REPORT_READ)
+    def get(self):
+        try:
+            start = datetime.strptime(request.args['from'], '%Y-%m-%d').date()
+            end = datetime.strptime(request.args['to'], '%Y-%m-%d').date()
+        except KeyError:
+            return {"error": "from and to are required"}, 400
+        except ValueError:
+            return {"error": "from and to must be YYYY-MM-DD dates"}, 400
+        report = daily_report(start, end, request.args.get('department'))
+        return make_response(jsonify(report), 200)
+
+class UserStatsResource(Resource):
+    @login_required
+    @response_cache.cached('user_stats')
+    def get(self):
+        rows = db.session.execute(user_stats_schema.select().order_by(UserStats.role)).all()
+        return make_response(jsonify([user_stats_schema.dump_row(row) for row in rows]), 200)
+
+class Directory(Resource):
+    """Users with their department and position, served from the in-memory directory."""
+
+    @login_required
+    def get(self):
+        try:
+            limit = min(int(request.args.get('limit', USERS_PAGE_LIMIT)), USERS_PAGE_MAX_LIMIT)
+            after = int(request.args.get('after', 0))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        if limit < 1:
+            return {"error": "limit must be positive"}, 400
+        filters = {name: request.args[name] for name in ('role', 'department', 'position') if request.args.get(name)}
+
+        entries = user_directory.page(after, limit + 1, **filters)
+        response = make_response(jsonify(entries[:limit]), 200)
+        if len(entries) > limit:
+            set_next_link(response, 'directory', entries[limit - 1]['id'], limit=limit, **filters)
+        return response
+
+class UsersExport(Resource):
+    @permission_required(Permission.EXPORT)
+    def get(self):
+        query = users_query(request.args.get('department'), request.args.get('role'))
+        return csv_response(iter_csv(query, USER_COLUMNS, User.id), 'users.csv')
+
+class AttendanceExport(Resource):
+    @permission_required(Permission.EXPORT)
+    def get(self):
+        try:
+            start, end = (
+                datetime.strptime(request.args[name], '%Y-%m-%d').date() if request.args.get(name) else None
+                for name in ('from', 'to')
+            )
+        except ValueError:
+            return {"error": "from and to must be YYYY-MM-DD dates"}, 400
+        if start is not None and end is not None and start > end:
+            return {"error": "from must not be after to"}, 400
+        try:
+            user_id = int(request.args['user_id']) if request.args.get('user_id') else None
+        except ValueError:
+            return {"error": "user_id must be an integer"}, 400
+        query = attendance_query(start, end, request.args.get('department'), user_id)
+        return csv_response(iter_csv(query, ATTENDANCE_COLUMNS, TimeEntry.id), 'attendance.csv')
+
+class CacheStats(Resource):
+    @permission_required(Permission.OPS_READ)
+    def get(self):
+        return make_response(jsonify({
+            "users": user_cache.stats(),
+            "responses": response_cache.stats(),
+            "directory": user_directory.stats(),
+            "tokens": token_auth.stats(),
+            "replicas": replicas.stats(),
+        }), 200)
+
+class RateLimitStats(Resource):
+    @permission_required(Permission.OPS_READ)
+    def get(self):
+        return make_response(jsonify(rate_limiter.stats()), 200)
+
+
+def register_resources(app):
+    """Route every resource on ``app``."""
+    api = Api(app, decorators=[hashing_busy_unavailable])
+    api.add_resource(Users, "/users")
+    api.add_resource(UsersBulk, "/users/bulk")
+    api.add_resource(UserSearch, "/users/search")
+    api.add_resource(Login, "/login")
+    api.add_resource(TokenRefresh, "/token/refresh")
+    api.add_resource(TokenRevoke, "/token/revoke")
+    api.add_resource(UserRegister, "/register")
+    api.add_resource(UserPasswordReset, "/password/reset")
+    api.add_resource(UserProfile, "/users/<int:id>")
+    api.add_resource(UserProfileUpdate, "/users/<int:id>/update")
+    api.add_resource(TimeEntries, "/time-entries")
+    api.add_resource(UserTimeEntries, "/users/<int:id>/time-entries")
+    api.add_resource(AttendanceReport, "/reports/attendance/daily")
+    api.add_resource(UserStatsResource, "/user_stats")
+    api.add_resource(Directory, "/directory")
+    api.add_resource(UsersExport, "/exports/users.csv")
+    api.add_resource(AttendanceExport, "/exports/attendance.csv")
+    api.add_resource(CacheStats, "/cache/stats")
+    api.add_resource(RateLimitStats, "/rate-limits/stats")
+    # api.add_resource(Logout, "/logout")
+    # api.add_resource(Contacts, "/contacts")
+
+    app.add_url_rule('/', view_func=Home.as_view('home'))
+    return api
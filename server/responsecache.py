@@ -0,0 +1,222 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from functools import wraps
+
+from flask import make_response, request, Response
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+from cache import LRUCache
+from models import db
+from redisclient import make_client
+from replicas import replicas
+
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")  # memory, redis or fakeredis
+RESPONSE_CACHE_REDIS_URL = os.environ.get("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 300))
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 2048))
+
+# Tables whose writes invalidate cached responses
+VERSIONED_TABLES = ('user', 'employee', 'admin', 'leave', 'post', 'time_entry', 'user_stats')
+
+_PENDING_KEY = 'response_cache_written'
+
+
+class MemoryBackend:
+    """Per-process backend. Versions only see writes made by this process."""
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.entries = LRUCache(maxsize, ttl)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get_versions(self, names):
+        with self._lock:
+            return [self._versions.get(name, 0) for name in names]
+
+    def bump(self, names):
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.entries.set(key, value, ttl)
+
+
+class RedisBackend:
+    """Backend over any client with the redis-py get/set/mget/incr interface."""
+
+    def __init__(self, client, ttl=RESPONSE_CACHE_TTL, prefix='response_cache:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get_versions(self, names):
+        values = self.client.mget([f"{self.prefix}version:{name}" for name in names])
+        return [int(value or 0) for value in values]
+
+    def bump(self, names):
+        for name in names:
+            self.client.incr(f"{self.prefix}version:{name}")
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=math.ceil(ttl) if ttl is not None else self.ttl)
+
+
+def make_backend(name=RESPONSE_CACHE_BACKEND):
+    if name == 'memory':
+        return MemoryBackend()
+    if name in ('redis', 'fakeredis'):
+        return RedisBackend(make_client(name, RESPONSE_CACHE_REDIS_URL))
+    raise ValueError(f"Unknown response cache backend: {name}")
+
+
+class ResponseCache:
+    """Caches GET responses under strong ETags derived from table versions.
+
+    The ETag is a hash of the route, query string, caller's role, Accept
+    header and the current version of every table the view reads. A matching
+    If-None-Match is answered with 304 before the view runs, so neither the
+    database nor the serializer is touched. Versions are bumped when a
+    transaction that wrote to a versioned table commits.
+
+    With the memory backend each process keeps its own versions and only sees
+    its own writes, so it is only valid for a single process: gunicorn.conf.py
+    refuses to start several workers with it, and it cannot be combined with
+    STATS_FLUSH_MODE=job, where the job worker process writes user_stats.
+    """
+
+    def __init__(self, app=None, backend=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.backend is None:
+            self.backend = make_backend(app.config.get("RESPONSE_CACHE_BACKEND", RESPONSE_CACHE_BACKEND))
+        stats_buffer = app.extensions.get('stats_buffer')
+        if isinstance(self.backend, MemoryBackend) and stats_buffer is not None and stats_buffer.mode == "job":
+            raise RuntimeError(
+                "STATS_FLUSH_MODE=job needs RESPONSE_CACHE_BACKEND=redis; the memory backend "
+                "would never see the user_stats writes made by the job worker process"
+            )
+        app.extensions['response_cache'] = self
+
+        # Engine events see ORM flushes, ORM bulk UPDATE/DELETE and the Core
+        # inserts done by bulk import and the stats flush alike
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'after_execute', self._after_execute)
+                event.listen(engine, 'commit', self._on_commit)
+                event.listen(engine, 'rollback', self._on_rollback)
+
+    def _after_execute(self, conn, clauseelement, multiparams, params, execution_options, result):
+        if isinstance(clauseelement, UpdateBase):
+            name = clauseelement.table.name
+            if name in VERSIONED_TABLES:
+                conn.info.setdefault(_PENDING_KEY, set()).add(name)
+
+    def _on_commit(self, conn):
+        written = conn.info.pop(_PENDING_KEY, None)
+        if written:
+            self.backend.bump(sorted(written))
+
+    def _on_rollback(self, conn):
+        conn.info.pop(_PENDING_KEY, None)
+
+    def etag_for(self, tables):
+        role = getattr(current_user, 'role', None) if current_user else None
+        versions = self.backend.get_versions(tables)
+        query = '&'.join(sorted(f"{k}={v}" for k, v in request.args.items(multi=True)))
+        accept = request.headers.get('Accept', '')
+        key = f"{request.path}?{query}|{role}|{accept}|" + ','.join(f"{t}:{v}" for t, v in zip(tables, versions))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def cached(self, *tables):
+        """Cache a GET view. ``tables`` are table names, or one callable
+        returning them when they depend on the request.
+
+        A view may set an ETag of its own, such as the version a client
+        sends back in If-Match. The response then carries
+        ``"<view tag>.<key>"``, and If-None-Match is still checked on the key.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                names = tables[0]() if callable(tables[0]) else tables
+                # Versions are read before the view queries, so a stored body
+                # is never older than the versions in its key
+                key = self.etag_for(names)
+                etag = self._matching_etag(key)
+                if etag is not None:
+                    self.not_modified += 1
+                    return self._finish(Response(status=304), etag)
+
+                entry = self.backend.get(key)
+                # Entries read from a replica are only served to requests on one
+                if entry is not None and (not entry.get('replica') or replicas.reading()):
+                    self.hits += 1
+                    response = Response(entry['body'], status=200, mimetype=entry['mimetype'])
+                    response.headers.extend(entry['headers'])
+                    return self._finish(response, None if entry.get('replica') else entry.get('etag', key))
+
+                self.misses += 1
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    headers = {name: value for name, value in response.headers.items()
+                               if name in ('Link', 'X-Next-Cursor')}
+                    view_tag, _ = response.get_etag()
+                    etag = f"{view_tag}.{key}" if view_tag else key
+                    # Checked after the view: one that wrote has moved to the primary
+                    from_replica = replicas.reading()
+                    self.backend.set(key, {
+                        'body': response.get_data(as_text=True),
+                        'mimetype': response.mimetype,
+                        'headers': headers,
+                        'replica': from_replica,
+                        'etag': etag,
+                    }, replicas.cache_ttl())
+                    # A body from a replica may be older than the versions in
+                    # the key, so it must not be revalidated against them
+                    self._finish(response, None if from_replica else etag)
+                return response
+            return wrapper
+        return decorator
+
+    def _matching_etag(self, key):
+        """The If-None-Match tag that is current for ``key``, if any."""
+        if_none_match = request.if_none_match
+        if if_none_match.star_tag:
+            return key
+        for tag in if_none_match.as_set():
+            if tag == key or tag.endswith('.' + key):
+                return tag
+        return None
+
+    def _finish(self, response, etag):
+        if etag is not None:
+            response.set_etag(etag)
+        response.vary.update(('Accept', 'Cookie'))
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified}
+
+
+response_cache = ResponseCache()
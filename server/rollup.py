@@ -0,0 +1,174 @@
+from datetime import date, datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Employee, TimeEntry, AttendanceDaily
+
+# Department recorded for users without an Employee row
+NO_DEPARTMENT = ''
+
+
+def _aggregate(rows, departments):
+    totals = {}
+    for row in rows:
+        timestamp = row.get('timestamp') or datetime.utcnow()
+        key = (timestamp.date(), departments.get(row['user_id']) or NO_DEPARTMENT, row['user_id'])
+        total = totals.get(key)
+        if total is None:
+            totals[key] = [row['arrivaltime'], 1, row['arrivaltime']]
+        else:
+            total[0] = min(total[0], row['arrivaltime'])
+            total[1] += 1
+            total[2] += row['arrivaltime']
+    return [
+        {
+            'date': day, 'department': department, 'user_id': user_id,
+            'first_arrivaltime': first, 'entry_count': count, 'arrivaltime_sum': total,
+        }
+        for (day, department, user_id), (first, count, total) in totals.items()
+    ]
+
+
+def apply_entries(connection, rows):
+    """Fold newly inserted TimeEntry rows into attendance_daily.
+
+    Runs on the connection that inserted the entries, so the rollup commits
+    or rolls back with them. Costs one department lookup and one upsert
+    (executemany) per call regardless of how many rows are passed.
+    """
+    if not rows:
+        return
+    user_ids = {row['user_id'] for row in rows}
+    departments = dict(
+        connection.execute(
+            db.select(Employee.id, Employee.department).where(Employee.id.in_(user_ids))
+        ).all()
+    )
+    values = _aggregate(rows, departments)
+
+    table = AttendanceDaily.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(table)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.date, table.c.department, table.c.user_id],
+            set_={
+                'first_arrivaltime': case(
+                    (excluded.first_arrivaltime < table.c.first_arrivaltime, excluded.first_arrivaltime),
+                    else_=table.c.first_arrivaltime,
+                ),
+                'entry_count': table.c.entry_count + excluded.entry_count,
+                'arrivaltime_sum': table.c.arrivaltime_sum + excluded.arrivaltime_sum,
+            },
+        )
+        connection.execute(stmt, values)
+        return
+
+    for value in values:
+        key = (
+            (table.c.date == value['date'])
+            & (table.c.department == value['department'])
+            & (table.c.user_id == value['user_id'])
+        )
+        result = connection.execute(
+            table.update().where(key).values(
+                first_arrivaltime=case(
+                    (table.c.first_arrivaltime > value['first_arrivaltime'], value['first_arrivaltime']),
+                    else_=table.c.first_arrivaltime,
+                ),
+                entry_count=table.c.entry_count + value['entry_count'],
+                arrivaltime_sum=table.c.arrivaltime_sum + value['arrivaltime_sum'],
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**value))
+
+
+def rebuild(connection, start, end):
+    """Recompute attendance_daily for days in [start, end) from time_entry."""
+    table = AttendanceDaily.__table__
+    low = datetime.combine(start, datetime.min.time())
+    high = datetime.combine(end, datetime.min.time())
+    connection.execute(table.delete().where(table.c.date >= start, table.c.date < end))
+
+    day = func.date(TimeEntry.timestamp)
+    department = func.coalesce(Employee.department, NO_DEPARTMENT)
+    source = (
+        db.select(
+            day,
+            department,
+            TimeEntry.user_id,
+            func.min(TimeEntry.arrivaltime),
+            func.count(TimeEntry.id),
+            func.sum(TimeEntry.arrivaltime),
+        )
+        .select_from(TimeEntry)
+        .outerjoin(Employee, Employee.id == TimeEntry.user_id)
+        .where(TimeEntry.timestamp >= low, TimeEntry.timestamp < high)
+        .group_by(day, department, TimeEntry.user_id)
+    )
+    result = connection.execute(
+        table.insert().from_select(
+            ['date', 'department', 'user_id', 'first_arrivaltime', 'entry_count', 'arrivaltime_sum'],
+            source,
+        )
+    )
+    return result.rowcount
+
+
+def daily_report(start, end, department=None):
+    """Average arrival per department per day for days in [start, end]."""
+    query = (
+        db.select(
+            AttendanceDaily.date,
+            AttendanceDaily.department,
+            func.count(AttendanceDaily.user_id).label('employees'),
+            func.avg(AttendanceDaily.first_arrivaltime).label('average_arrivaltime'),
+            func.sum(AttendanceDaily.entry_count).label('entries'),
+        )
+        .where(AttendanceDaily.date >= start, AttendanceDaily.date <= end)
+        .group_by(AttendanceDaily.date, AttendanceDaily.department)
+        .order_by(AttendanceDaily.date, AttendanceDaily.department)
+    )
+    if department is not None:
+        query = query.where(AttendanceDaily.department == department)
+    return [
+        {
+            'date': row.date.isoformat(),
+            'department': row.department,
+            'employees': row.employees,
+            'average_arrivaltime': round(float(row.average_arrivaltime), 2),
+            'entries': row.entries,
+        }
+        for row in db.session.execute(query)
+    ]
+
+
+rollup_cli = AppGroup('rollup', help="Maintain the attendance_daily rollup.")
+
+
+@rollup_cli.command('rebuild')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), required=True,
+              help="First day to rebuild (YYYY-MM-DD).")
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help="Last day to rebuild, defaults to today.")
+@click.option('--chunk-days', type=int, default=1, show_default=True,
+              help="Days rebuilt per transaction.")
+def rebuild_command(since, until, chunk_days):
+    """Rebuild attendance_daily from time_entry in day-sized chunks."""
+    start = since.date()
+    end = (until.date() if until else date.today()) + timedelta(days=1)
+    step = timedelta(days=max(chunk_days, 1))
+    total = 0
+    while start < end:
+        chunk_end = min(start + step, end)
+        # One short transaction per chunk so writers aren't blocked for long
+        with db.engine.begin() as connection:
+            total += rebuild(connection, start, chunk_end)
+        start = chunk_end
+    click.echo(f"Rebuilt {total} rollup row(s)")
@@ -0,0 +1,33 @@
+"""Session that can send a request's reads to a read replica.
+
+``db.session`` is a ``RoutingSession``. When ``session.info[READ_BIND_KEY]``
+holds an engine (replicas.py sets it for read-only requests), SELECTs run
+on that engine. Everything else runs on the primary: flushes, INSERT,
+UPDATE and DELETE statements, textual SQL, SELECT ... FOR UPDATE, and
+statements with the ``use_primary`` execution option.
+
+A write also clears READ_BIND_KEY, so the rest of the session's reads go
+to the primary and see the change. WROTE_KEY records that this happened.
+"""
+from flask_sqlalchemy.session import Session
+
+READ_BIND_KEY = 'read_bind'
+WROTE_KEY = 'read_bind_wrote'
+
+
+def _replica_safe(clause):
+    if not getattr(clause, 'is_select', False):
+        return False
+    return getattr(clause, '_for_update_arg', None) is None
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get(READ_BIND_KEY)
+        if replica is not None and bind is None:
+            if self._flushing or not _replica_safe(clause):
+                del self.info[READ_BIND_KEY]
+                self.info[WROTE_KEY] = True
+            elif not clause.get_execution_options().get('use_primary'):
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
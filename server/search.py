@@ -0,0 +1,131 @@
+import re
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, text
+
+from models import db, User, Employee
+from serializers import user_schema
+
+SEARCH_MAX_OFFSET = 10000
+
+SORT_FIELDS = {
+    'id': User.id,
+    'firstname': User.firstname,
+    'lastname': User.lastname,
+    'email': User.email,
+    'role': User.role,
+    'last_login': User.last_login,
+}
+
+# External-content FTS5 index over user names, kept in sync by triggers.
+# The same DDL is applied by the search index migration.
+FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5(
+        firstname, lastname, content='user', content_rowid='id', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_ai AFTER INSERT ON "user" BEGIN
+        INSERT INTO user_fts(rowid, firstname, lastname) VALUES (new.id, new.firstname, new.lastname);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_ad AFTER DELETE ON "user" BEGIN
+        INSERT INTO user_fts(user_fts, rowid, firstname, lastname) VALUES ('delete', old.id, old.firstname, old.lastname);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_au AFTER UPDATE OF firstname, lastname ON "user" BEGIN
+        INSERT INTO user_fts(user_fts, rowid, firstname, lastname) VALUES ('delete', old.id, old.firstname, old.lastname);
+        INSERT INTO user_fts(rowid, firstname, lastname) VALUES (new.id, new.firstname, new.lastname);
+    END""",
+    "INSERT INTO user_fts(user_fts) VALUES ('rebuild')",
+]
+
+_fts_available = {}
+
+
+def fts_available():
+    engine = db.engine
+    if engine.url not in _fts_available:
+        available = False
+        if engine.dialect.name == 'sqlite':
+            with engine.connect() as connection:
+                available = connection.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_fts'")
+                ).first() is not None
+        _fts_available[engine.url] = available
+    return _fts_available[engine.url]
+
+
+def prefix_range(expr, prefix):
+    """``expr`` starts with ``prefix``, written as a range so indexes on expr are used."""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return db.and_(expr >= prefix, expr < upper)
+
+
+def _tokens(value):
+    return [token for token in re.split(r'\W+', value.lower()) if token]
+
+
+def parse_sort(value):
+    order = []
+    for field in (value or 'id').split(','):
+        field = field.strip()
+        descending = field.startswith('-')
+        column = SORT_FIELDS.get(field.lstrip('-'))
+        if column is None:
+            raise ValueError(f"Cannot sort by {field!r}")
+        order.append(column.desc() if descending else column.asc())
+    # Stable ordering for offset pagination
+    order.append(User.id.asc())
+    return order
+
+
+def build_search(args):
+    """Build the SELECT for GET /users/search from its query arguments."""
+    query = user_schema.select()
+
+    if args.get('role'):
+        query = query.where(User.role == args['role'])
+
+    if args.get('department') or args.get('position'):
+        query = query.join(Employee, Employee.id == User.id)
+        if args.get('department'):
+            query = query.where(Employee.department == args['department'])
+        if args.get('position'):
+            query = query.where(Employee.position == args['position'])
+
+    if args.get('last_login_from'):
+        query = query.where(User.last_login >= args['last_login_from'])
+    if args.get('last_login_to'):
+        query = query.where(User.last_login < args['last_login_to'])
+
+    if args.get('email'):
+        query = query.where(prefix_range(func.lower(User.email), args['email'].lower()))
+
+    tokens = _tokens(args.get('name') or '')
+    if tokens:
+        if fts_available():
+            match = ' '.join(f'"{token}"*' for token in tokens)
+            matches = text("SELECT rowid FROM user_fts WHERE user_fts MATCH :match").bindparams(match=match)
+            query = query.where(User.id.in_(matches))
+        else:
+            for token in tokens:
+                query = query.where(db.or_(
+                    prefix_range(func.lower(User.firstname), token),
+                    prefix_range(func.lower(User.lastname), token),
+                ))
+
+    return query.order_by(*parse_sort(args.get('sort')))
+
+
+search_cli = AppGroup('search', help="Maintain the user search index.")
+
+
+@search_cli.command('init-fts')
+def init_fts_command():
+    """Create and populate the SQLite FTS5 name index."""
+    if db.engine.dialect.name != 'sqlite':
+        click.echo("FTS5 index is only used on SQLite")
+        return
+    with db.engine.begin() as connection:
+        for statement in FTS_DDL:
+            connection.execute(text(statement))
+    _fts_available.clear()
+    click.echo("user_fts is ready")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Seed the database with generated users, employees and time entries.
+
+    python seed.py --users 100000 [--entries-per-user 5] [--reset]
+
+``--scale`` picks a preset (10k, 100k or 1m users). Rows go in with Core
+executemany in batches, every user shares one pre-computed password hash
+("password123" unless --password is given), and UserStats and the
+attendance rollup are rebuilt at the end so derived tables match.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from app import app
+from models import db, User, Admin, Employee, TimeEntry
+from passwords import hasher
+from rollup import rebuild
+from stats import reconcile
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+DEPARTMENTS = ('engineering', 'sales', 'support', 'finance', 'operations', 'hr')
+POSITIONS = ('junior', 'staff', 'senior', 'lead', 'manager')
+FIRSTNAMES = ('alice', 'bob', 'carol', 'dave', 'erin', 'frank', 'grace', 'heidi', 'ivan', 'judy',
+              'mallory', 'niaj', 'olivia', 'peggy', 'rupert', 'sybil', 'trent', 'victor', 'walter', 'yara')
+LASTNAMES = ('smith', 'johnson', 'williams', 'brown', 'jones', 'garcia', 'miller', 'davis', 'martin',
+             'lopez', 'wilson', 'anderson', 'thomas', 'taylor', 'moore', 'jackson', 'lee', 'white')
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(users, entries_per_user=5, admins=None, days=30, password='password123',
+         batch_size=10000, rng=None, log=print):
+    """Insert ``users`` users (ids 1..users). The first ``admins`` are admins."""
+    rng = rng or random.Random(42)
+    admins = max(1, users // 1000) if admins is None else admins
+    password_hash = hasher.hash(password)
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+
+    def user_rows():
+        for i in range(1, users + 1):
+            yield {
+                'id': i,
+                'firstname': rng.choice(FIRSTNAMES).title(),
+                'lastname': rng.choice(LASTNAMES).title(),
+                'gender': rng.choice(('f', 'm')),
+                'email': f'user{i}@example.com',
+                'password': password_hash,
+                'role': 'admin' if i <= admins else 'employee',
+                'contacts': f'07{i:08d}',
+                'arrivaltime': rng.randint(420, 600),
+                'last_login': start + timedelta(seconds=rng.randint(0, days * 86400)),
+            }
+
+    def admin_rows():
+        for i in range(1, admins + 1):
+            yield {'id': i, 'arrivaltime': rng.randint(420, 600)}
+
+    def employee_rows():
+        for i in range(admins + 1, users + 1):
+            yield {
+                'id': i,
+                'employee_id': i,
+                'salary': float(rng.randint(2000, 9000)),
+                'department': rng.choice(DEPARTMENTS),
+                'position': rng.choice(POSITIONS),
+                'arrivaltime': rng.randint(420, 600),
+            }
+
+    def time_entry_rows():
+        for i in range(1, users + 1):
+            for day in rng.sample(range(days), min(entries_per_user, days)):
+                arrival = rng.randint(420, 600)
+                yield {
+                    'user_id': i,
+                    'arrivaltime': arrival,
+                    'timestamp': start + timedelta(days=day, minutes=arrival),
+                }
+
+    tables = (
+        ('user', User.__table__, user_rows()),
+        ('admin', Admin.__table__, admin_rows()),
+        ('employee', Employee.__table__, employee_rows()),
+        ('time_entry', TimeEntry.__table__, time_entry_rows()),
+    )
+    counts = {}
+    for name, table, rows in tables:
+        began = time.perf_counter()
+        counts[name] = 0
+        for batch in _batches(rows, batch_size):
+            with db.engine.begin() as connection:
+                connection.execute(table.insert(), batch)
+            counts[name] += len(batch)
+        log(f"{name}: {counts[name]} rows in {time.perf_counter() - began:.1f}s")
+
+    with db.engine.begin() as connection:
+        reconcile(connection)
+        rebuild(connection, start.date(), (start + timedelta(days=days + 1)).date())
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default=None)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--entries-per-user', type=int, default=5)
+    parser.add_argument('--admins', type=int, default=None)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--password', default='password123')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help="Drop and recreate all tables first")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        seed(SCALES[args.scale] if args.scale else args.users, args.entries_per_user, args.admins,
+             args.days, args.password, args.batch_size, random.Random(args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+from sqlalchemy import Date, DateTime, Time, inspect
+
+from models import db, User, Admin, Employee, Leave, Post, UserStats, TimeEntry
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+class Schema:
+    """Compiles a model's columns into a plain row -> dict function once.
+
+    ``dump`` serializes ORM instances, ``dump_row`` serializes result rows
+    selected with ``schema.select()`` (or any select over ``schema.columns``)
+    without hydrating ORM objects. Relationships are only followed when named
+    in ``include``, and only by ``dump``.
+
+        user_schema = Schema(User, exclude=('password',))
+        rows = db.session.execute(user_schema.select().limit(100))
+        payload = [user_schema.dump_row(row) for row in rows]
+    """
+
+    def __init__(self, model, only=None, exclude=(), include=None):
+        self.model = model
+        mapper = inspect(model)
+        names = only or [attr.key for attr in mapper.column_attrs]
+        self.fields = [name for name in names if name not in exclude]
+        self.columns = [getattr(model, name) for name in self.fields]
+        self.include = dict(include or {})
+        self.dump = self._compile_dump(mapper)
+        self.dump_row = self._compile_dump_row(mapper)
+
+    def select(self):
+        return db.select(*self.columns)
+
+    def dump_many(self, objs):
+        dump = self.dump
+        return [dump(obj) for obj in objs]
+
+    def _converters(self, mapper):
+        converters = {}
+        for name in self.fields:
+            column_type = mapper.column_attrs[name].columns[0].type
+            if isinstance(column_type, (DateTime, Date, Time)):
+                converters[name] = '_isoformat'
+        return converters
+
+    def _compile_dump(self, mapper):
+        converters = self._converters(mapper)
+        namespace = {'_isoformat': _isoformat}
+        items = []
+        for name in self.fields:
+            expr = f"obj.{name}"
+            if name in converters:
+                expr = f"{converters[name]}({expr})"
+            items.append(f"{name!r}: {expr}")
+        for i, (name, schema) in enumerate(self.include.items()):
+            namespace[f'_dump_{i}'] = schema.dump
+            relationship = mapper.relationships[name]
+            if relationship.uselist:
+                expr = f"[_dump_{i}(item) for item in obj.{name}]"
+            else:
+                expr = f"(_dump_{i}(obj.{name}) if obj.{name} is not None else None)"
+            items.append(f"{name!r}: {expr}")
+        return self._build('dump', 'obj', items, namespace)
+
+    def _compile_dump_row(self, mapper):
+        converters = self._converters(mapper)
+        items = []
+        for i, name in enumerate(self.fields):
+            expr = f"row[{i}]"
+            if name in converters:
+                expr = f"{converters[name]}({expr})"
+            items.append(f"{name!r}: {expr}")
+        return self._build('dump_row', 'row', items, {'_isoformat': _isoformat})
+
+    def _build(self, func_name, arg, items, namespace):
+        body = ",\n        ".join(items)
+        source = f"def {func_name}({arg}):\n    return {{\n        {body}\n    }}\n"
+        exec(compile(source, f"<{self.model.__name__}Schema.{func_name}>", 'exec'), namespace)
+        return namespace[func_name]
+
+
+user_schema = Schema(User, exclude=('password',))
+employee_schema = Schema(Employee)
+user_stats_schema = Schema(UserStats)
+time_entry_schema = Schema(TimeEntry)
+user_with_employee_schema = Schema(User, exclude=('password',), include={'employee': employee_schema})
+leave_schema = Schema(Leave)
+post_schema = Schema(Post)
+admin_schema = Schema(Admin)
+# Used by the with_employee and with_recent_activity loading profiles, which
+# any logged-in user may request: salaries are only exported (EXPORT permission)
+user_with_roles_schema = Schema(User, exclude=('password',), include={
+    'employee': Schema(Employee, exclude=('salary',), include={'leaves': leave_schema}),
+    'admin': Schema(Admin, include={'leaves': leave_schema}),
+})
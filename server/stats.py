@@ -0,0 +1,237 @@
+import os
+import threading
+from collections import Counter
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import object_session
+
+from extensions import AppExtension
+from jobs import handler, enqueue
+from models import db, User, UserStats
+
+STATS_FLUSH_MODE = os.environ.get("STATS_FLUSH_MODE", "commit")  # "commit", "timer" or "job"
+STATS_FLUSH_INTERVAL = float(os.environ.get("STATS_FLUSH_INTERVAL", 5))
+
+_PENDING_KEY = 'user_stats_deltas'
+
+
+class StatsBuffer:
+    """Collects per-role user count deltas and applies them to UserStats in batches.
+
+    Deltas are recorded against the session while it flushes and only move into
+    the buffer once the transaction commits, so rolled back writes never count.
+    In "job" mode they are instead queued as a ``stats.apply`` job in the same
+    transaction, and the worker pool applies them.
+
+    One buffer per app, in ``app.extensions['stats_buffer']``; it writes to
+    that app's database only.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.mode = app.config.get("STATS_FLUSH_MODE", STATS_FLUSH_MODE)
+        self.interval = app.config.get("STATS_FLUSH_INTERVAL", STATS_FLUSH_INTERVAL)
+        self._deltas = Counter()
+        self._lock = threading.Lock()
+        self._timer = None
+        app.cli.add_command(stats_cli)
+        if self.mode == "timer":
+            self._schedule()
+
+    def add(self, deltas):
+        with self._lock:
+            self._deltas.update(deltas)
+
+    def record(self, deltas):
+        """Buffer deltas from a committed transaction."""
+        if self.mode == "job":
+            with self.app.app_context(), db.engine.begin() as connection:
+                enqueue_deltas(connection, deltas)
+            return
+        self.add(deltas)
+        if self.mode == "commit":
+            self.flush()
+
+    def drain(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, Counter()
+        return {role: delta for role, delta in deltas.items() if delta}
+
+    def flush(self):
+        deltas = self.drain()
+        if not deltas:
+            return deltas
+        try:
+            with self.app.app_context(), db.engine.begin() as connection:
+                apply_deltas(connection, deltas)
+        except Exception:
+            # Put the deltas back so the next flush retries them
+            self.add(deltas)
+            raise
+        return deltas
+
+    def _after_fork(self):
+        # Timer threads don't survive a fork; each worker runs its own
+        if self.mode == "timer":
+            self._schedule()
+
+    def _schedule(self):
+        self._timer = threading.Timer(self.interval, self._tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _tick(self):
+        try:
+            self.flush()
+        except Exception:
+            self.app.logger.exception("Failed to flush user stats")
+        finally:
+            self._schedule()
+
+
+def apply_deltas(connection, deltas):
+    """Add per-role deltas to UserStats.
+
+    Concurrent flushes from several processes may both create a role's row,
+    so SQLite and PostgreSQL upsert on the unique role index. Elsewhere it
+    is an UPDATE, then an INSERT for roles without a row.
+    """
+    if not deltas:
+        return
+    table = UserStats.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.role],
+            set_={'total_users': func.coalesce(table.c.total_users, 0) + stmt.excluded.total_users},
+        )
+        connection.execute(stmt, [
+            {'role': role, 'active_users': 0, 'total_users': delta}
+            for role, delta in sorted(deltas.items())
+        ])
+        return
+
+    for role, delta in sorted(deltas.items()):
+        result = connection.execute(
+            table.update()
+            .where(table.c.role == role)
+            .values(total_users=func.coalesce(table.c.total_users, 0) + delta)
+        )
+        if result.rowcount == 0:
+            connection.execute(
+                table.insert().values(role=role, active_users=0, total_users=delta)
+            )
+
+
+def enqueue_deltas(connection, deltas):
+    enqueue(connection, 'stats.apply', {'deltas': {role: delta for role, delta in deltas.items() if delta}})
+
+
+@handler('stats.apply')
+def apply_deltas_job(connection, payload):
+    apply_deltas(connection, payload['deltas'])
+
+
+def reconcile(connection):
+    """Rebuild UserStats from the user table."""
+    table = UserStats.__table__
+    counts = dict(
+        connection.execute(
+            db.select(User.role, func.count(User.id)).group_by(User.role)
+        ).all()
+    )
+    existing = set(connection.execute(db.select(table.c.role)).scalars())
+    for role in existing - counts.keys():
+        connection.execute(
+            table.update().where(table.c.role == role).values(total_users=0)
+        )
+    for role, total in counts.items():
+        if role in existing:
+            connection.execute(
+                table.update().where(table.c.role == role).values(total_users=total)
+            )
+        else:
+            connection.execute(
+                table.insert().values(role=role, active_users=0, total_users=total)
+            )
+    return counts
+
+
+stats_buffer = AppExtension('stats_buffer', StatsBuffer, after_fork='_after_fork', at_exit='flush')
+
+
+def _record(target, role, delta):
+    session = object_session(target)
+    if session is None or role is None:
+        return
+    session.info.setdefault(_PENDING_KEY, Counter())[role] += delta
+
+
+def record_insert(mapper, connection, target):
+    _record(target, target.role, 1)
+
+
+def record_delete(mapper, connection, target):
+    _record(target, target.role, -1)
+
+
+def record_role_change(mapper, connection, target):
+    history = inspect(target).attrs.role.history
+    if not history.has_changes():
+        return
+    for role in history.deleted:
+        _record(target, role, -1)
+    for role in history.added:
+        _record(target, role, 1)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _after_flush(session, flush_context):
+    if stats_buffer.mode != "job":
+        return
+    deltas = session.info.pop(_PENDING_KEY, None)
+    if deltas:
+        enqueue_deltas(session, deltas)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _after_commit(session):
+    deltas = session.info.pop(_PENDING_KEY, None)
+    if deltas:
+        stats_buffer.record(deltas)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _after_rollback(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
+
+
+event.listen(User, 'after_insert', record_insert)
+event.listen(User, 'after_update', record_role_change)
+event.listen(User, 'after_delete', record_delete)
+
+
+stats_cli = AppGroup('stats', help="Maintain the UserStats counters.")
+
+
+@stats_cli.command('flush')
+def flush_command():
+    """Apply buffered deltas to UserStats now."""
+    deltas = stats_buffer.flush()
+    click.echo(f"Flushed {len(deltas)} role(s)")
+
+
+@stats_cli.command('reconcile')
+def reconcile_command():
+    """Rebuild UserStats from a GROUP BY role over user."""
+    # Anything still buffered is already reflected in the user table
+    stats_buffer.drain()
+    with db.engine.begin() as connection:
+        counts = reconcile(connection)
+    for role, total in sorted(counts.items(), key=lambda item: str(item[0])):
+        click.echo(f"{role}: {total}")
@@ -0,0 +1,80 @@
+import os
+import sys
+
+import pytest
+
+# Cheap hashing, and no process pool to fork from the test runner
+os.environ.setdefault("PASSWORD_HASH_ITERATIONS", "1000")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'secret1'
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    import app as appmod
+    from app import create_app
+    from models import db
+
+    path = tmp_path_factory.mktemp('db') / 'test.db'
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{path}",
+        'TESTING': True,
+        'RATE_LIMIT_ENABLED': False,
+    })
+    with app.app_context():
+        db.create_all()
+    # Served as app.app too, for modules such as asgi.py that import it
+    appmod._app = app
+    return app
+
+
+@pytest.fixture(autouse=True)
+def _clean(app):
+    from models import db
+    from cache import user_cache
+    from directory import user_directory
+
+    # No app context stays pushed during the test: each request gets its
+    # own, as in production, so Flask-Login state does not leak between them
+    yield
+    with app.app_context():
+        with db.engine.begin() as connection:
+            for table in reversed(db.metadata.sorted_tables):
+                connection.execute(table.delete())
+        user_cache.clear()
+        # Reloaded on next use; the deletes above bypassed its listeners
+        user_directory.for_app(app).store = None
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    from models import db, User, Employee
+
+    def make_user(id, role='employee', department=None, **fields):
+        with app.app_context():
+            user = User(id=id, firstname=f"First{id}", lastname=f"Last{id}", email=f"user{id}@example.com",
+                        password=PASSWORD, role=role, **fields)
+            db.session.add(user)
+            if department is not None:
+                db.session.flush()
+                db.session.add(Employee(id=id, department=department))
+            db.session.commit()
+        return id
+    return make_user
+
+
+@pytest.fixture
+def login(client):
+    """Log ``user_id`` in; returns the bearer Authorization header."""
+    def login(user_id):
+        response = client.post('/login', json={'email': f"user{user_id}@example.com", 'password': PASSWORD})
+        assert response.status_code == 200, response.get_json()
+        return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    return login
@@ -0,0 +1,24 @@
+from app import create_app
+
+
+class Config:
+    TESTING = True
+    RATE_LIMIT_ENABLED = False
+
+
+def test_create_app_from_an_object(tmp_path):
+    Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'object.db'}"
+    app = create_app(Config)
+    assert app.config['SQLALCHEMY_DATABASE_URI'] == Config.SQLALCHEMY_DATABASE_URI
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args']['check_same_thread'] is False
+
+
+def test_engine_options_follow_the_configured_uri():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'RATE_LIMIT_ENABLED': False})
+    # In-memory SQLite takes no pool sizing
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == {'connect_args': {'check_same_thread': False}}
+
+    options = {'pool_pre_ping': True}
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SQLALCHEMY_ENGINE_OPTIONS': options,
+                      'RATE_LIMIT_ENABLED': False})
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == options
@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('aiosqlite')
+
+
+async def _call(asgi, method, path, body=None, headers=None):
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+        'headers': [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()],
+    }
+    messages = [{'type': 'http.request', 'body': json.dumps(body).encode() if body is not None else b''}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi(scope, receive, send)
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+
+def test_login_token_reaches_authenticated_endpoints(app, make_user):
+    from asgi import AsyncUserApp
+
+    make_user(1)
+    make_user(2)
+
+    async def scenario():
+        asgi = AsyncUserApp(app)
+        await asgi.startup()
+        try:
+            status, body = await _call(asgi, 'POST', '/login',
+                                       {'email': 'user1@example.com', 'password': 'secret1'})
+            assert status == 200
+            headers = {'Authorization': f"Bearer {body['access_token']}"}
+            assert (await _call(asgi, 'GET', '/users/1', headers=headers))[0] == 200
+            assert (await _call(asgi, 'GET', '/users/2', headers=headers))[0] == 403
+            assert (await _call(asgi, 'GET', '/users/1'))[0] == 401
+            status, body = await _call(asgi, 'GET', '/users/1', headers={'Authorization': 'Bearer forged.token'})
+            assert (status, body) == (401, {'error': 'Invalid token signature'})
+        finally:
+            await asgi.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_tokens_are_shared_with_the_flask_app(app, client, make_user, login):
+    from asgi import AsyncUserApp
+
+    make_user(1)
+    headers = login(1)
+
+    async def scenario():
+        asgi = AsyncUserApp(app)
+        await asgi.startup()
+        try:
+            return await _call(asgi, 'GET', '/users/1', headers=headers)
+        finally:
+            await asgi.shutdown()
+
+    status, body = asyncio.run(scenario())
+    assert status == 200
+    assert body['email'] == 'user1@example.com'
+
+
+def test_login_shares_the_flask_rate_limits(app, client, make_user, monkeypatch):
+    from asgi import AsyncUserApp
+    from ratelimit import MemoryBackend, rate_limiter
+
+    make_user(1)
+    monkeypatch.setattr(rate_limiter, 'enabled', True)
+    monkeypatch.setattr(rate_limiter, 'backend', MemoryBackend())
+    monkeypatch.setitem(rate_limiter.rules, 'login_email', (5, 60))
+    # Used up through the Flask app
+    for _ in range(5):
+        response = client.post('/login', json={'email': 'user1@example.com', 'password': 'wrong'})
+        assert response.status_code == 401
+
+    async def scenario():
+        asgi = AsyncUserApp(app)
+        await asgi.startup()
+        try:
+            return await _call(asgi, 'POST', '/login', {'email': ' User1@example.com', 'password': 'secret1'})
+        finally:
+            await asgi.shutdown()
+
+    status, body = asyncio.run(scenario())
+    assert status == 429
+    assert body == {'error': 'Too many requests, try again later'}
+
+
+def test_login_rehash_bumps_the_version(app, make_user):
+    from asgi import AsyncUserApp
+    from models import db, User
+    from passwords import PBKDF2, make_hash, needs_rehash
+
+    make_user(1)
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(db.update(User.__table__).where(User.__table__.c.id == 1)
+                               .values(password=make_hash('secret1', (PBKDF2, 500))))
+
+    async def scenario():
+        asgi = AsyncUserApp(app)
+        await asgi.startup()
+        try:
+            return await _call(asgi, 'POST', '/login', {'email': 'user1@example.com', 'password': 'secret1'})
+        finally:
+            await asgi.shutdown()
+
+    assert asyncio.run(scenario())[0] == 200
+    with app.app_context():
+        user = db.session.get(User, 1)
+        assert user.version == 2
+        assert not needs_rehash(user.password)
+
+
+def test_profile_grants_match_the_flask_app(app, client, make_user, login):
+    from asgi import AsyncUserApp
+
+    make_user(1, department='sales')
+    make_user(2, role='manager', department='sales')
+    make_user(3, role='manager', department='support')
+    paths = [('/users/1', login(2)), ('/users/1', login(3))]
+
+    async def scenario():
+        asgi = AsyncUserApp(app)
+        await asgi.startup()
+        try:
+            return [(await _call(asgi, 'GET', path, headers=headers))[0] for path, headers in paths]
+        finally:
+            await asgi.shutdown()
+
+    expected = [client.get(path, headers=headers).status_code for path, headers in paths]
+    assert expected == [200, 403]
+    assert asyncio.run(scenario()) == expected
@@ -0,0 +1,39 @@
+import json
+
+from models import db, User
+
+
+def test_import_rows_with_mixed_optional_fields(app, client, make_user, login):
+    make_user(1, role='admin')
+    rows = [
+        {'firstname': 'A', 'lastname': 'A', 'email': 'a@example.com', 'password': 'secret1', 'gender': 'female'},
+        {'firstname': 'B', 'lastname': 'B', 'email': 'b@example.com', 'password': 'secret1'},
+        {'firstname': 'C', 'lastname': 'C', 'email': 'c@example.com', 'password': 'secret1', 'arrivaltime': 900,
+         'role': 'manager'},
+    ]
+    response = client.post('/users/bulk', data=json.dumps(rows), content_type='application/json',
+                           headers=login(1))
+    assert response.status_code == 201, response.get_json()
+    assert response.get_json() == {'created': 3, 'errors': []}
+    with app.app_context():
+        users = {user.email: user for user in User.query.filter(User.id != 1)}
+        assert users['a@example.com'].gender == 'female'
+        assert users['b@example.com'].gender is None
+        assert users['b@example.com'].role == 'employee'
+        assert users['c@example.com'].arrivaltime == 900
+
+
+def test_import_csv_with_empty_optional_cells(app, client, make_user, login):
+    make_user(1, role='admin')
+    body = (
+        "firstname,lastname,email,password,gender,contacts\r\n"
+        "A,A,a@example.com,secret1,male,\r\n"
+        "B,B,b@example.com,secret1,,0700\r\n"
+        "C,C,not-an-email,secret1,,\r\n"
+    )
+    response = client.post('/users/bulk', data=body, content_type='text/csv', headers=login(1))
+    assert response.status_code == 201, response.get_json()
+    assert response.get_json() == {'created': 2, 'errors': [{'index': 2, 'error': 'Invalid email format'}]}
+    with app.app_context():
+        b = db.session.execute(db.select(User).where(User.email == 'b@example.com')).scalar_one()
+        assert (b.gender, b.contacts) == (None, '0700')
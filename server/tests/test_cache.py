@@ -0,0 +1,25 @@
+from cache import user_cache
+from models import db, User
+from passwords import hasher
+
+
+def _change_password_elsewhere(app, user_id, password):
+    # A Core UPDATE on its own connection fires none of this process's
+    # invalidation listeners, like a write made by another worker
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(db.update(User).where(User.id == user_id).values(password=hasher.hash(password)))
+
+
+def test_login_checks_password_stored_by_another_worker(app, client, make_user, login):
+    make_user(1)
+    login(1)
+    with app.app_context():
+        assert user_cache.by_email.get('user1@example.com') == 1
+
+    _change_password_elsewhere(app, 1, 'changed1')
+
+    response = client.post('/login', json={'email': 'user1@example.com', 'password': 'secret1'})
+    assert response.status_code == 401
+    response = client.post('/login', json={'email': 'user1@example.com', 'password': 'changed1'})
+    assert response.status_code == 200
@@ -0,0 +1,56 @@
+import csv
+import gzip
+import io
+
+from models import db, TimeEntry
+
+
+def _rows(response):
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+
+
+def test_users_export_streams_csv(client, make_user, login):
+    make_user(1, role='admin')
+    for id in range(2, 7):
+        make_user(id, department='sales' if id % 2 else 'ops')
+    response = client.get('/exports/users.csv', headers=login(1))
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.is_streamed
+    rows = _rows(response)
+    assert rows[0][:2] == ['id', 'firstname']
+    assert [int(row[0]) for row in rows[1:]] == [1, 2, 3, 4, 5, 6]
+
+    rows = _rows(client.get('/exports/users.csv?department=sales', headers=login(1)))
+    assert [int(row[0]) for row in rows[1:]] == [3, 5]
+
+
+def test_export_escapes_formulas_and_gzips(client, make_user, login):
+    make_user(1, role='admin', contacts='=HYPERLINK("http://example.com")')
+    response = client.get('/exports/users.csv', headers={**login(1), 'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.get_data()).decode())))
+    assert rows[0]['contacts'] == '\'=HYPERLINK("http://example.com")'
+
+
+def test_attendance_export_filters_by_date(app, client, make_user, login):
+    from datetime import datetime
+
+    make_user(1, role='admin')
+    with app.app_context():
+        db.session.add_all([
+            TimeEntry(user_id=1, arrivaltime=900, timestamp=datetime(2026, 3, 1, 9)),
+            TimeEntry(user_id=1, arrivaltime=915, timestamp=datetime(2026, 3, 2, 9)),
+            TimeEntry(user_id=1, arrivaltime=930, timestamp=datetime(2026, 3, 3, 9)),
+        ])
+        db.session.commit()
+    response = client.get('/exports/attendance.csv?from=2026-03-02&to=2026-03-02', headers=login(1))
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['arrivaltime'] for row in rows] == ['915']
+    response = client.get('/exports/attendance.csv?from=2026-03-03&to=2026-03-01', headers=login(1))
+    assert response.status_code == 400
+
+
+def test_exports_need_the_export_permission(client, make_user, login):
+    make_user(1)
+    assert client.get('/exports/users.csv', headers=login(1)).status_code == 403
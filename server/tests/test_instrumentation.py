@@ -0,0 +1,19 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from instrumentation import Instrumentation
+
+
+def test_failed_statement_leaves_no_query_start():
+    engine = create_engine('sqlite://')
+    instrumentation = Instrumentation()
+    instrumentation.instrument(engine)
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text('SELECT * FROM missing'))
+        assert connection.info['query_start'] == []
+
+        connection.execute(text('SELECT 1'))
+        assert connection.info['query_start'] == []
+    assert instrumentation.sql_statements.snapshot() == {(): 1}
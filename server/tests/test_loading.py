@@ -0,0 +1,93 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from loading import PROFILES
+from models import db, User, Employee, Leave, Post, TimeEntry
+
+USERS = 30
+PAGE_SIZES = (1, 5, 25)
+
+
+def seed(users, per_user=3):
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'firstname': f'First{i}', 'lastname': f'Last{i}', 'email': f'user{i}@example.com',
+         'password': 'x' * 60, 'role': 'employee'}
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(Employee.__table__.insert(), [
+        {'id': i, 'employee_id': i, 'department': 'ops', 'position': 'staff'} for i in range(1, users + 1)
+    ])
+    db.session.execute(Leave.__table__.insert(), [
+        {'employee_id': i, 'start_date': date(2026, 1, 1), 'end_date': date(2026, 1, 2)}
+        for i in range(1, users + 1)
+    ])
+    start = datetime(2026, 1, 1, 9)
+    db.session.execute(Post.__table__.insert(), [
+        {'user_id': i, 'title': f'Post {n}', 'content': 'text', 'date_posted': start + timedelta(days=n)}
+        for i in range(1, users + 1) for n in range(per_user)
+    ])
+    db.session.execute(TimeEntry.__table__.insert(), [
+        {'user_id': i, 'arrivaltime': 900, 'timestamp': start + timedelta(days=n)}
+        for i in range(1, users + 1) for n in range(per_user)
+    ])
+    db.session.commit()
+
+
+@pytest.mark.parametrize('profile', list(PROFILES))
+def test_query_count_does_not_grow_with_page_size(app, client, monkeypatch, profile):
+    monkeypatch.setitem(app.config, 'LOGIN_DISABLED', True)
+    with app.app_context():
+        seed(USERS)
+        engine = db.engine
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        counts = []
+        for size in PAGE_SIZES:
+            statements.clear()
+            response = client.get(f'/users?limit={size}&expand={profile}')
+            assert response.status_code == 200, response.get_json()
+            assert len(response.get_json()) == size
+            counts.append(len(statements))
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert len(set(counts)) == 1, f"{profile}: {dict(zip(PAGE_SIZES, counts))}"
+
+
+def test_expanded_profile_includes_relationships(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'LOGIN_DISABLED', True)
+    with app.app_context():
+        seed(2, per_user=8)
+    user = client.get('/users?limit=1&expand=with_recent_activity').get_json()[0]
+    assert user['employee'][0]['department'] == 'ops'
+    assert len(user['employee'][0]['leaves']) == 1
+    # Newest first, capped per user
+    dates = [post['date_posted'] for post in user['recent_posts']]
+    assert dates == sorted(dates, reverse=True) and 0 < len(dates) < 8
+
+
+def test_unknown_expand_is_rejected(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'LOGIN_DISABLED', True)
+    response = client.get('/users?expand=bad')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('profile', ['with_employee', 'with_recent_activity'])
+def test_expanded_profile_hides_salary_from_employees(app, client, make_user, login, profile):
+    make_user(1, department='ops')
+    make_user(2, department='ops')
+    with app.app_context():
+        db.session.get(Employee, 2).salary = 12345.0
+        db.session.commit()
+
+    response = client.get(f'/users?expand={profile}', headers=login(1))
+    assert response.status_code == 200, response.get_json()
+    employees = [employee for user in response.get_json() for employee in user['employee']]
+    assert [employee['department'] for employee in employees] == ['ops', 'ops']
+    assert all('salary' not in employee for employee in employees)
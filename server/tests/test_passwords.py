@@ -0,0 +1,25 @@
+import pytest
+
+from passwords import Hasher, HashingBusy, check_hash
+
+
+def test_hash_many_takes_a_slot_per_password():
+    hasher = Hasher(workers=2, max_pending=2, queue_timeout=5)
+    try:
+        passwords = [f"secret{i}" for i in range(6)]
+        hashes = hasher.hash_many(passwords)
+        assert all(check_hash(password, hashed) for password, hashed in zip(passwords, hashes))
+        # Every slot is given back once the hashes are done
+        assert all(hasher._slots.acquire(blocking=False) for _ in range(2))
+    finally:
+        hasher.shutdown()
+
+
+def test_hash_many_is_refused_while_the_queue_is_full():
+    hasher = Hasher(workers=1, max_pending=1, queue_timeout=0.05)
+    try:
+        hasher._slots.acquire()
+        with pytest.raises(HashingBusy):
+            hasher.hash_many(['secret1', 'secret2'])
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,37 @@
+import os
+import runpy
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from responsecache import MemoryBackend, ResponseCache
+
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+
+
+def _server(workers):
+    return SimpleNamespace(cfg=SimpleNamespace(workers=workers))
+
+
+def test_gunicorn_refuses_several_workers_on_memory_backend(monkeypatch):
+    monkeypatch.delenv('RESPONSE_CACHE_BACKEND', raising=False)
+    monkeypatch.delenv('GUNICORN_WORKERS', raising=False)
+    conf = runpy.run_path(GUNICORN_CONF)
+    # A plain `gunicorn app:app` starts
+    assert conf['workers'] == 1
+    conf['on_starting'](_server(conf['workers']))
+    with pytest.raises(RuntimeError, match='RESPONSE_CACHE_BACKEND=redis'):
+        conf['on_starting'](_server(4))
+
+    monkeypatch.setenv('RESPONSE_CACHE_BACKEND', 'redis')
+    conf = runpy.run_path(GUNICORN_CONF)
+    assert conf['workers'] > 1
+    conf['on_starting'](_server(conf['workers']))
+
+
+def test_job_stats_mode_refuses_memory_backend():
+    app = Flask(__name__)
+    app.extensions['stats_buffer'] = SimpleNamespace(mode='job')
+    with pytest.raises(RuntimeError, match='STATS_FLUSH_MODE=job'):
+        ResponseCache(app, backend=MemoryBackend())
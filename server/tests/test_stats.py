@@ -0,0 +1,40 @@
+from models import db, UserStats
+from stats import apply_deltas
+
+
+def _totals(app):
+    with app.app_context():
+        return {row.role: row.total_users for row in db.session.execute(db.select(UserStats)).scalars()}
+
+
+def test_apply_deltas_keeps_one_row_per_role(app):
+    with app.app_context():
+        with db.engine.begin() as connection:
+            apply_deltas(connection, {'admin': 1, 'employee': 2})
+        with db.engine.begin() as connection:
+            apply_deltas(connection, {'employee': 3, 'manager': 1})
+            apply_deltas(connection, {'employee': -1})
+    assert _totals(app) == {'admin': 1, 'employee': 4, 'manager': 1}
+
+
+def test_created_users_are_counted(app, make_user):
+    make_user(1, role='admin')
+    make_user(2)
+    make_user(3)
+    assert _totals(app) == {'admin': 1, 'employee': 2}
+
+
+def test_each_app_writes_its_own_stats(app, tmp_path, make_user):
+    from app import create_app
+
+    other = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'other.db'}",
+        'TESTING': True,
+        'RATE_LIMIT_ENABLED': False,
+    })
+    with other.app_context():
+        db.create_all()
+
+    make_user(1)
+    assert _totals(app) == {'employee': 1}
+    assert _totals(other) == {}
@@ -0,0 +1,35 @@
+def test_user_time_entries_are_gated_like_the_user(client, make_user, login):
+    make_user(1, role='admin')
+    make_user(2, department='sales')
+    make_user(3, department='sales')
+    make_user(4, role='manager', department='sales')
+    make_user(5, role='manager', department='ops')
+
+    assert client.get('/users/2/time-entries', headers=login(2)).status_code == 200
+    assert client.get('/users/2/time-entries', headers=login(3)).status_code == 403
+    assert client.get('/users/2/time-entries', headers=login(4)).status_code == 200
+    assert client.get('/users/2/time-entries', headers=login(5)).status_code == 403
+    assert client.get('/users/2/time-entries', headers=login(1)).status_code == 200
+    # Anonymous callers are sent to the login view
+    assert client.get('/users/2/time-entries').status_code == 302
+
+
+def test_employees_only_clock_in_for_themselves(client, make_user, login):
+    make_user(1, role='admin')
+    make_user(2)
+    make_user(3)
+    employee = login(2)
+
+    response = client.post('/time-entries', json={'user_id': 3, 'arrivaltime': 900}, headers=employee)
+    assert response.status_code == 403
+    response = client.post('/time-entries', json=[{'user_id': 2, 'arrivaltime': 900},
+                                                  {'user_id': 3, 'arrivaltime': 900}], headers=employee)
+    assert response.status_code == 403
+
+    response = client.post('/time-entries', json={'user_id': 2, 'arrivaltime': 900}, headers=employee)
+    assert response.status_code == 201, response.get_json()
+    response = client.post('/time-entries', json={'user_id': 3, 'arrivaltime': 915}, headers=login(1))
+    assert response.status_code == 201, response.get_json()
+
+    entries = client.get('/users/2/time-entries', headers=employee).get_json()
+    assert [entry['arrivaltime'] for entry in entries] == [900]
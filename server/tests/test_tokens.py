@@ -0,0 +1,57 @@
+from models import db, User
+
+
+def test_role_change_keeps_other_tokens_valid(app, client, make_user, login):
+    make_user(1, role='admin')
+    make_user(2)
+    admin = login(1)
+    employee = login(2)
+
+    response = client.patch('/users/2/update', json={'role': 'manager'}, headers={**admin, 'If-Match': '"1"'})
+    assert response.status_code == 200, response.get_json()
+
+    # Neither the admin who made the change nor the user it applies to is logged out
+    assert client.get('/cache/stats', headers=admin).status_code == 200
+    assert client.get('/users/2', headers=employee).status_code == 200
+
+
+def test_role_change_applies_to_existing_token(app, client, make_user, login):
+    make_user(1, role='admin')
+    headers = login(1)
+    assert client.get('/cache/stats', headers=headers).status_code == 200
+
+    with app.app_context():
+        db.session.get(User, 1).role = 'employee'
+        db.session.commit()
+
+    assert client.get('/cache/stats', headers=headers).status_code == 403
+
+
+def test_deleted_user_token_is_rejected(app, client, make_user, login):
+    make_user(1, role='admin')
+    make_user(2)
+    headers = login(2)
+    with app.app_context():
+        db.session.delete(db.session.get(User, 2))
+        db.session.commit()
+
+    response = client.get('/users/2', headers=headers)
+    assert response.status_code == 401
+    assert response.get_json() == {'error': 'User no longer exists'}
+
+
+def test_refresh_token_is_single_use(client, make_user):
+    make_user(1)
+    tokens = client.post('/login', json={'email': 'user1@example.com', 'password': 'secret1'}).get_json()
+    response = client.post('/token/refresh', json={'refresh_token': tokens['refresh_token']})
+    assert response.status_code == 200
+    response = client.post('/token/refresh', json={'refresh_token': tokens['refresh_token']})
+    assert response.status_code == 401
+    assert response.get_json() == {'error': 'Token revoked'}
+
+
+def test_revoked_access_token_is_rejected(client, make_user, login):
+    make_user(1)
+    headers = login(1)
+    assert client.post('/token/revoke', headers=headers).status_code == 204
+    assert client.get('/users/1', headers=headers).status_code == 401
@@ -0,0 +1,176 @@
+from models import db, User
+
+
+def test_users_pages_with_a_next_link(client, make_user, login):
+    for id in range(1, 6):
+        make_user(id, role='admin' if id == 1 else 'employee')
+    headers = login(1)
+    response = client.get('/users?limit=2', headers=headers)
+    assert [user['id'] for user in response.get_json()] == [1, 2]
+    assert 'after=2' in response.headers['Link']
+    response = client.get('/users?limit=2&after=4', headers=headers)
+    assert [user['id'] for user in response.get_json()] == [5]
+    assert 'Link' not in response.headers
+
+
+def test_profile_is_gated_by_permission(client, make_user, login):
+    make_user(1, role='admin')
+    make_user(2, department='sales')
+    make_user(3, department='sales')
+    make_user(4, role='manager', department='sales')
+    assert client.get('/users/2', headers=login(2)).status_code == 200
+    assert client.get('/users/2', headers=login(3)).status_code == 403
+    assert client.get('/users/2', headers=login(4)).status_code == 200
+    assert client.get('/users/99', headers=login(1)).status_code == 404
+
+
+def test_merge_patch_needs_the_current_version(client, make_user, login):
+    make_user(1)
+    headers = login(1)
+    patch = {'contacts': '0700000000'}
+
+    response = client.patch('/users/1/update', json=patch, headers=headers)
+    assert response.status_code == 428
+
+    response = client.patch('/users/1/update', json=patch, headers={**headers, 'If-Match': '"1"'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"2"'
+    assert response.get_json()['contacts'] == '0700000000'
+
+    # Made against version 1, which has been replaced
+    response = client.patch('/users/1/update', json={'contacts': 'lost'}, headers={**headers, 'If-Match': '"1"'})
+    assert response.status_code == 409
+    assert response.headers['ETag'] == '"2"'
+    assert response.get_json()['current']['contacts'] == '0700000000'
+
+
+def test_patch_accepts_the_etag_of_get(client, make_user, login):
+    make_user(1)
+    headers = login(1)
+    etag = client.get('/users/1', headers=headers).headers['ETag']
+    assert client.get('/users/1', headers={**headers, 'If-None-Match': etag}).status_code == 304
+
+    response = client.patch('/users/1/update', json={'contacts': 'new'}, headers={**headers, 'If-Match': etag})
+    assert response.status_code == 200, response.get_json()
+
+    response = client.get('/users/1', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['contacts'] == 'new'
+    # The old tag names a replaced version
+    response = client.patch('/users/1/update', json={'contacts': 'lost'}, headers={**headers, 'If-Match': etag})
+    assert response.status_code == 409
+    response = client.patch('/users/1/update', json={'contacts': 'kept'},
+                            headers={**headers, 'If-Match': client.get('/users/1', headers=headers).headers['ETag']})
+    assert response.status_code == 200
+
+def test_update_rejects_a_concurrent_write(app, client, make_user, login):
+    make_user(1)
+    headers = login(1)
+    assert client.get('/users/1', headers=headers).status_code == 200
+    with app.app_context():
+        # Another worker's write, which this process's caches have not seen
+        with db.engine.begin() as connection:
+            connection.execute(db.update(User.__table__).where(User.__table__.c.id == 1)
+                               .values(contacts='theirs', version=2))
+    response = client.patch('/users/1/update', json={'contacts': 'mine'}, headers={**headers, 'If-Match': '"1"'})
+    assert response.status_code == 409
+    assert response.get_json()['current']['contacts'] == 'theirs'
+
+
+def test_json_patch_test_operation(client, make_user, login):
+    make_user(1)
+    headers = {**login(1), 'Content-Type': 'application/json-patch+json'}
+    operations = [
+        {'op': 'test', 'path': '/version', 'value': 1},
+        {'op': 'test', 'path': '/firstname', 'value': 'Someone else'},
+        {'op': 'replace', 'path': '/lastname', 'value': 'New'},
+    ]
+    response = client.patch('/users/1/update', json=operations, headers=headers)
+    assert response.status_code == 409
+    operations[1]['value'] = 'First1'
+    response = client.patch('/users/1/update', json=operations, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['lastname'] == 'New'
+
+
+def test_employees_cannot_change_their_role(client, make_user, login):
+    make_user(1)
+    response = client.patch('/users/1/update', json={'role': 'admin'}, headers={**login(1), 'If-Match': '"1"'})
+    assert response.status_code == 403
+
+
+def test_search_filters_and_sorts(client, make_user, login):
+    make_user(1, role='admin')
+    make_user(2, department='sales')
+    make_user(3, department='ops')
+    make_user(4, department='sales')
+    headers = login(1)
+    response = client.get('/users/search?department=sales&sort=-id', headers=headers)
+    assert response.status_code == 200
+    assert [user['id'] for user in response.get_json()] == [4, 2]
+    response = client.get('/users/search?email=user3', headers=headers)
+    assert [user['id'] for user in response.get_json()] == [3]
+    assert client.get('/users/search?sort=bad', headers=headers).status_code == 400
+    assert client.get('/users/search', headers=login(2)).status_code == 403
+
+
+def test_directory_lists_departments(client, make_user, login):
+    make_user(1, role='admin')
+    make_user(2, department='sales')
+    make_user(3, department='ops')
+    response = client.get('/directory?department=sales', headers=login(3))
+    assert response.status_code == 200
+    assert [(entry['id'], entry['department']) for entry in response.get_json()] == [(2, 'sales')]
+
+
+def test_register_answers_503_while_hashing_is_busy(app, client, monkeypatch):
+    from passwords import hasher, HashingBusy
+
+    def busy(password):
+        raise HashingBusy("Password hashing queue is full")
+
+    monkeypatch.setattr(hasher, 'hash', busy)
+    response = client.post('/register', data={'firstname': 'Ann', 'lastname': 'Lee',
+                                               'email': 'ann@example.com', 'password': 'secret1'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    with app.app_context():
+        assert User.query.filter_by(email='ann@example.com').first() is None
+
+
+def test_login_rehash_bumps_the_version(app, client, make_user):
+    from passwords import PBKDF2, make_hash, needs_rehash
+
+    make_user(1)
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(db.update(User.__table__).where(User.__table__.c.id == 1)
+                               .values(password=make_hash('secret1', (PBKDF2, 500))))
+        version = db.session.get(User, 1).version
+
+    response = client.post('/login', json={'email': 'user1@example.com', 'password': 'secret1'})
+    assert response.status_code == 200
+    with app.app_context():
+        user = db.session.get(User, 1)
+        assert user.version == version + 1
+        assert not needs_rehash(user.password)
+        assert user.check_password('secret1')
+
+
+def test_registration_ignores_the_role(app, client):
+    response = client.post('/register', data={'firstname': 'Ann', 'lastname': 'Lee', 'email': 'ann@example.com',
+                                              'password': 'secret1', 'role': 'admin'})
+    assert response.status_code == 201
+    with app.app_context():
+        assert User.query.filter_by(email='ann@example.com').one().role == ''
+
+
+def test_only_user_writers_set_the_role_of_new_users(app, client, make_user, login):
+    make_user(1, role='admin')
+    make_user(2)
+    form = {'firstname': 'Ann', 'lastname': 'Lee', 'email': 'ann@example.com', 'password': 'secret1', 'role': 'admin'}
+    assert client.post('/users', data=form).status_code == 403
+    assert client.post('/users', data=form, headers=login(2)).status_code == 403
+    assert client.post('/users', data=form, headers=login(1)).status_code == 201
+    with app.app_context():
+        assert User.query.filter_by(email='ann@example.com').one().role == 'admin'
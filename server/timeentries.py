@@ -0,0 +1,190 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import event, inspect
+
+from extensions import AppExtension
+from models import db, User, TimeEntry
+from rollup import apply_entries
+
+TIME_ENTRY_BATCH_SIZE = int(os.environ.get("TIME_ENTRY_BATCH_SIZE", 500))
+TIME_ENTRY_MAX_DELAY = float(os.environ.get("TIME_ENTRY_MAX_DELAY", 0.05))
+TIME_ENTRY_QUEUE_SIZE = int(os.environ.get("TIME_ENTRY_QUEUE_SIZE", 10000))
+TIME_ENTRY_WAIT_TIMEOUT = float(os.environ.get("TIME_ENTRY_WAIT_TIMEOUT", 5))
+
+
+class QueueFull(Exception):
+    """Raised when the write queue cannot take more entries."""
+
+
+class Ticket:
+    """Lets a request wait until the batch holding its entries is committed."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Time entries were not written in time")
+        if self.error is not None:
+            raise self.error
+
+    def finish(self, error=None):
+        self.error = error
+        self._done.set()
+
+
+class TimeEntryWriter:
+    """Group-commits queued time entries from a background thread.
+
+    The writer takes whatever is queued, up to ``batch_size`` rows or
+    ``max_delay`` seconds after the first one, and inserts it with one
+    executemany in one transaction. Requests arriving together therefore
+    share a single commit.
+
+    One writer per app, in ``app.extensions['time_entry_writer']``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config.get("TIME_ENTRY_BATCH_SIZE", TIME_ENTRY_BATCH_SIZE)
+        self.max_delay = app.config.get("TIME_ENTRY_MAX_DELAY", TIME_ENTRY_MAX_DELAY)
+        self._queue = queue.Queue(maxsize=TIME_ENTRY_QUEUE_SIZE)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, rows):
+        self._ensure_started()
+        ticket = Ticket(rows)
+        try:
+            self._queue.put_nowait(ticket)
+        except queue.Full:
+            raise QueueFull("Time entry queue is full")
+        return ticket
+
+    def close(self, timeout=5):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _ensure_started(self):
+        # Threads don't survive a fork, so each worker process starts its own
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='time-entry-writer', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            ticket = self._queue.get()
+            if ticket is None:
+                return
+            batch = [ticket]
+            rows = len(ticket.rows)
+            deadline = time.monotonic() + self.max_delay
+            stop = False
+            while rows < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    ticket = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if ticket is None:
+                    stop = True
+                    break
+                batch.append(ticket)
+                rows += len(ticket.rows)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        rows = [row for ticket in batch for row in ticket.rows]
+        try:
+            with self.app.app_context(), db.engine.begin() as connection:
+                insert_entries(connection, rows)
+        except Exception as e:
+            self.app.logger.exception("Failed to write %d time entries", len(rows))
+            for ticket in batch:
+                ticket.finish(e)
+            return
+        for ticket in batch:
+            ticket.finish()
+
+
+time_entry_writer = AppExtension('time_entry_writer', TimeEntryWriter, at_exit='close')
+
+
+def insert_entries(connection, rows):
+    """Insert TimeEntry rows and fold them into the daily rollup."""
+    connection.execute(TimeEntry.__table__.insert(), rows)
+    apply_entries(connection, rows)
+
+
+def log_arrivaltime(mapper, connection, target):
+    # Written on the flushing connection so it shares the user's transaction
+    # instead of committing a separate one.
+    if target.arrivaltime and inspect(target).attrs.arrivaltime.history.has_changes():
+        insert_entries(connection, [{
+            'user_id': target.id,
+            'arrivaltime': target.arrivaltime,
+            'timestamp': datetime.utcnow(),
+        }])
+
+
+event.listen(User, 'before_update', log_arrivaltime)
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp into the naive UTC datetimes the table stores."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def clean_entries(entries):
+    """Validate clock-in payloads, returning (rows, errors).
+
+    Unknown user ids are found with a single ``IN (...)`` lookup.
+    """
+    rows = []
+    errors = []
+    for index, entry in enumerate(entries):
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError("Entry is not an object")
+            row = {
+                'user_id': int(entry['user_id']),
+                'arrivaltime': int(entry['arrivaltime']),
+                'timestamp': parse_timestamp(entry['timestamp']) if entry.get('timestamp') else datetime.utcnow(),
+            }
+        except KeyError as e:
+            errors.append({'index': index, 'error': f"Missing required field: {e.args[0]}"})
+            continue
+        except (TypeError, ValueError) as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        rows.append((index, row))
+
+    user_ids = {row['user_id'] for _, row in rows}
+    if user_ids:
+        known = set(db.session.execute(db.select(User.id).where(User.id.in_(user_ids))).scalars())
+        for index, row in rows:
+            if row['user_id'] not in known:
+                errors.append({'index': index, 'error': "User not found"})
+        rows = [(index, row) for index, row in rows if row['user_id'] in known]
+
+    errors.sort(key=lambda error: error['index'])
+    return [row for _, row in rows], errors
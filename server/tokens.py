@@ -0,0 +1,328 @@
+"""Signed access and refresh tokens.
+
+    Authorization: Bearer <access token>
+
+A token is ``<payload>.<signature>``. The payload is base64url JSON
+claims, and the signature is an HMAC-SHA256 of it, keyed from TOKEN_SECRET
+(SECRET_KEY by default). Access tokens last TOKEN_ACCESS_TTL seconds and
+carry only the user's id. A request authenticated by one needs no query:
+a constant-time signature comparison, an expiry check, a Bloom filter
+probe, and a lookup of the user's current role and department in the
+in-memory directory (directory.py). The directory follows writes from
+every worker within DIRECTORY_REFRESH_INTERVAL seconds, so a role or
+department change applies to tokens already issued, without rejecting
+them. A deleted user's tokens stop working straight away in the worker
+that deleted them, and in the others at the next directory reload.
+
+Refresh tokens last TOKEN_REFRESH_TTL seconds and are single use. Each
+refresh revokes the token it was given and returns a new pair.
+
+Revoked token ids are stored in the revoked_token table and in a Bloom
+filter held by each worker. A miss in the filter, which is almost every
+probe, is final. A hit is confirmed against the table, so a false
+positive costs one query rather than a wrongly rejected token. Each
+worker picks up other workers' revocations every TOKEN_DENYLIST_REFRESH
+seconds. Every TOKEN_DENYLIST_RELOAD seconds it rebuilds the filter
+without the expired entries.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import math
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import abort, make_response
+from flask.cli import AppGroup
+from flask_login import UserMixin
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+
+from directory import user_directory
+from extensions import AppExtension
+from models import db, User, RevokedToken
+from permissions import permissions
+
+TOKEN_AUTH_ENABLED = os.environ.get("TOKEN_AUTH_ENABLED", "1") == "1"
+TOKEN_SECRET = os.environ.get("TOKEN_SECRET")
+TOKEN_ACCESS_TTL = int(os.environ.get("TOKEN_ACCESS_TTL", 15 * 60))
+TOKEN_REFRESH_TTL = int(os.environ.get("TOKEN_REFRESH_TTL", 14 * 24 * 3600))
+TOKEN_DENYLIST_CAPACITY = int(os.environ.get("TOKEN_DENYLIST_CAPACITY", 100_000))
+TOKEN_DENYLIST_ERROR_RATE = float(os.environ.get("TOKEN_DENYLIST_ERROR_RATE", 0.001))
+TOKEN_DENYLIST_REFRESH = float(os.environ.get("TOKEN_DENYLIST_REFRESH", 5))
+TOKEN_DENYLIST_RELOAD = float(os.environ.get("TOKEN_DENYLIST_RELOAD", 3600))
+
+# Look-back for revocations committed out of revoked_at order
+_REFRESH_OVERLAP = timedelta(seconds=5)
+
+
+class InvalidToken(Exception):
+    """The token is malformed, forged, expired, revoked or stale."""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+class BloomFilter:
+    """Bit array sized for ``capacity`` items at a false positive rate of ``error_rate``."""
+
+    __slots__ = ('size', 'hashes', 'bits', 'count')
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class DenyList:
+    """Revoked token ids: the revoked_token table, mirrored into a per-process Bloom filter."""
+
+    def __init__(self, capacity=TOKEN_DENYLIST_CAPACITY, error_rate=TOKEN_DENYLIST_ERROR_RATE,
+                 refresh_interval=TOKEN_DENYLIST_REFRESH, reload_interval=TOKEN_DENYLIST_RELOAD):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.reload_interval = reload_interval
+        self.bloom = None
+        self.high_water = None
+        self.checked = 0.0
+        self.loaded = 0.0
+        self.lookups = 0
+        self.positives = 0
+        self.false_positives = 0
+        self._init_locks()
+
+    def _init_locks(self):
+        self._refresh_lock = threading.Lock()
+
+    def reload(self):
+        table = RevokedToken.__table__
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                select(table.c.jti, table.c.revoked_at).where(table.c.expires_at > datetime.utcnow())
+            ).all()
+        bloom = BloomFilter(max(self.capacity, 2 * len(rows)), self.error_rate)
+        for row in rows:
+            bloom.add(row.jti)
+        self.bloom = bloom
+        self.high_water = max((row.revoked_at for row in rows), default=None)
+        self.loaded = time.monotonic()
+
+    def refresh(self):
+        table = RevokedToken.__table__
+        query = select(table.c.jti, table.c.revoked_at)
+        if self.high_water is not None:
+            query = query.where(table.c.revoked_at > self.high_water - _REFRESH_OVERLAP)
+        with db.engine.connect() as connection:
+            rows = connection.execute(query).all()
+        for row in rows:
+            self.bloom.add(row.jti)
+            if self.high_water is None or row.revoked_at > self.high_water:
+                self.high_water = row.revoked_at
+
+    def ensure_fresh(self):
+        now = time.monotonic()
+        if self.bloom is not None and now - self.checked < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=self.bloom is None):
+            return
+        try:
+            if self.bloom is None or now - self.loaded >= self.reload_interval:
+                self.reload()
+            else:
+                self.refresh()
+            self.checked = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def revoke(self, jti, user_id, expires_at):
+        """Deny ``jti``. False if it already was, which makes refresh tokens single use."""
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(RevokedToken.__table__.insert().values(
+                    jti=jti, user_id=user_id, expires_at=expires_at, revoked_at=datetime.utcnow(),
+                ))
+        except IntegrityError:
+            return False
+        if self.bloom is not None:
+            self.bloom.add(jti)
+        return True
+
+    def is_revoked(self, jti):
+        self.ensure_fresh()
+        self.lookups += 1
+        if jti not in self.bloom:
+            return False
+        self.positives += 1
+        with db.engine.connect() as connection:
+            revoked = connection.execute(
+                select(1).where(RevokedToken.__table__.c.jti == jti)
+            ).first() is not None
+        if not revoked:
+            self.false_positives += 1
+        return revoked
+
+    def stats(self):
+        return {
+            'entries': self.bloom.count if self.bloom is not None else None,
+            'bits': self.bloom.size if self.bloom is not None else None,
+            'hashes': self.bloom.hashes if self.bloom is not None else None,
+            'lookups': self.lookups,
+            'positives': self.positives,
+            'false_positives': self.false_positives,
+        }
+
+
+class TokenUser(UserMixin):
+    """The caller of a token-authenticated request: its claims and directory entry."""
+
+    def __init__(self, claims, entry):
+        self.id = claims['sub']
+        self.role = entry['role']
+        self.department = entry['department']
+        self.claims = claims
+        # (user id, permission mask, department), as permissions.current_grant returns
+        self.grant = (self.id, permissions.mask_for_role(self.role), self.department)
+
+
+class TokenAuth:
+    """Token settings and denylist of one app, in ``app.extensions['token_auth']``."""
+
+    def __init__(self, app):
+        self.enabled = app.config.get("TOKEN_AUTH_ENABLED", TOKEN_AUTH_ENABLED)
+        self.access_ttl = app.config.get("TOKEN_ACCESS_TTL", TOKEN_ACCESS_TTL)
+        self.refresh_ttl = app.config.get("TOKEN_REFRESH_TTL", TOKEN_REFRESH_TTL)
+        secret = app.config.get("TOKEN_SECRET") or TOKEN_SECRET or app.config['SECRET_KEY']
+        # A key of its own, so a token can never pass for a session cookie or back
+        self.key = hmac.new(secret.encode(), b'tokens', hashlib.sha256).digest()
+        self.denylist = DenyList()
+
+    def _after_fork(self):
+        self.denylist._init_locks()
+
+    def sign(self, claims):
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+        signature = _b64encode(hmac.new(self.key, payload, hashlib.sha256).digest())
+        return (payload + b'.' + signature).decode('ascii')
+
+    def verify(self, token, kind='access'):
+        """Claims of a valid, unexpired, unrevoked ``kind`` token, else InvalidToken."""
+        try:
+            payload, signature = token.encode('ascii').split(b'.')
+        except (UnicodeEncodeError, ValueError):
+            raise InvalidToken("Malformed token") from None
+        expected = _b64encode(hmac.new(self.key, payload, hashlib.sha256).digest())
+        if not hmac.compare_digest(signature, expected):
+            raise InvalidToken("Invalid token signature")
+        claims = json.loads(_b64decode(payload))
+        if claims.get('typ') != kind:
+            raise InvalidToken(f"Expected a {kind} token")
+        if claims['exp'] <= time.time():
+            raise InvalidToken("Token expired")
+        if self.denylist.is_revoked(claims['jti']):
+            raise InvalidToken("Token revoked")
+        return claims
+
+    def issue(self, user_id):
+        """A new access and refresh token pair for ``user_id``."""
+        if db.session.get(User, user_id) is None:
+            raise InvalidToken("User no longer exists")
+        return self.pair(user_id)
+
+    def pair(self, user_id):
+        """Sign a token pair for ``user_id``, which the caller has found to exist."""
+        now = int(time.time())
+        access = self.sign({
+            'typ': 'access', 'sub': user_id,
+            'jti': secrets.token_hex(16), 'iat': now, 'exp': now + self.access_ttl,
+        })
+        refresh = self.sign({
+            'typ': 'refresh', 'sub': user_id,
+            'jti': secrets.token_hex(16), 'iat': now, 'exp': now + self.refresh_ttl,
+        })
+        return {
+            'access_token': access,
+            'refresh_token': refresh,
+            'token_type': 'Bearer',
+            'expires_in': self.access_ttl,
+        }
+
+    def revoke(self, claims):
+        return self.denylist.revoke(claims['jti'], claims['sub'], datetime.utcfromtimestamp(claims['exp']))
+
+    def refresh(self, token):
+        claims = self.verify(token, 'refresh')
+        if not self.revoke(claims):
+            raise InvalidToken("Refresh token already used")
+        return self.issue(claims['sub'])
+
+    def load_user(self, request):
+        """Flask-Login request loader. Rejects requests with a bad bearer token outright."""
+        authorization = request.authorization
+        if not self.enabled or authorization is None or authorization.type != 'bearer':
+            return None
+        try:
+            claims = self.verify(authorization.token or '')
+            entry = user_directory.get(claims['sub'])
+            if entry is None:
+                raise InvalidToken("User no longer exists")
+        except InvalidToken as e:
+            abort(make_response(
+                {"error": str(e)}, 401, {'WWW-Authenticate': f'Bearer error="invalid_token", error_description="{e}"'}
+            ))
+        return TokenUser(claims, entry)
+
+    def stats(self):
+        return {'enabled': self.enabled, 'denylist': self.denylist.stats()}
+
+
+token_auth = AppExtension('token_auth', TokenAuth, after_fork='_after_fork')
+
+
+tokens_cli = AppGroup('tokens', help="Maintain the token denylist.")
+
+
+@tokens_cli.command('purge')
+def purge_command():
+    """Delete denylist entries for tokens that have expired anyway."""
+    table = RevokedToken.__table__
+    with db.engine.begin() as connection:
+        deleted = connection.execute(delete(table).where(table.c.expires_at <= datetime.utcnow())).rowcount
+    click.echo(f"Purged {deleted} expired entries")
+
+
+@tokens_cli.command('stats')
+def stats_command():
+    """Show how many tokens are denylisted."""
+    table = RevokedToken.__table__
+    now = datetime.utcnow()
+    total, live = db.session.execute(
+        select(func.count(), func.count().filter(table.c.expires_at > now)).select_from(table)
+    ).one()
+    click.echo(f"{total} denylisted, {live} not yet expired")